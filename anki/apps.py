@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+
+
+class AnkiConfig(AppConfig):
+    name = 'anki'
+    verbose_name = 'Настройки проекта'
+
+    def ready(self):
+        """
+        Подключение настроек соединений с SQLite (anki/db.py) для всех приложений проекта
+        """
+        import anki.db
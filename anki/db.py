@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+# Настройка соединений с SQLite.
+# При открытии каждого соединения выполняются PRAGMA из settings.SQLITE_PRAGMAS:
+# WAL позволяет читать во время записи, synchronous=NORMAL в режиме WAL не теряет согласованность,
+# mmap_size и cache_size уменьшают количество системных вызовов чтения, busy_timeout заставляет
+# ждать освобождения блокировки вместо ошибки "database is locked".
+# Вместе с CONN_MAX_AGE соединение и его настройки переиспользуются между запросами.
+
+
+def apply_sqlite_pragmas(connection, pragmas):
+    """
+    Выполняет PRAGMA для соединения SQLite
+    :param connection: соединение Django (DatabaseWrapper)
+    :param pragmas: словарь {имя PRAGMA: значение}
+    """
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+@receiver(connection_created, dispatch_uid='anki_sqlite_pragmas')
+def configure_sqlite_connection(sender, connection, **kwargs):
+    if connection.vendor == 'sqlite':
+        apply_sqlite_pragmas(connection, getattr(settings, 'SQLITE_PRAGMAS', {}))
@@ -0,0 +1,124 @@
+import random
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+# Маршрутизация чтения на реплики базы данных.
+# Чтение идет на реплику только внутри представлений, помеченных декоратором replica_reads
+# (каталог, карточки по тегу, детальная страница, карточки пользователя), и только для моделей
+# приложений из REPLICA_APPS - сессии и пользователи всегда читаются с основной базы.
+# Запись всегда идет на основную базу. После записи чтение в том же запросе идет с основной базы,
+# а после POST-запроса посетитель "прилипает" к основной базе на REPLICA_STICKY_SECONDS секунд
+# (cookie ставит PrimaryStickinessMiddleware), чтобы видеть свои изменения, пока реплика не догнала основную.
+
+REPLICA_APPS = {'cards'}
+STICKY_COOKIE = 'primary_until'
+
+# разрешено ли читать с реплики в текущем запросе
+_replica_reads = ContextVar('replica_reads', default=False)
+# была ли запись в текущем запросе (или действует окно после записи посетителя)
+_pinned_to_primary = ContextVar('pinned_to_primary', default=False)
+
+
+def get_replicas():
+    return list(getattr(settings, 'DATABASE_REPLICAS', ()))
+
+
+def is_pinned_to_primary(request) -> bool:
+    """
+    Действует ли для посетителя окно чтения с основной базы после его изменяющего запроса
+    """
+    sticky_until = request.COOKIES.get(STICKY_COOKIE, '')
+    return sticky_until.isdigit() and int(sticky_until) > time.time()
+
+
+def replica_reads(view):
+    """
+    Декоратор представления: разрешает читать данные карточек с реплики.
+    Для асинхронных представлений контекст передается и в потоки асинхронного ORM
+    """
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            token = _replica_reads.set(True)
+            pinned_token = _pinned_to_primary.set(is_pinned_to_primary(request))
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                _pinned_to_primary.reset(pinned_token)
+                _replica_reads.reset(token)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        token = _replica_reads.set(True)
+        pinned_token = _pinned_to_primary.set(is_pinned_to_primary(request))
+        try:
+            response = view(request, *args, **kwargs)
+            if hasattr(response, 'render') and callable(response.render) and not response.is_rendered:
+                # шаблон TemplateResponse выполняет запросы при рендеринге, который происходит после возврата
+                response.render()
+            return response
+        finally:
+            _pinned_to_primary.reset(pinned_token)
+            _replica_reads.reset(token)
+    return wrapper
+
+
+class ReplicaRouter:
+    """
+    Роутер баз данных: запись - в основную базу, чтение в помеченных представлениях - со случайной реплики
+    """
+
+    def db_for_read(self, model, **hints):
+        if (not _replica_reads.get() or _pinned_to_primary.get()
+                or model._meta.app_label not in REPLICA_APPS):
+            return DEFAULT_DB_ALIAS
+        replicas = get_replicas()
+        return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # после записи в этом запросе читаем с основной базы
+        _pinned_to_primary.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # реплики - копии основной базы, связи между объектами из разных псевдонимов допустимы
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # схема реплики копируется вместе с данными командой sync_replica
+        return db not in get_replicas()
+
+
+class PrimaryStickinessMiddleware:
+    """
+    Middleware закрепляет чтение за основной базой на время после изменяющих запросов посетителя
+    (ставит cookie, которую проверяет декоратор replica_reads). Работает и под WSGI, и под ASGI
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.process_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.process_response(request, await self.get_response(request))
+
+    def process_response(self, request, response):
+        window = getattr(settings, 'REPLICA_STICKY_SECONDS', 0)
+        if window and get_replicas() and request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            response.set_cookie(STICKY_COOKIE, str(int(time.time() + window)), max_age=window,
+                                httponly=True, samesite='Lax')
+        return response
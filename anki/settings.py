@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
 import os
+import sys
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -52,21 +53,31 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django_extensions',
-    'debug_toolbar',
+    # настройки соединений с SQLite (anki/apps.py)
+    'anki',
     'cards',
     'users',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'anki.routers.PrimaryStickinessMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
 ]
+# запуск тестов (manage.py test): тесты выполняются с DEBUG=False, панель отладки в них не нужна
+TESTING = sys.argv[1:2] == ['test']
+
+# панель отладки подключается только при DEBUG: ее middleware только синхронное (под ASGI асинхронные
+# представления выполнялись бы в потоке) и на каждый запрос определяет IP docker-хоста через DNS.
+# В тестах панель не подключается, как рекомендует документация django-debug-toolbar
+if DEBUG and not TESTING:
+    INSTALLED_APPS.append('debug_toolbar')
+    MIDDLEWARE.append('debug_toolbar.middleware.DebugToolbarMiddleware')
 
 ROOT_URLCONF = 'anki.urls'
 
@@ -97,7 +108,37 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # соединение переиспользуется между запросами (секунды), перед запросом проверяется его исправность
+        'CONN_MAX_AGE': int(os.getenv('CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # сколько секунд ждать блокировку на запись вместо ошибки "database is locked"
+            'timeout': 20,
+        },
+    }
+}
+
+# Реплика для чтения каталога (anki/routers.py): путь к копии базы в REPLICA_DATABASE,
+# копия обновляется командой sync_replica. В тестах реплика совпадает с основной базой (MIRROR)
+if os.getenv('REPLICA_DATABASE'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.getenv('REPLICA_DATABASE'),
+        'TEST': {'MIRROR': 'default'},
     }
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['anki.routers.ReplicaRouter']
+# сколько секунд после изменяющего запроса посетитель читает с основной базы (чтобы видеть свои изменения)
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', 10))
+
+# PRAGMA, выполняемые для каждого нового соединения с SQLite (anki/db.py)
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 20000,  # миллисекунды
+    'mmap_size': 128 * 1024 * 1024,  # байты
+    'cache_size': -20000,  # отрицательное значение - размер в килобайтах
+    'temp_store': 'MEMORY',
 }
 
 # Password validation
@@ -139,13 +180,53 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-CACHES = {
-    'default': {
+# Бэкенд кеша выбирается переменной окружения CACHE_BACKEND, адрес/путь - CACHE_LOCATION.
+# locmem - кеш в памяти процесса (у каждого воркера gunicorn свой), подходит для разработки;
+# sqlite - общий кеш воркеров в файле SQLite без внешних сервисов (anki/cache_backends.py);
+# file - файловый кеш Django (общий, но incr в нем не атомарный);
+# redis и memcached - внешние серверы (нужны пакеты redis или pymemcache);
+# dummy - без кеширования (для замеров производительности самих представлений)
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'locmem')
+CACHE_BACKENDS = {
+    'locmem': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
         'LOCATION': 'unique-snowflake',
+    },
+    'sqlite': {
+        'BACKEND': 'anki.cache_backends.SQLiteCache',
+        'LOCATION': str(BASE_DIR / 'cache.sqlite3'),
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': str(BASE_DIR / 'django_cache'),
+    },
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': 'redis://127.0.0.1:6379/1',
+    },
+    'memcached': {
+        'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+        'LOCATION': '127.0.0.1:11211',
+    },
+    'dummy': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    },
+}
+CACHES = {
+    'default': {
+        **CACHE_BACKENDS[CACHE_BACKEND],
+        **({'LOCATION': os.getenv('CACHE_LOCATION')} if os.getenv('CACHE_LOCATION') else {}),
     }
 }
 
+# интервал (в секундах) записи накопленных просмотров карточек в БД, 0 - записывать каждый просмотр сразу
+# (в тестах просмотры записываются сразу, чтобы в буфере не оставалось просмотров для удаленной тестовой базы)
+CARD_VIEWS_FLUSH_INTERVAL = 0 if TESTING else int(os.getenv('CARD_VIEWS_FLUSH_INTERVAL', 10))
+
+# каталог файлов снимков колод для офлайн-повторения (cards/snapshots.py)
+SNAPSHOTS_ROOT = os.getenv('SNAPSHOTS_ROOT', str(BASE_DIR / 'snapshots'))
+
 # путь к авторизации пользователя
 LOGIN_URL = 'users:login'
 
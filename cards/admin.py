@@ -1,6 +1,47 @@
-from django.contrib import admin
-from .models import Card
-from django.contrib.admin import SimpleListFilter
+import io
+from datetime import timedelta
+
+from django.contrib import admin, messages
+from django.contrib.admin import SimpleListFilter, helpers
+from django.core.cache import cache
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils import timezone
+
+from . import counters
+from .exporters import CONTENT_TYPES, export_deck
+from .forms import CardExportForm, CardImportForm, CardRecategorizeForm, CardRetagForm
+from .importers import CardImporter, detect_format, parse_deck
+from .models import Card, CardTag, Tag
+from .page_cache import bump_catalog_version, get_catalog_version
+from .pagination import CachedCountPaginator
+from .rendering import content_hash
+from .search import filter_matching, index_cards
+from .views import get_category_counts
+
+# время кеширования количества карточек в отфильтрованном списке админ-панели
+CHANGELIST_COUNT_TIMEOUT = 60
+
+
+def estimate_changelist_count(queryset):
+    """
+    Функция возвращает количество карточек для постраничной навигации админ-панели без COUNT(*) на каждой странице:
+    весь список - из счетчика карточек меню, отфильтрованный - из кеша по версии каталога
+    """
+    if not queryset.query.where:
+        return counters.get_count(counters.CARDS_COUNT_KEY)
+    if queryset.query.is_empty():
+        # QuerySet.none() (например, поиск без слов) - SQL у такого запроса нет
+        return 0
+    key = f'admin_card_count:{get_catalog_version()}:{content_hash(str(queryset.query))}'
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, timeout=CHANGELIST_COUNT_TIMEOUT)
+    return count
 
 
 class CardCodeFilter(SimpleListFilter):
@@ -14,10 +55,49 @@ class CardCodeFilter(SimpleListFilter):
         )
 
     def queryset(self, request, queryset):
+        # признак кода вычисляется при сохранении карточки (Card.has_code), текст ответа не просматривается
         if self.value() == 'yes':
-            return queryset.filter(answer__contains='```')
+            return queryset.filter(has_code=True)
         elif self.value() == 'no':
-            return queryset.exclude(answer__contains='```')
+            return queryset.filter(has_code=False)
+
+
+class CardCategoryFilter(SimpleListFilter):
+    title = 'Категория'
+    parameter_name = 'category'
+
+    def lookups(self, request, model_admin):
+        # список категорий с количеством карточек берется из кеша каталога, а не запросом по таблице категорий
+        return [(str(category['id']), f'{category["name"]} ({category["cards_count"]})')
+                for category in get_category_counts()]
+
+    def queryset(self, request, queryset):
+        if self.value() and self.value().isdigit():
+            return queryset.filter(category_id=self.value())
+
+
+class CardUploadDateFilter(SimpleListFilter):
+    """
+    Фильтр по дате публикации с постоянным набором периодов: условие по индексу на upload_date,
+    без запросов для построения списка дат
+    """
+    title = 'Дата публикации'
+    parameter_name = 'uploaded'
+    # период: количество дней до сегодняшнего включительно
+    PERIODS = {
+        'today': ('Сегодня', 0),
+        'week': ('Последние 7 дней', 6),
+        'month': ('Последние 30 дней', 29),
+        'year': ('Последний год', 364),
+    }
+
+    def lookups(self, request, model_admin):
+        return [(key, label) for key, (label, days) in self.PERIODS.items()]
+
+    def queryset(self, request, queryset):
+        if self.value() in self.PERIODS:
+            start = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+            return queryset.filter(upload_date__gte=start - timedelta(days=self.PERIODS[self.value()][1]))
 
 
 @admin.register(Card)
@@ -29,19 +109,88 @@ class CardAdmin(admin.ModelAdmin):
     # Поля по которым будет поиск
     search_fields = ('question', 'answer')
     # Поля по которым будет фильтрация
-    list_filter = ('category', 'upload_date', 'status', CardCodeFilter)
+    # (категории - из закешированного списка, даты - постоянные периоды: без запросов к БД для построения фильтров)
+    list_filter = (CardCategoryFilter, CardUploadDateFilter, 'status', CardCodeFilter)
     # Ordering - сортировка
     ordering = ('-upload_date',)
     # List_per_page - количество элементов на странице
     list_per_page = 10
-    # Поля, которые можно редактировать
-    list_editable = ('views', 'question', 'status')
-    actions = ['set_checked', 'set_unchecked']
+    # Поля, которые можно редактировать (вопрос и счетчик просмотров редактируются на странице карточки:
+    # каждое редактируемое поле - это поле формы для каждой строки списка)
+    list_editable = ('status',)
+    # категория загружается в том же запросе, что и карточки
+    list_select_related = ('category',)
+    # без второго COUNT(*) по всей таблице при фильтрации списка
+    show_full_result_count = False
+    actions = ['set_checked', 'set_unchecked', 'recategorize', 'retag', 'export']
     fields = ['question', 'answer', 'category', 'status']
+    # шаблон списка с кнопкой импорта колоды
+    change_list_template = 'admin/cards/card/change_list.html'
+
+    def get_queryset(self, request):
+        """
+        Метод возвращает карточки без полного текста ответа и его HTML: в списке они не показываются
+        """
+        return super().get_queryset(request).defer('answer', 'answer_html', 'answer_preview_html')
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        return CachedCountPaginator(queryset, per_page, count_func=lambda: estimate_changelist_count(queryset),
+                                    orphans=orphans, allow_empty_first_page=allow_empty_first_page)
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Метод ищет карточки по полнотекстовому индексу (cards/search.py) вместо LIKE по тексту вопроса и ответа
+        """
+        if not search_term.strip():
+            return queryset, False
+        return filter_matching(queryset, search_term), False
+
+    def get_urls(self):
+        urls = [
+            path('import/', self.admin_site.admin_view(self.import_cards), name='cards_card_import'),
+        ]
+        return urls + super().get_urls()
+
+    def import_cards(self, request):
+        """
+        Страница загрузки колоды карточек (пакетный импорт через CardImporter)
+        """
+        if not self.has_add_permission(request):
+            return redirect('admin:cards_card_changelist')
 
-    @admin.display(description='Наличие кода', ordering='answer')
+        form = CardImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            upload = form.cleaned_data['file']
+            category = form.cleaned_data['category']
+            try:
+                file_format = form.cleaned_data['file_format'] or detect_format(upload.name)
+                importer = CardImporter(batch_size=form.cleaned_data['batch_size'],
+                                        default_category=category.name if category else None,
+                                        author=request.user, render=form.cleaned_data['render'])
+                stream = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+                result = importer.run(parse_deck(stream, file_format))
+            except ValueError as error:
+                form.add_error('file', f'Ошибка разбора файла: {error}')
+            else:
+                self.message_user(request, f'Импортировано карточек: {result.cards}, '
+                                           f'пропущено строк: {result.skipped} '
+                                           f'({result.rows_per_second:.0f} строк/с)', messages.SUCCESS)
+                if result.errors:
+                    self.message_user(request, 'Пропущенные строки: ' + '; '.join(
+                        f'{row_number} - {reason}' for row_number, reason in result.errors), messages.WARNING)
+                return redirect('admin:cards_card_changelist')
+
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Импорт колоды карточек',
+            'form': form,
+        }
+        return TemplateResponse(request, 'admin/cards/card/import_cards.html', context)
+
+    @admin.display(description='Наличие кода', ordering='has_code')
     def brief_info(self, card):
-        has_code = 'Да' if '```' in card.answer else 'Нет'
+        has_code = 'Да' if card.has_code else 'Нет'
         return f'{has_code}'
 
     # методы для админпанели, чтобы определять статус карточки
@@ -54,4 +203,72 @@ class CardAdmin(admin.ModelAdmin):
     def set_unchecked(self, request, queryset):
         update_count = queryset.update(status=Card.Status.UNCHECKED)
         self.message_user(request, f'{update_count} записей было помечено как непроверенное', 'warning')
-    #
+
+    # Массовые действия со страницей выбора параметров. Изменения выполняются запросами по всему набору
+    # выбранных карточек (UPDATE, INSERT и DELETE по QuerySet), без загрузки и сохранения каждой карточки
+
+    def bulk_action_page(self, request, queryset, form, title, action):
+        """
+        Страница параметров массового действия: форма отправляется обратно в список карточек
+        с теми же выбранными карточками и фильтрами
+        """
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': title,
+            'form': form,
+            'action': action,
+            'selected': request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+            'select_across': request.POST.get('select_across', '0'),
+            'action_checkbox_name': helpers.ACTION_CHECKBOX_NAME,
+        }
+        return TemplateResponse(request, 'admin/cards/card/bulk_action.html', context)
+
+    @admin.action(description='Перенести выбранные карточки в другую категорию')
+    def recategorize(self, request, queryset):
+        form = CardRecategorizeForm(request.POST if 'apply' in request.POST else None)
+        if not form.is_valid():
+            return self.bulk_action_page(request, queryset, form, 'Перенос карточек в категорию', 'recategorize')
+        category = form.cleaned_data['category']
+        with transaction.atomic():
+            # дата изменения - версия закешированных фрагментов карточек (название категории есть в карточке)
+            update_count = queryset.update(category=category, updated_at=timezone.now())
+            bump_catalog_version()
+        self.message_user(request, f'{update_count} карточек перенесено в категорию {category}', messages.SUCCESS)
+
+    @admin.action(description='Добавить или убрать теги у выбранных карточек')
+    def retag(self, request, queryset):
+        form = CardRetagForm(request.POST if 'apply' in request.POST else None)
+        if not form.is_valid():
+            return self.bulk_action_page(request, queryset, form, 'Изменение тегов карточек', 'retag')
+        names = form.cleaned_data['tags']
+        with transaction.atomic():
+            card_ids = list(queryset.values_list('pk', flat=True))
+            if form.cleaned_data['mode'] == 'add':
+                # недостающие теги и связи создаются пакетными вставками, существующие пропускаются
+                Tag.objects.bulk_create([Tag(name=name) for name in names], ignore_conflicts=True)
+                tag_ids = list(Tag.objects.filter(name__in=names).values_list('pk', flat=True))
+                CardTag.objects.bulk_create([CardTag(card_id=card_id, tag_id=tag_id)
+                                             for card_id in card_ids for tag_id in tag_ids],
+                                            ignore_conflicts=True, batch_size=1000)
+            else:
+                tag_ids = list(Tag.objects.filter(name__in=names).values_list('pk', flat=True))
+                CardTag.objects.filter(card__in=queryset.values('pk'), tag_id__in=tag_ids).delete()
+            # пакетные вставки и удаление по QuerySet не отправляют сигналы: индекс, дату изменения карточек,
+            # количество карточек у тегов и версию каталога обновляем сами
+            index_cards(card_ids)
+            queryset.update(updated_at=timezone.now())
+            Tag.objects.filter(pk__in=tag_ids).refresh_counts()
+            bump_catalog_version()
+        self.message_user(request, f'Теги изменены у {len(card_ids)} карточек', messages.SUCCESS)
+
+    @admin.action(description='Выгрузить выбранные карточки')
+    def export(self, request, queryset):
+        form = CardExportForm(request.POST if 'apply' in request.POST else None)
+        if not form.is_valid():
+            return self.bulk_action_page(request, queryset, form, 'Выгрузка карточек', 'export')
+        file_format = form.cleaned_data['file_format']
+        # колода отдается потоком (cards/exporters.py), карточки читаются из БД порциями
+        response = StreamingHttpResponse(export_deck(queryset, file_format), content_type=CONTENT_TYPES[file_format])
+        response['Content-Disposition'] = f'attachment; filename="cards_admin.{file_format}"'
+        return response
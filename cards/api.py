@@ -0,0 +1,325 @@
+import re
+
+from django.core.paginator import InvalidPage
+from django.db.models import Count, Max, Sum
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.views.decorators.http import condition, require_safe
+
+from anki.routers import replica_reads
+
+from . import sorting
+from .models import Card, Category, DeckSnapshot, Tag
+from .pagination import paginate_keyset
+from .rendering import content_hash
+from .search import filter_matching
+from .snapshots import latest_snapshot, snapshot_delta, snapshots_root
+from .views import CardCatalogView, catalog_cache_params, get_category_counts
+
+# JSON API только для чтения: список карточек (те же параметры sort, order, search_query, page, pagination=cursor,
+# что и у каталога), карточка, теги и категории.
+# Каждый ответ содержит ETag, и повторный запрос с If-None-Match получает 304 Not Modified:
+# - для списка карточек ETag строится по самим данным: одним агрегирующим запросом по найденным карточкам
+#   (количество, последняя дата изменения, суммы просмотров и избранного) и значимым параметрам запроса.
+#   Переименование категории или тега и изменение тегов карточки меняют дату изменения карточек (cards/signals.py),
+#   поэтому ETag не зависит от версии каталога в кеше и одинаков во всех воркерах. Суммы счетчиков
+#   не различают встречные изменения у разных карточек, поэтому ETag списков слабый (W/);
+# - для списка тегов ETag - хеш самой страницы тегов (один запрос по индексу (CardsCount, TagID)),
+#   для списка категорий - хеш категорий и состояния всех карточек;
+# - для карточки ETag строится только по дате изменения и счетчикам самой карточки (один запрос по первичному ключу).
+# Ответ 304 отдается до выполнения представления, поэтому опрос без изменений стоит одного запроса.
+
+# наибольшее количество тегов на странице списка тегов
+TAGS_PAGE_SIZE = 100
+# один диапазон байтов заголовка Range: "bytes=100-199", "bytes=100-" или "bytes=-100"
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def card_to_dict(card):
+    """
+    Краткое представление карточки для списков. Категория, автор и теги должны быть загружены заранее
+    (CardQuerySet.for_listing), чтобы не выполнять запросы на каждую карточку
+    """
+    return {
+        'id': card.pk,
+        'question': card.question,
+        'answer_preview_html': card.get_answer_preview_html(),
+        'category': {'id': card.category.pk, 'name': card.category.name, 'slug': card.category.slug},
+        'tags': [tag.name for tag in card.tags.all()],
+        'author': card.author.username if card.author else None,
+        'status': card.status,
+        'views': card.views,
+        'adds': card.adds,
+        'upload_date': card.upload_date.isoformat(),
+        'updated_at': card.updated_at.isoformat(),
+        'url': card.get_absolute_url(),
+    }
+
+
+def card_detail_to_dict(card):
+    """
+    Полное представление карточки: краткое и полный ответ в Markdown и HTML
+    """
+    return {
+        **card_to_dict(card),
+        'answer': card.answer,
+        'answer_html': card.get_answer_html(),
+    }
+
+
+def cards_state(queryset):
+    """
+    Состояние выборки карточек одним запросом: количество, последняя дата изменения и суммы счетчиков.
+    Добавление и удаление карточки меняет количество, изменение - дату, просмотр и избранное - суммы
+    :param queryset: карточки
+    :return: кортеж значений
+    """
+    state = queryset.order_by().aggregate(count=Count('pk'), updated_at=Max('updated_at'),
+                                          views=Sum('views'), adds=Sum('adds'))
+    return tuple(state.values())
+
+
+def list_etag(name, *data):
+    """
+    Слабый ETag списка по его данным
+    """
+    return f'W/"{content_hash(repr((name, *data)))}"'
+
+
+def card_list_etag(request):
+    search_query = request.GET.get('search_query', '')
+    cards = Card.objects.all()
+    if search_query:
+        cards = filter_matching(cards, search_query)
+    return list_etag('cards', cards_state(cards), catalog_cache_params(request))
+
+
+def card_etag(request, pk):
+    row = Card.objects.filter(pk=pk).values_list('updated_at', 'views', 'adds').first()
+    # для несуществующей карточки ETag нет, представление вернет 404
+    return content_hash(repr((pk, *row))) if row else None
+
+
+def get_page_number(request):
+    try:
+        return int(request.GET.get('page') or 1)
+    except ValueError:
+        raise Http404('Некорректный номер страницы')
+
+
+def get_tags_page(number):
+    """
+    Страница тегов по убыванию количества карточек (индекс (CardsCount, TagID))
+    :param number: номер страницы
+    :return: до TAGS_PAGE_SIZE + 1 тегов (лишний тег показывает, что есть следующая страница)
+    """
+    start = (number - 1) * TAGS_PAGE_SIZE
+    if start < 0:
+        raise Http404('Страница не найдена')
+    return list(Tag.objects.filter(cards_count__gt=0).order_by('-cards_count', '-id')
+                .values('id', 'name', 'cards_count')[start:start + TAGS_PAGE_SIZE + 1])
+
+
+def tag_list_etag(request):
+    return list_etag('tags', get_tags_page(get_page_number(request)))
+
+
+def category_list_etag(request):
+    # пустые категории тоже входят в список, поэтому кроме карточек учитываются сами категории
+    categories = list(Category.objects.order_by('pk').values_list('pk', 'name', 'slug'))
+    return list_etag('categories', categories, cards_state(Card.objects.all()))
+
+
+class ApiCardCatalogView(CardCatalogView):
+    """
+    Каталог для API: те же поиск, сортировки и навигация, но без признака избранного -
+    ответ не зависит от пользователя, и ETag списка общий для всех клиентов
+    """
+
+    def get_base_queryset(self):
+        return Card.objects.for_listing()
+
+
+@replica_reads
+@require_safe
+@condition(etag_func=card_list_etag)
+def card_list(request):
+    """
+    Список карточек каталога постранично (page) или по курсору (pagination=cursor)
+    """
+    view = ApiCardCatalogView()
+    view.setup(request)
+    queryset = view.get_queryset()
+    data = view.get_listing_context()
+    del data['sort_options']
+
+    if view.use_cursor_pagination():
+        page = paginate_keyset(queryset, sorting.sort_field(view.get_sort()), view.get_order() != 'asc',
+                               request.GET.get('cursor', ''), view.paginate_by)
+        data.update({'next_cursor': page.next_cursor, 'previous_cursor': page.previous_cursor})
+    else:
+        paginator = view.get_paginator(queryset, view.paginate_by)
+        try:
+            page = paginator.page(get_page_number(request))
+        except InvalidPage:
+            raise Http404('Страница не найдена')
+        data.update({'count': paginator.count, 'page': page.number, 'num_pages': paginator.num_pages})
+    data['results'] = [card_to_dict(card) for card in page.object_list]
+    return JsonResponse(data)
+
+
+@replica_reads
+@require_safe
+@condition(etag_func=card_etag)
+def card_detail(request, pk):
+    """
+    Карточка с полным ответом. Просмотр через API не учитывается в счетчике просмотров
+    """
+    card = get_object_or_404(Card.objects.select_related('category', 'author').prefetch_related('tags'), pk=pk)
+    return JsonResponse(card_detail_to_dict(card))
+
+
+@replica_reads
+@require_safe
+@condition(etag_func=tag_list_etag)
+def tag_list(request):
+    """
+    Теги по убыванию количества карточек (индекс (CardsCount, TagID)), по TAGS_PAGE_SIZE на странице
+    """
+    number = get_page_number(request)
+    tags = get_tags_page(number)
+    return JsonResponse({'page': number, 'has_next': len(tags) > TAGS_PAGE_SIZE, 'results': tags[:TAGS_PAGE_SIZE]})
+
+
+@replica_reads
+@require_safe
+@condition(etag_func=category_list_etag)
+def category_list(request):
+    """
+    Категории с количеством карточек (тот же закешированный список, что и на странице категорий)
+    """
+    return JsonResponse({'results': get_category_counts()})
+
+
+# Снимки колод для офлайн-повторения (cards/snapshots.py): последний снимок - файлом с поддержкой Range
+# (докачка), изменения от версии клиента - в JSON
+
+def get_deck(kind, key):
+    """
+    Колода по адресу: категория по slug (kind='categories') или тег по id (kind='tags')
+    """
+    if kind == 'categories':
+        return get_object_or_404(Category, slug=key)
+    if kind == 'tags' and key.isdigit():
+        return get_object_or_404(Tag, pk=key)
+    raise Http404('Колода не найдена')
+
+
+def get_latest_snapshot(kind, key):
+    snapshot = latest_snapshot(get_deck(kind, key))
+    if snapshot is None:
+        raise Http404('Снимок колоды еще не собран')
+    return snapshot
+
+
+def parse_range(header, size):
+    """
+    Функция разбирает заголовок Range с одним диапазоном байтов
+    :param header: значение заголовка
+    :param size: размер файла
+    :return: (начало, конец включительно), None - заголовок не поддерживается (отдается весь файл)
+    :raises ValueError: диапазон за пределами файла
+    """
+    match = RANGE_RE.match(header.replace(' ', ''))
+    if not match or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if not start:
+        # последние N байтов
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start, end = int(start), min(int(end), size - 1) if end else size - 1
+    if start > end or start >= size:
+        raise ValueError('Диапазон за пределами файла')
+    return start, end
+
+
+class FileRange:
+    """
+    Часть файла для FileResponse: чтение ограничено length байтами от текущей позиции
+    """
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        size = self.remaining if size < 0 else min(size, self.remaining)
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+@replica_reads
+@require_safe
+def deck_snapshot(request, kind, key):
+    """
+    Последний снимок колоды (gzip JSON). ETag - контрольная сумма файла, поддерживаются If-None-Match (304)
+    и докачка по заголовку Range (206) с проверкой If-Range
+    """
+    snapshot = get_latest_snapshot(kind, key)
+    etag = f'"{snapshot.sha1}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        return response
+    try:
+        file = open(snapshots_root() / snapshot.file_name, 'rb')
+    except FileNotFoundError:
+        raise Http404('Файл снимка не найден')
+
+    byte_range = None
+    if 'Range' in request.headers and request.headers.get('If-Range', etag) == etag:
+        try:
+            byte_range = parse_range(request.headers['Range'], snapshot.size)
+        except ValueError:
+            file.close()
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{snapshot.size}'
+            return response
+
+    if byte_range is None:
+        response = FileResponse(file, filename=snapshot.file_name)
+    else:
+        start, end = byte_range
+        file.seek(start)
+        response = FileResponse(FileRange(file, end - start + 1), status=206, filename=snapshot.file_name)
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{snapshot.size}'
+    response['ETag'] = etag
+    response['Accept-Ranges'] = 'bytes'
+    response['X-Snapshot-Version'] = snapshot.pk
+    return response
+
+
+@replica_reads
+@require_safe
+def deck_snapshot_delta(request, kind, key):
+    """
+    Изменения колоды от версии клиента (GET-параметр since) до последнего снимка.
+    Если версия клиента уже удалена (хранятся SNAPSHOT_KEEP последних), ответ 410 - нужно скачать снимок целиком
+    """
+    latest = get_latest_snapshot(kind, key)
+    since = request.GET.get('since', '')
+    base = None
+    if since.isdigit():
+        base = DeckSnapshot.objects.filter(pk=since, kind=latest.kind, object_id=latest.object_id).first()
+    if base is None:
+        return JsonResponse({'error': 'Версия не найдена, скачайте снимок колоды целиком', 'version': latest.pk},
+                            status=410)
+    response = JsonResponse(snapshot_delta(base, latest))
+    response['ETag'] = f'"{base.pk}-{latest.pk}"'
+    return response
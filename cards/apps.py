@@ -6,3 +6,11 @@ class CardsConfig(AppConfig):
     name = 'cards'
     verbose_name = 'Карточка'
     verbose_name_plural = 'Карточки'
+
+    def ready(self):
+        """
+        Подключение обработчиков сигналов приложения (синхронизация поискового индекса)
+        и проверки настроек кеша
+        """
+        import cards.checks
+        import cards.signals
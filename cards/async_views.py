@@ -0,0 +1,182 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.core.paginator import InvalidPage, Page
+from django.db.models import prefetch_related_objects
+from django.http import Http404
+from django.shortcuts import render
+
+from anki.routers import replica_reads
+
+from . import counters, sorting
+from .models import Card, tags_prefetch
+from .pagination import CachedCountPaginator, paginate_keyset
+from .search import CardSearchResults
+from .view_counter import view_counter
+from .views import CardCatalogView, TagCardsView, info
+
+# Асинхронные версии каталога, карточек по тегу и детальной страницы для запуска под ASGI (anki/asgi.py).
+# Запросы выполняются асинхронным ORM (aiterator, acount, aget), независимые запросы - страница карточек,
+# количество и счетчики меню - запускаются одновременно через asyncio.gather.
+# Шаблон рендерится в потоке (sync_to_async): контекстные процессоры user и perms обращаются к БД синхронно.
+# Параметры сортировки и поиска, запросы к БД и шаблоны те же, что у синхронных представлений (cards/views.py).
+# Пользователь (для отметки избранного) загружается из сессии в потоке в начале каждого представления (auser):
+# обращение к ленивому request.user в event loop вызывает SynchronousOnlyOperation.
+
+
+async def fetch_cards(queryset):
+    """
+    Загружает карточки для списка: сами карточки - через aiterator, теги всех карточек - одним запросом
+    (prefetch_related в Django 4.2 с aiterator не работает, поэтому теги загружаются отдельно)
+    """
+    cards = [card async for card in queryset.prefetch_related(None).aiterator()]
+    await sync_to_async(prefetch_related_objects)(cards, tags_prefetch())
+    return cards
+
+
+async def get_menu_counts():
+    """
+    Счетчики карточек и пользователей для меню (см. MenuMixin)
+    """
+    return await asyncio.gather(counters.aget_count(counters.CARDS_COUNT_KEY),
+                                counters.aget_count(counters.USERS_COUNT_KEY))
+
+
+async def auser(request):
+    """
+    Загружает пользователя запроса из сессии (аналог request.auser() из Django 5.0, которого нет в Django 4.2).
+    После загрузки request.user обращается к БД больше не будет - его можно использовать в представлениях
+    и шаблонах
+    :return: пользователь или AnonymousUser
+    """
+    def load():
+        # ленивый объект загружается при первом обращении к атрибуту
+        request.user.is_authenticated
+        return request.user
+    return await sync_to_async(load)()
+
+
+def get_page_number(request):
+    try:
+        return int(request.GET.get('page') or 1)
+    except ValueError:
+        raise Http404('Некорректный номер страницы')
+
+
+@replica_reads
+async def catalog(request):
+    """
+    Асинхронный каталог карточек с теми же параметрами, что и CardCatalogView
+    """
+    # признак избранного в запросе карточек зависит от пользователя (CardCatalogView.get_base_queryset)
+    await auser(request)
+    view = CardCatalogView()
+    view.setup(request)
+    # построение QuerySet не выполняет запросов к БД
+    queryset = view.get_queryset()
+    per_page = view.paginate_by
+    context = view.get_listing_context()
+
+    if context['search_query']:
+        count_task = sync_to_async(view.get_total_count)(queryset)
+    else:
+        # количество карточек каталога - тот же счетчик, что и в меню
+        count_task = counters.aget_count(counters.CARDS_COUNT_KEY)
+
+    if view.use_cursor_pagination():
+        page, total_count, (cards_count, users_count) = await asyncio.gather(
+            sync_to_async(paginate_keyset)(queryset, sorting.sort_field(view.get_sort()), view.get_order() != 'asc',
+                                           request.GET.get('cursor', ''), per_page),
+            count_task, get_menu_counts())
+        paginator = None
+        cards = page.object_list
+    else:
+        number = get_page_number(request)
+        page_slice = slice((number - 1) * per_page, number * per_page)
+        if isinstance(queryset, CardSearchResults):
+            # результаты поиска по релевантности загружаются через поисковый индекс (синхронно)
+            cards_task = sync_to_async(lambda: list(queryset[page_slice]))()
+        else:
+            cards_task = fetch_cards(queryset[page_slice])
+        cards, total_count, (cards_count, users_count) = await asyncio.gather(
+            cards_task, count_task, get_menu_counts())
+
+        paginator = CachedCountPaginator(queryset, per_page, count_func=lambda: total_count)
+        try:
+            number = paginator.validate_number(number)
+        except InvalidPage:
+            raise Http404('Страница не найдена')
+        page = Page(cards, number, paginator)
+        context['page_range'] = paginator.get_elided_page_range(number)
+
+    context.update({
+        'cards': cards,
+        'page_obj': page,
+        'paginator': paginator,
+        'is_paginated': page.has_next() or page.has_previous(),
+        'total_count': total_count,
+        'menu': info['menu'],
+        'cards_count': cards_count,
+        'users_count': users_count,
+    })
+    return await sync_to_async(render)(request, 'cards/catalog.html', context)
+
+
+@replica_reads
+async def cards_by_tag(request, tag_id):
+    """
+    Асинхронная версия TagCardsView для одного тега
+    """
+    await auser(request)
+    view = TagCardsView()
+    view.setup(request, tag_id=tag_id)
+    # тег загружается один раз, дальше get_queryset и get_total_count обходятся без запросов
+    await sync_to_async(lambda: view.tags)()
+    queryset = view.get_queryset()
+    paginator = CachedCountPaginator(queryset, view.paginate_by, count_func=lambda: view.get_total_count(queryset))
+    try:
+        number = paginator.validate_number(get_page_number(request))
+    except InvalidPage:
+        raise Http404('Страница не найдена')
+    page_slice = slice((number - 1) * view.paginate_by, number * view.paginate_by)
+    cards, (cards_count, users_count) = await asyncio.gather(fetch_cards(queryset[page_slice]), get_menu_counts())
+
+    page = Page(cards, number, paginator)
+    context = {
+        **view.get_tags_context(),
+        'cards': cards,
+        'page_obj': page,
+        'paginator': paginator,
+        'is_paginated': page.has_next() or page.has_previous(),
+        'total_count': paginator.count,
+        'page_range': paginator.get_elided_page_range(number),
+        'menu': info['menu'],
+        'cards_count': cards_count,
+        'users_count': users_count,
+    }
+    return await sync_to_async(render)(request, 'cards/tag_cards.html', context)
+
+
+@replica_reads
+async def card_detail(request, pk):
+    """
+    Асинхронная версия CardDetailView: карточка и счетчики меню загружаются одновременно
+    """
+    user = await auser(request)
+    try:
+        card, (cards_count, users_count) = await asyncio.gather(
+            Card.objects.select_related('category', 'author').with_favorites(user).aget(pk=pk),
+            get_menu_counts())
+    except Card.DoesNotExist:
+        raise Http404('Карточка не найдена')
+    # при записи без буфера счетчик выполняет UPDATE, поэтому вызывается в потоке
+    await sync_to_async(view_counter.hit)(card.pk)
+    card.views += view_counter.pending(card.pk)
+    context = {
+        'card': card,
+        'object': card,
+        'menu': info['menu'],
+        'cards_count': cards_count,
+        'users_count': users_count,
+    }
+    return await sync_to_async(render)(request, 'cards/card_detail.html', context)
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+# бэкенды кеша, которые хранят данные в памяти каждого процесса отдельно
+PROCESS_LOCAL_CACHES = ('django.core.cache.backends.locmem.LocMemCache',)
+
+
+@register()
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Версия каталога (cards/page_cache.py) и закешированные страницы должны быть общими для всех воркеров:
+    с кешем в памяти процесса изменение карточки сбрасывает страницы только в одном воркере
+    """
+    # тесты выполняются в одном процессе (и всегда с DEBUG=False)
+    if settings.DEBUG or getattr(settings, 'TESTING', False) or \
+            settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Warning(
+        'Кеш в памяти процесса: версия каталога и кеш страниц не общие для воркеров, '
+        'после изменения карточек другие воркеры отдают устаревшие страницы до PAGE_CACHE_TIMEOUT',
+        hint='Укажите общий кеш: CACHE_BACKEND=sqlite, redis или memcached',
+        id='cards.W001',
+    )]
@@ -0,0 +1,76 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+
+from .models import Card
+
+# Счетчики для меню сайта (количество карточек и пользователей).
+# Значения хранятся в кеше и изменяются атомарными incr/decr из сигналов post_save/post_delete,
+# поэтому в обычном режиме контекст меню не выполняет запросов к БД.
+# Отдельной периодической задачи нет: ключи живут RECONCILE_TIMEOUT секунд, после чего значение пересчитывается
+# COUNT(*) при следующем чтении - так накопившиеся расхождения (массовые операции без сигналов) исправляются
+# не реже раза в час. Чаще сверку выполняет команда reconcile_counters (один раз, через cron или с --interval).
+
+CARDS_COUNT_KEY = 'cards_count'
+USERS_COUNT_KEY = 'users_count'
+RECONCILE_TIMEOUT = 60 * 60
+
+# QuerySet, по которому пересчитывается каждый счетчик
+COUNTERS = {
+    CARDS_COUNT_KEY: lambda: Card.objects.all(),
+    USERS_COUNT_KEY: lambda: get_user_model().objects.all(),
+}
+
+
+def get_count(key):
+    """
+    Возвращает значение счетчика, при отсутствии в кеше считает его по БД
+    :param key: ключ счетчика (CARDS_COUNT_KEY, USERS_COUNT_KEY)
+    """
+    value = cache.get(key)
+    if value is None:
+        value = COUNTERS[key]().count()
+        cache.add(key, value, timeout=RECONCILE_TIMEOUT)
+    return value
+
+
+async def aget_count(key):
+    """
+    Асинхронный вариант get_count для асинхронных представлений (cards/async_views.py)
+    """
+    value = await cache.aget(key)
+    if value is None:
+        value = await COUNTERS[key]().acount()
+        await cache.aadd(key, value, timeout=RECONCILE_TIMEOUT)
+    return value
+
+
+def adjust(key, delta):
+    """
+    Атомарно изменяет счетчик в кеше. Если счетчика в кеше нет, он будет посчитан при следующем чтении
+    :param key: ключ счетчика
+    :param delta: величина изменения (может быть отрицательной)
+    """
+    try:
+        if delta >= 0:
+            cache.incr(key, delta)
+        else:
+            cache.decr(key, -delta)
+    except ValueError:
+        pass
+
+
+def invalidate(key):
+    """
+    Сбрасывает счетчик, при следующем чтении он будет пересчитан
+    """
+    cache.delete(key)
+
+
+def reconcile():
+    """
+    Пересчитывает все счетчики по БД
+    :return: словарь {ключ: значение}
+    """
+    values = {key: queryset().count() for key, queryset in COUNTERS.items()}
+    cache.set_many(values, timeout=RECONCILE_TIMEOUT)
+    return values
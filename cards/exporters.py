@@ -0,0 +1,85 @@
+import csv
+import json
+from collections import defaultdict
+from itertools import islice
+
+from .models import CardTag
+
+# Потоковый экспорт колоды карточек.
+# Карточки читаются из БД порциями через iterator(chunk_size=...), теги каждой порции загружаются
+# одним запросом, а строки файла отдаются генератором - колода целиком в памяти не собирается.
+# Форматы совпадают с форматами импорта (cards/importers.py), экспортированную колоду можно загрузить обратно.
+
+EXPORT_FORMATS = ('jsonl', 'csv', 'tsv')
+CONTENT_TYPES = {
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+    'tsv': 'text/tab-separated-values; charset=utf-8',
+}
+CARD_FIELDS = ('question', 'answer', 'category', 'tags')
+
+
+def iter_cards(queryset, chunk_size=1000):
+    """
+    Генератор словарей карточек {'question', 'answer', 'category', 'tags'}
+    :param queryset: QuerySet карточек для экспорта
+    :param chunk_size: количество карточек, читаемых из БД за один раз
+    """
+    rows = queryset.order_by('pk').values_list('pk', 'question', 'answer', 'category__name').iterator(
+        chunk_size=chunk_size)
+    while chunk := list(islice(rows, chunk_size)):
+        # теги всех карточек порции - одним запросом
+        tags = defaultdict(list)
+        card_tags = (CardTag.objects.using(queryset.db).filter(card_id__in=[row[0] for row in chunk])
+                     .order_by('tag__name').values_list('card_id', 'tag__name'))
+        for card_id, tag_name in card_tags:
+            tags[card_id].append(tag_name)
+
+        for card_id, question, answer, category in chunk:
+            yield {'question': question, 'answer': answer, 'category': category, 'tags': tags[card_id]}
+
+
+class Echo:
+    """
+    Объект с интерфейсом файла для csv.writer: возвращает записанную строку вместо сохранения
+    """
+
+    def write(self, value):
+        return value
+
+
+def render_jsonl(cards):
+    for card in cards:
+        yield json.dumps(card, ensure_ascii=False) + '\n'
+
+
+def render_csv(cards):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CARD_FIELDS)
+    for card in cards:
+        yield writer.writerow([card['question'], card['answer'], card['category'], ','.join(card['tags'])])
+
+
+def render_tsv(cards):
+    # заголовок текстового экспорта Anki
+    yield '#separator:tab\n#html:false\n#tags column:3\n'
+    writer = csv.writer(Echo(), delimiter='\t', lineterminator='\n')
+    for card in cards:
+        yield writer.writerow([card['question'], card['answer'], ' '.join(card['tags'])])
+
+
+RENDERERS = {
+    'jsonl': render_jsonl,
+    'csv': render_csv,
+    'tsv': render_tsv,
+}
+
+
+def export_deck(queryset, file_format, chunk_size=1000):
+    """
+    Генератор строк файла колоды
+    :param queryset: QuerySet карточек для экспорта
+    :param file_format: формат из EXPORT_FORMATS
+    :param chunk_size: количество карточек, читаемых из БД за один раз
+    """
+    return RENDERERS[file_format](iter_cards(queryset, chunk_size))
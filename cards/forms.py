@@ -1,6 +1,9 @@
 from django import forms
-from .models import Category, Card, Tag
+from .importers import FORMATS
+from .models import Category, Card, CardTag, Tag
+from .search import index_cards
 from django.core.exceptions import ValidationError
+from django.db import transaction
 import re
 
 
@@ -52,33 +55,96 @@ class CardForm(forms.ModelForm):
         """
         Метод для валидации и преобразование строки тегов в список тегов
         """
-        tags_str = self.cleaned_data['tags'].lower()
-        tag_list = [tag.strip() for tag in tags_str.split(',') if tag.strip()]
-        return tag_list
+        return parse_tags(self.cleaned_data['tags'])
 
     def save(self, *args, **kwargs):
         """
-        Метод для сохранения и очистки текущих тегов, чтобы не было дублирования тегов
+        Метод для сохранения карточки и синхронизации ее тегов с формой.
+        Теги сравниваются множествами: одна выборка текущих тегов карточки, одна вставка недостающих тегов,
+        одна вставка и одно удаление связей CardTag - независимо от количества тегов, в одной транзакции
         """
-        # Мы получаем экземпляр карточки. Без commit=False карточка сохранится в базу данных
-        # При попытке сохранения, необработанные теги приведут к ошибке
-        # В этом режиме мы получаем только экземпляр карточки.
-        instance = super().save(commit=False)
-        # Сохраняем карточку в базу данных, чтобы у нее появился id (без id мы не сможем добавить теги)
-        instance.save()
-
-        # Функционал для редактирования карточки (старые теги без этого функционала не удаляются, новые теги просто добавляются)
-        current_tags = set(self.cleaned_data['tags'])
-        existing_tags = set(tag.name for tag in instance.tags.all())
-
-        # Удаляем теги, которые были удалены из формы при редактировании
-        for tag in instance.tags.all():
-            if tag.name not in current_tags:
-                instance.tags.remove(tag)
-
-        # Добавляем новые теги внесенные в форму при редактировании
-        for tag_name in current_tags:
-            tag, created = Tag.objects.get_or_create(name=tag_name)
-            instance.tags.add(tag)
+        with transaction.atomic():
+            # Мы получаем экземпляр карточки. Без commit=False карточка сохранится в базу данных
+            # При попытке сохранения, необработанные теги приведут к ошибке
+            # В этом режиме мы получаем только экземпляр карточки.
+            instance = super().save(commit=False)
+            # Сохраняем карточку в базу данных, чтобы у нее появился id (без id мы не сможем добавить теги)
+            instance.save()
+
+            current_tags = set(self.cleaned_data['tags'])
+            # теги, уже привязанные к карточке: {имя: id}
+            existing_tags = dict(CardTag.objects.filter(card=instance).values_list('tag__name', 'tag_id'))
+
+            # Добавляем новые теги внесенные в форму при редактировании
+            added_names = current_tags - existing_tags.keys()
+            added_ids = []
+            if added_names:
+                # недостающие теги создаются одним запросом, уже существующие пропускаются (уникальный Tag.name)
+                Tag.objects.bulk_create([Tag(name=name) for name in added_names], ignore_conflicts=True)
+                added_ids = list(Tag.objects.filter(name__in=added_names).values_list('id', flat=True))
+                CardTag.objects.bulk_create([CardTag(card=instance, tag_id=tag_id) for tag_id in added_ids],
+                                            ignore_conflicts=True)
+
+            # Удаляем теги, которые были удалены из формы при редактировании
+            removed_ids = [tag_id for name, tag_id in existing_tags.items() if name not in current_tags]
+            if removed_ids:
+                CardTag.objects.filter(card=instance, tag_id__in=removed_ids).delete()
+
+            if added_names or removed_ids:
+                # bulk_create и delete по QuerySet не отправляют m2m-сигналы,
+                # обновляем поисковый индекс и количество карточек у тегов сами
+                index_cards([instance.pk])
+                Tag.objects.filter(pk__in=[*added_ids, *removed_ids]).refresh_counts()
 
         return instance
+
+
+class CardImportForm(forms.Form):
+    """
+    Форма загрузки колоды карточек в админ-панели
+    """
+    file = forms.FileField(label='Файл колоды', help_text='JSON, JSON Lines, CSV или TSV (текстовый экспорт Anki)')
+    file_format = forms.ChoiceField(label='Формат', required=False,
+                                    choices=[('', 'Определить по расширению')] + [(name, name) for name in FORMATS])
+    category = forms.ModelChoiceField(queryset=Category.objects.all(), required=False, label='Категория',
+                                      help_text='Для строк без категории (обязательна для TSV)')
+    batch_size = forms.IntegerField(label='Размер пакета', initial=1000, min_value=1)
+    render = forms.BooleanField(label='Сразу преобразовать ответы в HTML', required=False)
+
+
+def parse_tags(value):
+    """
+    Функция преобразует строку тегов через запятую в список имен тегов (в нижнем регистре, без повторов)
+    """
+    return list(dict.fromkeys(tag.strip() for tag in value.lower().split(',') if tag.strip()))
+
+
+class CardRecategorizeForm(forms.Form):
+    """
+    Форма массового переноса карточек в другую категорию (действие админ-панели)
+    """
+    category = forms.ModelChoiceField(queryset=Category.objects.order_by('name'), label='Новая категория')
+
+
+class CardRetagForm(forms.Form):
+    """
+    Форма массового добавления или удаления тегов у карточек (действие админ-панели)
+    """
+    MODES = (('add', 'Добавить теги'), ('remove', 'Убрать теги'))
+
+    mode = forms.ChoiceField(choices=MODES, label='Действие')
+    tags = forms.CharField(label='Теги', help_text='Перечислите теги через запятую', validators=[TagStringValidator()])
+
+    def clean_tags(self):
+        tags = parse_tags(self.cleaned_data['tags'])
+        if not tags:
+            raise ValidationError('Укажите хотя бы один тег')
+        return tags
+
+
+class CardExportForm(forms.Form):
+    """
+    Форма выбора формата выгрузки карточек (действие админ-панели)
+    """
+    file_format = forms.ChoiceField(label='Формат', choices=[('jsonl', 'JSON Lines'), ('csv', 'CSV'),
+                                                             ('tsv', 'Anki (TSV)')])
@@ -0,0 +1,324 @@
+import csv
+import json
+import time
+from dataclasses import dataclass, field
+from itertools import islice
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from . import counters
+from .models import Card, CardTag, Category, Tag, unique_slug
+from .page_cache import bump_catalog_version
+from .rendering import contains_code
+from .search import index_cards
+
+# Потоковый импорт колоды карточек.
+# Файл читается построчно (JSON-массив - по одному объекту), строки группируются в пакеты,
+# категории и теги находятся по словарям в памяти, а карточки, теги и связи вставляются через bulk_create.
+# Каждая строка колоды приводится к словарю {'question', 'answer', 'category', 'tags'}.
+# Неверные строки (не объект карточки, поля не строки, нет вопроса или категории, слишком длинный вопрос)
+# пропускаются, а их номера и причины попадают в результат импорта.
+
+FORMATS = ('json', 'jsonl', 'csv', 'tsv')
+# количество причин пропуска строк, сохраняемых в результате импорта
+MAX_REPORTED_ERRORS = 20
+EXTENSIONS = {
+    '.json': 'json',
+    '.jsonl': 'jsonl',
+    '.ndjson': 'jsonl',
+    '.csv': 'csv',
+    '.tsv': 'tsv',
+    '.txt': 'tsv',
+}
+# строки с более длинным вопросом, названием категории или тега пропускаются, а не обрезаются
+QUESTION_MAX_LENGTH = Card._meta.get_field('question').max_length
+NAME_MAX_LENGTH = min(Category._meta.get_field('name').max_length, Tag._meta.get_field('name').max_length)
+
+
+def detect_format(filename: str) -> str:
+    """
+    Определяет формат файла колоды по расширению
+    :param filename: имя файла
+    :return: формат из FORMATS
+    """
+    for extension, file_format in EXTENSIONS.items():
+        if filename.lower().endswith(extension):
+            return file_format
+    raise ValueError(f'Не удалось определить формат файла {filename}, укажите его явно: {", ".join(FORMATS)}')
+
+
+def split_tags(tags, separator=',') -> list[str]:
+    """
+    Приводит теги к списку уникальных имен в нижнем регистре (как в CardForm.clean_tags)
+    :param tags: строка тегов или список
+    :param separator: разделитель тегов в строке
+    """
+    if isinstance(tags, str):
+        tags = tags.split(separator)
+    names = (str(tag).strip().lower() for tag in tags or ())
+    return list(dict.fromkeys(name for name in names if name))
+
+
+def normalize_row(row, separator=',') -> dict:
+    """
+    Приводит строку колоды к словарю {'question', 'answer', 'category', 'tags'}
+    :param row: разобранная строка файла (для JSON - любое значение элемента)
+    :param separator: разделитель тегов в строке
+    :return: словарь строки или {'error': причина} для строки неверного типа
+    """
+    if not isinstance(row, dict):
+        return {'error': f'ожидается объект карточки, а не {type(row).__name__}'}
+    fields = {}
+    for name in ('question', 'answer', 'category'):
+        value = row.get(name) or ''
+        if not isinstance(value, str):
+            return {'error': f'поле {name} должно быть строкой'}
+        fields[name] = value
+    tags = row.get('tags')
+    if not (tags is None or isinstance(tags, str)
+            or isinstance(tags, list) and all(isinstance(tag, str) for tag in tags)):
+        return {'error': 'теги должны быть строкой или списком строк'}
+    return {
+        'question': fields['question'].strip(),
+        'answer': fields['answer'],
+        'category': fields['category'].strip(),
+        'tags': split_tags(tags, separator),
+    }
+
+
+def parse_jsonl(stream):
+    """
+    JSON Lines: по одному объекту карточки в строке. Строка с неверным JSON не прерывает импорт,
+    а пропускается с указанием номера строки файла
+    """
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as error:
+            yield {'error': f'неверный JSON в строке файла {line_number}: {error.msg}'}
+            continue
+        yield normalize_row(row)
+
+
+def parse_json(stream, chunk_size=64 * 1024):
+    """
+    JSON-массив объектов карточек. Массив читается кусками, объекты разбираются по одному,
+    поэтому весь файл в памяти не хранится
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    eof = False
+    while True:
+        if not eof and len(buffer) < chunk_size:
+            chunk = stream.read(chunk_size)
+            eof = not chunk
+            buffer += chunk
+        buffer = buffer.lstrip()
+        if not started:
+            if not buffer and eof:
+                return
+            if not buffer.startswith('['):
+                raise ValueError('JSON-файл колоды должен содержать массив карточек')
+            buffer = buffer[1:]
+            started = True
+            continue
+        buffer = buffer.lstrip(', \r\n\t')
+        if buffer.startswith(']'):
+            return
+        try:
+            row, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # объект не поместился в прочитанный кусок, дочитываем файл
+            chunk = stream.read(chunk_size)
+            eof = not chunk
+            buffer += chunk
+            continue
+        buffer = buffer[end:]
+        yield normalize_row(row)
+
+
+def parse_csv(stream):
+    """
+    CSV с заголовком question,answer,category,tags (теги через запятую)
+    """
+    for row in csv.DictReader(stream):
+        yield normalize_row(row)
+
+
+def skip_directives(stream):
+    """
+    Пропускает строки-директивы в начале файла Anki (внутри ответов строки с # остаются)
+    """
+    for line in stream:
+        if not line.startswith('#'):
+            yield line
+            break
+    yield from stream
+
+
+def parse_tsv(stream):
+    """
+    Текстовый экспорт Anki: вопрос<TAB>ответ<TAB>теги через пробел.
+    Строки-директивы в начале файла (#separator:tab, #html:true и т.п.) пропускаются
+    """
+    for fields in csv.reader(skip_directives(stream), delimiter='\t'):
+        if len(fields) < 2:
+            continue
+        yield normalize_row({
+            'question': fields[0],
+            'answer': fields[1],
+            'tags': fields[2] if len(fields) > 2 else '',
+        }, separator=' ')
+
+
+PARSERS = {
+    'json': parse_json,
+    'jsonl': parse_jsonl,
+    'csv': parse_csv,
+    'tsv': parse_tsv,
+}
+
+
+def parse_deck(stream, file_format: str):
+    """
+    Возвращает генератор строк колоды
+    :param stream: текстовый поток (для бинарного файла используйте io.TextIOWrapper)
+    :param file_format: формат из FORMATS
+    """
+    return PARSERS[file_format](stream)
+
+
+@dataclass
+class ImportResult:
+    cards: int = 0
+    tags: int = 0
+    categories: int = 0
+    card_tags: int = 0
+    skipped: int = 0
+    seconds: float = 0.0
+    # причины пропуска первых MAX_REPORTED_ERRORS строк: (номер строки, причина)
+    errors: list = field(default_factory=list)
+
+    def skip(self, row_number, reason):
+        self.skipped += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((row_number, reason))
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.cards / self.seconds if self.seconds else 0.0
+
+
+class CardImporter:
+    """
+    Класс пакетного импорта карточек
+    """
+
+    def __init__(self, batch_size=1000, default_category=None, author=None, render=False, using=DEFAULT_DB_ALIAS):
+        """
+        :param batch_size: количество карточек в одном bulk_create
+        :param default_category: имя категории для строк без категории
+        :param author: автор импортированных карточек
+        :param render: сразу преобразовать ответы из Markdown в HTML (иначе - командой render_answers)
+        :param using: псевдоним базы данных
+        """
+        self.batch_size = batch_size
+        self.default_category = default_category
+        self.author = author
+        self.render = render
+        self.using = using
+
+    def run(self, rows) -> ImportResult:
+        """
+        Импортирует строки колоды в одной транзакции
+        :param rows: итерируемые строки колоды (результат parse_deck)
+        :return: статистика импорта
+        """
+        result = ImportResult()
+        started = time.perf_counter()
+        rows = iter(rows)
+        self.row_number = 0
+
+        with transaction.atomic(using=self.using):
+            self.categories = dict(Category.objects.using(self.using).values_list('name', 'id'))
+            self.category_slugs = set(Category.objects.using(self.using).values_list('slug', flat=True))
+            self.tags = dict(Tag.objects.using(self.using).values_list('name', 'id'))
+            while batch := list(islice(rows, self.batch_size)):
+                self.import_batch(batch, result)
+            # bulk_create не отправляет сигналы, счетчик карточек для меню увеличиваем сами
+            transaction.on_commit(lambda: counters.adjust(counters.CARDS_COUNT_KEY, result.cards), using=self.using)
+            # и сбрасываем кеш страниц каталога
+            bump_catalog_version(using=self.using)
+
+        result.seconds = time.perf_counter() - started
+        return result
+
+    def row_error(self, row):
+        """
+        Метод проверяет строку колоды
+        :return: причина, по которой строка пропускается, или None
+        """
+        if 'error' in row:
+            return row['error']
+        if not row['question']:
+            return 'нет вопроса'
+        if len(row['question']) > QUESTION_MAX_LENGTH:
+            return f'вопрос длиннее {QUESTION_MAX_LENGTH} символов'
+        category = row['category'] or self.default_category
+        if not category:
+            return 'нет категории'
+        if len(category) > NAME_MAX_LENGTH:
+            return f'название категории длиннее {NAME_MAX_LENGTH} символов'
+        if any(len(name) > NAME_MAX_LENGTH for name in row['tags']):
+            return f'тег длиннее {NAME_MAX_LENGTH} символов'
+        return None
+
+    def import_batch(self, batch, result):
+        valid_rows = []
+        for row in batch:
+            self.row_number += 1
+            error = self.row_error(row)
+            if error:
+                result.skip(self.row_number, error)
+                continue
+            row['category'] = row['category'] or self.default_category
+            valid_rows.append(row)
+
+        new_categories = {row['category'] for row in valid_rows} - self.categories.keys()
+        if new_categories:
+            created = Category.objects.using(self.using).bulk_create(
+                [Category(name=name, slug=unique_slug(name, self.category_slugs)) for name in new_categories])
+            self.categories.update((category.name, category.id) for category in created)
+            result.categories += len(created)
+
+        new_tags = {name for row in valid_rows for name in row['tags']} - self.tags.keys()
+        if new_tags:
+            created = Tag.objects.using(self.using).bulk_create([Tag(name=name) for name in new_tags])
+            self.tags.update((tag.name, tag.id) for tag in created)
+            result.tags += len(created)
+
+        cards = []
+        for row in valid_rows:
+            card = Card(question=row['question'], answer=row['answer'],
+                        category_id=self.categories[row['category']], author=self.author,
+                        has_code=contains_code(row['answer']))
+            if self.render:
+                card.render_answer()
+            cards.append(card)
+        cards = Card.objects.using(self.using).bulk_create(cards)
+
+        card_tags = [CardTag(card_id=card.id, tag_id=self.tags[name])
+                     for card, row in zip(cards, valid_rows) for name in row['tags']]
+        CardTag.objects.using(self.using).bulk_create(card_tags)
+
+        # bulk_create не отправляет сигналы, поэтому поисковый индекс и количество карточек у тегов обновляем сами
+        index_cards([card.id for card in cards], using=self.using)
+        Tag.objects.using(self.using).filter(pk__in={card_tag.tag_id for card_tag in card_tags}).refresh_counts()
+
+        result.cards += len(cards)
+        result.card_tags += len(card_tags)
@@ -0,0 +1,108 @@
+import multiprocessing
+import random
+import shutil
+import tempfile
+import time
+from itertools import accumulate
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+
+# Бэкенды для сравнения: локальный кеш каждого процесса и общие кеши без внешних сервисов.
+# redis и memcached добавляются опцией --backend, если сервер доступен
+BENCH_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'sqlite': 'anki.cache_backends.SQLiteCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+    'memcached': 'django.core.cache.backends.memcached.PyMemcacheCache',
+}
+DEFAULT_LOCATIONS = {
+    'redis': 'redis://127.0.0.1:6379/15',
+    'memcached': '127.0.0.1:11211',
+}
+
+
+def run_worker(backend_path, location, worker, options, results):
+    """
+    Воркер имитирует запросы к каталогу: чтение счетчика меню и страницы, выбранной по закону Ципфа
+    (популярные страницы запрашиваются чаще). При промахе страница "рендерится" и записывается в кеш.
+    Каждые invalidate_every запросов воркер увеличивает общую версию каталога, как сигнал изменения карточки
+    """
+    cache = import_string(backend_path)(location, {'TIMEOUT': 300, 'OPTIONS': {'MAX_ENTRIES': 100000}})
+    rnd = random.Random(options['seed'] + worker)
+    weights = list(accumulate(1 / (rank + 1) ** options['zipf'] for rank in range(options['pages'])))
+    page = ' ' * options['page_size']
+    hits = misses = 0
+
+    started = time.perf_counter()
+    for number in range(options['requests']):
+        if cache.get('bench:cards_count') is None:
+            cache.add('bench:cards_count', 0)
+        version = cache.get('bench:version')
+        if version is None:
+            cache.add('bench:version', 1)
+            version = cache.get('bench:version', 1)
+        key = f'bench:page:{version}:{rnd.choices(range(options["pages"]), cum_weights=weights)[0]}'
+        if cache.get(key) is None:
+            misses += 1
+            cache.set(key, page)
+        else:
+            hits += 1
+        if options['invalidate_every'] and number % options['invalidate_every'] == options['invalidate_every'] - 1:
+            try:
+                cache.incr('bench:version')
+            except ValueError:
+                cache.add('bench:version', 1)
+    results.put((worker, hits, misses, time.perf_counter() - started))
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает долю попаданий в кеш при нескольких процессах-воркерах для разных бэкендов кеша'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backend', action='append', choices=BENCH_BACKENDS,
+                            help='Бэкенд кеша (можно указать несколько раз), по умолчанию locmem, sqlite и file')
+        parser.add_argument('--location', help='Адрес сервера redis/memcached')
+        parser.add_argument('--workers', type=int, default=4, help='Количество процессов-воркеров')
+        parser.add_argument('--requests', type=int, default=5000, help='Количество запросов на воркер')
+        parser.add_argument('--pages', type=int, default=500, help='Количество различных страниц')
+        parser.add_argument('--zipf', type=float, default=1.1, help='Параметр распределения популярности страниц')
+        parser.add_argument('--page-size', type=int, default=20000, help='Размер страницы в байтах')
+        parser.add_argument('--invalidate-every', type=int, default=0,
+                            help='Каждый воркер сбрасывает версию каталога раз в N запросов (0 - никогда)')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        backends = options['backend'] or ['locmem', 'sqlite', 'file']
+        context = multiprocessing.get_context('fork')
+
+        self.stdout.write(f'{"backend":<10} {"hit rate":>9} {"hits":>8} {"misses":>8} {"req/s":>10}')
+        for name in backends:
+            workdir = tempfile.mkdtemp(prefix='bench_cache_')
+            location = {
+                'locmem': f'bench-{name}',
+                'sqlite': f'{workdir}/cache.sqlite3',
+                'file': workdir,
+            }.get(name) or options['location'] or DEFAULT_LOCATIONS[name]
+            try:
+                results = context.Queue()
+                processes = [context.Process(target=run_worker,
+                                             args=(BENCH_BACKENDS[name], location, worker, options, results))
+                             for worker in range(options['workers'])]
+                started = time.perf_counter()
+                for process in processes:
+                    process.start()
+                rows = [results.get() for _ in processes]
+                for process in processes:
+                    process.join()
+                elapsed = time.perf_counter() - started
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+            if any(process.exitcode for process in processes):
+                raise CommandError(f'Воркер бэкенда {name} завершился с ошибкой')
+            hits = sum(row[1] for row in rows)
+            misses = sum(row[2] for row in rows)
+            self.stdout.write(f'{name:<10} {hits / (hits + misses):>9.1%} {hits:>8} {misses:>8} '
+                              f'{(hits + misses) / elapsed:>10.0f}')
@@ -0,0 +1,158 @@
+import asyncio
+import importlib.util
+import logging
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from cards.models import Card, Tag
+
+# Сравнение синхронных и асинхронных представлений каталога, карточек по тегу и детальной страницы под ASGI.
+# По умолчанию запускается uvicorn (anki.asgi:application) без кеша страниц (CACHE_BACKEND=dummy), чтобы
+# измерялась работа самих представлений. Если uvicorn не установлен, приложение вызывается в процессе
+# команды через httpx.ASGITransport - без сети, но с тем же обработчиком ASGI Django.
+
+PAGES = {
+    'catalog': ('/cards/catalog/?page={page}', '/cards/async/catalog/?page={page}'),
+    'tag': ('/cards/tags/{tag}/', '/cards/async/tags/{tag}/'),
+    'detail': ('/cards/{card}/detail/', '/cards/async/{card}/detail/'),
+}
+
+
+async def run_load(client, paths, concurrency, seconds, seed):
+    """
+    Отправляет запросы из concurrency одновременных "посетителей" в течение seconds секунд
+    :param paths: функция, возвращающая путь следующего запроса
+    :return: (длительности успешных запросов, количество ошибок, время нагрузки)
+    """
+    latencies = []
+    errors = 0
+    started = time.perf_counter()
+    deadline = started + seconds
+
+    async def visitor(number):
+        nonlocal errors
+        rnd = random.Random(seed + number)
+        while time.perf_counter() < deadline:
+            request_started = time.perf_counter()
+            try:
+                response = await client.get(paths(rnd))
+                ok = response.status_code == 200
+            except Exception:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - request_started)
+            else:
+                errors += 1
+
+    await asyncio.gather(*(visitor(number) for number in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает пропускную способность и задержки синхронных и асинхронных представлений под ASGI'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page', action='append', choices=PAGES, help='Страница (по умолчанию все)')
+        parser.add_argument('--concurrency', type=int, default=20, help='Количество одновременных запросов')
+        parser.add_argument('--seconds', type=float, default=10, help='Длительность каждого замера')
+        parser.add_argument('--base-url', default='', help='Адрес уже запущенного сервера (по умолчанию '
+                                                            'запускается uvicorn)')
+        parser.add_argument('--port', type=int, default=8765, help='Порт для запускаемого uvicorn')
+        parser.add_argument('--workers', type=int, default=1, help='Количество воркеров uvicorn')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        try:
+            import httpx
+        except ImportError:
+            raise CommandError('Для замеров нужен пакет httpx')
+        # журнал каждого запроса искажает замеры
+        logging.disable(logging.INFO)
+
+        card_ids = list(Card.objects.values_list('pk', flat=True))
+        tag_ids = list(Tag.objects.values_list('pk', flat=True))
+        if not card_ids or not tag_ids:
+            raise CommandError('В базе нет карточек или тегов')
+        last_page = max(1, len(card_ids) // 30)
+        values = {
+            'page': lambda rnd: rnd.randint(1, last_page),
+            'tag': lambda rnd: rnd.choice(tag_ids),
+            'card': lambda rnd: rnd.choice(card_ids),
+        }
+
+        server = None
+        base_url = options['base_url']
+        if base_url:
+            transport = None
+        elif importlib.util.find_spec('uvicorn'):
+            base_url = f'http://127.0.0.1:{options["port"]}'
+            server = self.start_uvicorn(httpx, base_url, options)
+            transport = None
+        else:
+            self.stderr.write('uvicorn не установлен: приложение вызывается в процессе через httpx.ASGITransport')
+            if settings.CACHES['default']['BACKEND'] != 'django.core.cache.backends.dummy.DummyCache':
+                self.stderr.write('Кеш страниц включен: для замера представлений запустите с CACHE_BACKEND=dummy')
+            from anki.asgi import application
+            base_url = 'http://localhost'
+            transport = httpx.ASGITransport(app=application)
+
+        self.stdout.write(f'{"page":<8} {"view":<6} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} '
+                          f'{"requests":>9} {"errors":>7}')
+        try:
+            for name in options['page'] or list(PAGES):
+                for mode, template in zip(('sync', 'async'), PAGES[name]):
+                    def paths(rnd, template=template):
+                        return template.format(**{key: value(rnd) for key, value in values.items()
+                                                  if '{' + key + '}' in template})
+                    latencies, errors, elapsed = asyncio.run(
+                        self.measure(httpx, base_url, transport, paths, options))
+                    self.report(name, mode, latencies, errors, elapsed)
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(timeout=10)
+
+    async def measure(self, httpx, base_url, transport, paths, options):
+        limits = httpx.Limits(max_connections=options['concurrency'])
+        async with httpx.AsyncClient(base_url=base_url, transport=transport, limits=limits, timeout=30) as client:
+            # прогрев: соединения с БД, шаблоны
+            await run_load(client, paths, options['concurrency'], 1, options['seed'])
+            return await run_load(client, paths, options['concurrency'], options['seconds'], options['seed'])
+
+    def start_uvicorn(self, httpx, base_url, options):
+        """
+        Запускает uvicorn без кеша страниц и ждет, пока он начнет отвечать
+        """
+        # DEBUG включается любым непустым значением, поэтому переменная убирается из окружения
+        env = {key: value for key, value in os.environ.items() if key != 'DEBUG'}
+        env['CACHE_BACKEND'] = 'dummy'
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'uvicorn', 'anki.asgi:application', '--port', str(options['port']),
+             '--workers', str(options['workers']), '--log-level', 'warning'],
+            cwd=settings.BASE_DIR, env=env)
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            try:
+                httpx.get(f'{base_url}/cards/catalog/', timeout=1)
+                return server
+            except httpx.TransportError:
+                time.sleep(0.2)
+        server.terminate()
+        raise CommandError('uvicorn не запустился')
+
+    def report(self, name, mode, latencies, errors, elapsed):
+        if not latencies:
+            self.stdout.write(f'{name:<8} {mode:<6} {"-":>8} {"-":>8} {"-":>8} {0:>9} {errors:>7}')
+            return
+        latencies.sort()
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        self.stdout.write(f'{name:<8} {mode:<6} {len(latencies) / elapsed:>8.0f} '
+                          f'{statistics.median(latencies) * 1000:>8.1f} {p95 * 1000:>8.1f} '
+                          f'{len(latencies):>9} {errors:>7}')
@@ -0,0 +1,271 @@
+import io
+import json
+import logging
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+
+from cards import counters, sorting
+from cards.forms import CardForm
+from cards.models import Card, CardTag, Tag
+from cards.rendering import convert
+from cards.search import index_cards, rebuild_index
+
+from .loadtest import copy_database
+
+# Набор замеров основных операций: страницы каталога с каждой сортировкой, поиск, детальная страница
+# с записью просмотра, сохранение карточки с тегами через CardForm и преобразование Markdown.
+# Замеры выполняются на копии базы (или на новой базе с фикстурой db_cards.json), которую можно увеличить
+# синтетическими карточками (--scale 10 / 100). Для каждого замера - p50/p95 времени, количество запросов
+# к БД и пик памяти, результаты записываются в JSON для сравнения между запусками (--compare).
+
+SEARCH_WORDS = ('python', 'список', 'функция', 'sql', 'класс', 'словарь', 'цикл', 'строка')
+
+
+class Benchmark:
+    """
+    Класс готовит данные для замеров и описывает сами замеры (методы scenario_*)
+    """
+
+    def __init__(self, seed):
+        self.rnd = random.Random(seed)
+        self.client = Client(HTTP_HOST='localhost')
+        user, _ = get_user_model().objects.get_or_create(username='benchmark')
+        # страницы авторизованного пользователя не берутся из кеша страниц
+        self.client.force_login(user)
+        self.card_ids = list(Card.objects.values_list('pk', flat=True))
+        self.pages = max(1, len(self.card_ids) // 30)
+        self.tag_names = list(Tag.objects.order_by('-cards_count').values_list('name', flat=True)[:200])
+        self.answers = list(Card.objects.order_by('?').values_list('answer', flat=True)[:200])
+        self.form_card = Card.objects.filter(pk__in=self.card_ids[:1]).first()
+
+    def scenarios(self):
+        """
+        Словарь {имя замера: функция одной итерации}
+        """
+        scenarios = {f'catalog_{key}': self.catalog_page(key) for key in sorting.CATALOG_SORTS}
+        scenarios.update({
+            'search': self.scenario_search,
+            'detail': self.scenario_detail,
+            'card_form_save': self.scenario_card_form_save,
+            'markdown': self.scenario_markdown,
+        })
+        return scenarios
+
+    def get(self, url):
+        response = self.client.get(url)
+        if response.status_code != 200:
+            raise CommandError(f'{url}: ответ {response.status_code}')
+
+    def catalog_page(self, sort):
+        def scenario():
+            self.get(f'/cards/catalog/?sort={sort}&page={self.rnd.randint(1, self.pages)}')
+        return scenario
+
+    def scenario_search(self):
+        self.get(f'/cards/catalog/?search_query={self.rnd.choice(SEARCH_WORDS)}')
+
+    def scenario_detail(self):
+        # CARD_VIEWS_FLUSH_INTERVAL=0: просмотр записывается в БД в том же запросе
+        self.get(f'/cards/{self.rnd.choice(self.card_ids)}/detail/')
+
+    def scenario_card_form_save(self):
+        # 15 тегов: часть существующих, часть новых - у карточки каждый раз меняется набор тегов
+        names = self.rnd.sample(self.tag_names, min(10, len(self.tag_names)))
+        names += [f'benchmark-{self.rnd.randint(1, 1000)}' for _ in range(5)]
+        form = CardForm({'question': self.form_card.question, 'answer': self.form_card.answer,
+                         'category': self.form_card.category_id, 'tags': ','.join(names)},
+                        instance=self.form_card)
+        if not form.is_valid():
+            raise CommandError(f'CardForm: {form.errors.as_text()}')
+        form.save()
+
+    def scenario_markdown(self):
+        # преобразование без кеша HTML
+        convert(self.rnd.choice(self.answers))
+
+
+def scale_up(factor, batch_size=1000):
+    """
+    Увеличивает базу в factor раз копиями существующих карточек с теми же тегами
+    :return: количество добавленных карточек
+    """
+    originals = list(Card.objects.order_by('pk'))
+    tags = {}
+    for card_id, tag_id in CardTag.objects.values_list('card_id', 'tag_id'):
+        tags.setdefault(card_id, []).append(tag_id)
+
+    created = 0
+    for copy in range(1, factor):
+        for start in range(0, len(originals), batch_size):
+            chunk = originals[start:start + batch_size]
+            cards = Card.objects.bulk_create([
+                Card(question=f'{card.question[:240]} (копия {copy})', answer=card.answer,
+                     category_id=card.category_id, author_id=card.author_id, views=card.views, adds=card.adds,
+                     status=card.status, answer_html=card.answer_html, answer_preview_html=card.answer_preview_html,
+                     answer_hash=card.answer_hash, has_code=card.has_code)
+                for card in chunk])
+            CardTag.objects.bulk_create([CardTag(card_id=new.pk, tag_id=tag_id)
+                                         for new, card in zip(cards, chunk) for tag_id in tags.get(card.pk, [])])
+            index_cards([card.pk for card in cards])
+            created += len(cards)
+    Tag.objects.refresh_counts()
+    return created
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True,
+                              text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ''
+
+
+class Command(BaseCommand):
+    help = ('Замеры основных операций (каталог, поиск, детальная страница, сохранение карточки, Markdown) '
+            'на копии базы с отчетом p50/p95, количеством запросов и памятью в JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fixture', default='', help='Загрузить фикстуру (например, db_cards.json) '
+                                                          'в новую базу вместо копии текущей')
+        parser.add_argument('--scale', type=int, default=1, help='Увеличить количество карточек в N раз (10, 100)')
+        parser.add_argument('--iterations', type=int, default=50, help='Количество итераций каждого замера')
+        parser.add_argument('--scenario', action='append', help='Замер (по умолчанию все)')
+        parser.add_argument('--with-cache', action='store_true',
+                            help='Использовать кеш из настроек (по умолчанию замеры идут без кеша)')
+        parser.add_argument('--output', default='', help='Файл результатов (по умолчанию benchmark-<время>.json)')
+        parser.add_argument('--compare', default='', help='Файл результатов предыдущего запуска для сравнения')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        database = connections['default'].settings_dict
+        if database['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError('Замеры выполняются на копии базы SQLite')
+        logging.disable(logging.WARNING)
+        source = str(database['NAME'])
+        workdir = tempfile.mkdtemp(prefix='benchmark_')
+        try:
+            connections.close_all()
+            database['NAME'] = f'{workdir}/db.sqlite3'
+            self.prepare_database(source, options)
+            cache_settings = None if options['with_cache'] else {
+                'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+            overrides = {'CACHES': cache_settings} if cache_settings else {}
+            with override_settings(CARD_VIEWS_FLUSH_INTERVAL=0, **overrides):
+                results = self.run_scenarios(options)
+        finally:
+            connections.close_all()
+            database['NAME'] = source
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        output = options['output'] or f'benchmark-{timezone.now():%Y%m%d-%H%M%S}.json'
+        with open(output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, ensure_ascii=False, indent=2)
+        self.report(results, options['compare'])
+        self.stdout.write(f'Результаты записаны в {output}')
+
+    def prepare_database(self, source, options):
+        """
+        Готовит рабочую базу: копию текущей или новую базу с фикстурой, при необходимости увеличенную
+        """
+        if options['fixture']:
+            call_command('migrate', verbosity=0, interactive=False)
+            call_command('loaddata', options['fixture'], verbosity=0)
+            # после загрузки фикстуры - те же шаги, что и при установке проекта (readme.md):
+            # поисковый индекс и HTML ответов
+            rebuild_index()
+            call_command('render_answers', stdout=io.StringIO())
+        else:
+            copy_database(source, str(connections['default'].settings_dict['NAME']), 'WAL')
+            call_command('migrate', verbosity=0, interactive=False)
+        if options['scale'] > 1:
+            started = time.perf_counter()
+            created = scale_up(options['scale'])
+            self.stdout.write(f'Добавлено карточек: {created} за {time.perf_counter() - started:.1f} с')
+        counters.reconcile()
+
+    def run_scenarios(self, options):
+        bench = Benchmark(options['seed'])
+        scenarios = bench.scenarios()
+        unknown = set(options['scenario'] or []) - scenarios.keys()
+        if unknown:
+            raise CommandError(f'Неизвестные замеры: {", ".join(sorted(unknown))}. Доступны: {", ".join(scenarios)}')
+
+        results = {
+            'created': timezone.now().isoformat(),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'cards': Card.objects.count(),
+            'scale': options['scale'],
+            'iterations': options['iterations'],
+            'with_cache': options['with_cache'],
+            'scenarios': {},
+        }
+        for name in options['scenario'] or list(scenarios):
+            scenario = scenarios[name]
+            # прогрев: соединение, шаблоны, экземпляр Markdown
+            for _ in range(3):
+                scenario()
+
+            latencies, queries = [], []
+            for _ in range(options['iterations']):
+                with CaptureQueriesContext(connection) as context:
+                    started = time.perf_counter()
+                    scenario()
+                    latencies.append(time.perf_counter() - started)
+                queries.append(len(context.captured_queries))
+
+            # память замеряется отдельным проходом: tracemalloc замедляет выполнение
+            tracemalloc.start()
+            for _ in range(min(10, options['iterations'])):
+                scenario()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            results['scenarios'][name] = {
+                'p50_ms': round(statistics.median(latencies) * 1000, 2),
+                'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+                'mean_ms': round(statistics.fmean(latencies) * 1000, 2),
+                'queries': statistics.median_low(queries),
+                'max_queries': max(queries),
+                'peak_memory_kb': round(peak / 1024),
+            }
+        return results
+
+    def report(self, results, compare):
+        previous = {}
+        if compare:
+            with open(compare, encoding='utf-8') as file:
+                previous = json.load(file).get('scenarios', {})
+        self.stdout.write(f'Карточек: {results["cards"]}, итераций: {results["iterations"]}')
+        self.stdout.write(f'{"scenario":<22} {"p50 ms":>8} {"p95 ms":>8} {"queries":>8} {"peak KB":>8}'
+                          + (f' {"p50 было":>9} {"изм.":>7}' if previous else ''))
+        for name, row in results['scenarios'].items():
+            line = (f'{name:<22} {row["p50_ms"]:>8.2f} {row["p95_ms"]:>8.2f} {row["queries"]:>8} '
+                    f'{row["peak_memory_kb"]:>8}')
+            if name in previous:
+                before = previous[name]['p50_ms']
+                change = (row['p50_ms'] - before) / before * 100 if before else 0
+                line += f' {before:>9.2f} {change:>+6.0f}%'
+            self.stdout.write(line)
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cards.models import Category, Tag
+from cards.snapshots import build_snapshots
+
+
+class Command(BaseCommand):
+    help = ('Собирает снимки изменившихся колод (категорий и тегов) для офлайн-повторения '
+            '(можно запускать периодически через cron)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--category', action='append', default=[], help='Slug категории (по умолчанию все колоды)')
+        parser.add_argument('--tag', action='append', default=[], help='Имя тега (по умолчанию все колоды)')
+        parser.add_argument('--full', action='store_true', help='Собрать снимки заново, без предыдущих версий')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Повторять сборку каждые N секунд (0 - собрать один раз)')
+
+    def handle(self, *args, **options):
+        decks = None
+        if options['category'] or options['tag']:
+            decks = [*Category.objects.filter(slug__in=options['category']),
+                     *Tag.objects.filter(name__in=options['tag'])]
+            if len(decks) != len(options['category']) + len(options['tag']):
+                raise CommandError('Не найдены некоторые категории или теги')
+        while True:
+            started = time.perf_counter()
+            snapshots = build_snapshots(decks, full=options['full'])
+            for snapshot in snapshots:
+                self.stdout.write(f'{snapshot.kind} {snapshot.object_id}: версия {snapshot.pk}, '
+                                  f'карточек {snapshot.cards}, {snapshot.size} байт')
+            self.stdout.write(f'Собрано снимков: {len(snapshots)} за {time.perf_counter() - started:.2f} с')
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
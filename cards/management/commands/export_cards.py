@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from cards.exporters import EXPORT_FORMATS, export_deck
+from cards.models import Card
+
+
+class Command(BaseCommand):
+    help = 'Выгружает колоду карточек в файл JSON Lines, CSV или TSV (текстовый экспорт Anki)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='jsonl', help='Формат файла')
+        parser.add_argument('--output', help='Путь к файлу (по умолчанию - стандартный вывод)')
+        parser.add_argument('--category', type=int, help='id категории')
+        parser.add_argument('--tag', type=int, help='id тега')
+        parser.add_argument('--author', help='Имя пользователя - автора карточек')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Количество карточек в одной порции')
+
+    def handle(self, *args, **options):
+        queryset = Card.objects.all()
+        if options['category']:
+            queryset = queryset.filter(category_id=options['category'])
+        if options['tag']:
+            queryset = queryset.filter(tags__id=options['tag'])
+        if options['author']:
+            queryset = queryset.filter(author__username=options['author'])
+
+        lines = export_deck(queryset, options['format'], chunk_size=options['chunk_size'])
+        if not options['output']:
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+
+        try:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+                output.writelines(lines)
+        except OSError as error:
+            raise CommandError(error)
+        self.stderr.write(self.style.SUCCESS(f'Колода сохранена в {options["output"]}'))
@@ -0,0 +1,46 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from cards.importers import FORMATS, CardImporter, detect_format, parse_deck
+
+
+class Command(BaseCommand):
+    help = 'Импортирует колоду карточек из файла JSON, JSON Lines, CSV или TSV (текстовый экспорт Anki)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу колоды')
+        parser.add_argument('--format', choices=FORMATS, help='Формат файла (по умолчанию - по расширению)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Количество карточек в одном пакете')
+        parser.add_argument('--category', help='Категория для карточек без категории (обязательна для TSV)')
+        parser.add_argument('--author', help='Имя пользователя - автора карточек')
+        parser.add_argument('--render', action='store_true', help='Сразу преобразовать ответы в HTML')
+
+    def handle(self, *args, **options):
+        try:
+            file_format = options['format'] or detect_format(options['path'])
+        except ValueError as error:
+            raise CommandError(error)
+
+        author = None
+        if options['author']:
+            try:
+                author = get_user_model().objects.get(username=options['author'])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f'Пользователь {options["author"]} не найден')
+
+        importer = CardImporter(batch_size=options['batch_size'], default_category=options['category'],
+                                author=author, render=options['render'])
+        with open(options['path'], encoding='utf-8-sig', newline='') as stream:
+            try:
+                result = importer.run(parse_deck(stream, file_format))
+            except ValueError as error:
+                raise CommandError(f'Ошибка разбора файла: {error}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Импортировано карточек: {result.cards}, новых тегов: {result.tags}, '
+            f'новых категорий: {result.categories}, связей с тегами: {result.card_tags}, '
+            f'пропущено строк: {result.skipped}. '
+            f'Время: {result.seconds:.2f} с ({result.rows_per_second:.0f} строк/с)'
+        ))
+        for row_number, reason in result.errors:
+            self.stdout.write(self.style.WARNING(f'Строка колоды {row_number} пропущена: {reason}'))
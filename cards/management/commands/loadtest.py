@@ -0,0 +1,174 @@
+import logging
+import multiprocessing
+import random
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+from django.db.models import F
+from django.test import Client
+
+from cards.models import Card, Category
+from users.notifications import notifier
+
+# Нагрузочный тест SQLite: несколько процессов одновременно читают каталог и страницы карточек
+# (каждый просмотр записывается в БД) и добавляют карточки. Тест выполняется на копии базы данных
+# для двух конфигураций: baseline - без PRAGMA, журнал DELETE, новое соединение на каждый запрос;
+# tuned - PRAGMA из settings.SQLITE_PRAGMAS (WAL и др.) и постоянные соединения (CONN_MAX_AGE).
+
+CONFIGS = {
+    'baseline': {'pragmas': {'journal_mode': 'DELETE'}, 'conn_max_age': 0, 'timeout': 5},
+    'tuned': {'pragmas': None, 'conn_max_age': None, 'timeout': None},
+}
+
+
+def copy_database(source, target, journal_mode):
+    """
+    Копирует базу данных через backup API SQLite (корректно и для базы в режиме WAL)
+    """
+    with sqlite3.connect(source) as src, sqlite3.connect(target) as dst:
+        src.backup(dst)
+        dst.execute(f'PRAGMA journal_mode = {journal_mode}')
+    src.close()
+    dst.close()
+
+
+def run_worker(path, config, worker, options, results):
+    logging.disable(logging.CRITICAL)
+    connection_settings = connections['default'].settings_dict
+    connection_settings['NAME'] = path
+    connection_settings['CONN_MAX_AGE'] = config['conn_max_age']
+    connection_settings['OPTIONS'] = {**connection_settings['OPTIONS'], 'timeout': config['timeout']}
+    settings.SQLITE_PRAGMAS = config['pragmas']
+    settings.CARD_VIEWS_FLUSH_INTERVAL = options['view_flush_interval']
+    # карточки нагрузочного теста не отправляют уведомления в Telegram (без токена уведомления отключены)
+    settings.TELEGRAM_BOT_TOKEN = notifier.token = None
+
+    latencies = []
+    errors = 0
+    started = time.perf_counter()
+    elapsed = None
+    try:
+        elapsed = run_requests(worker, options, latencies)
+    except Exception:
+        # воркер не смог подготовиться (например, база заблокирована) - результат все равно отправляется,
+        # чтобы основной процесс не ждал его бесконечно
+        errors += 1
+    finally:
+        errors += sum(1 for _, ok in latencies if not ok)
+        results.put(([latency for latency, _ in latencies], errors, elapsed or time.perf_counter() - started))
+
+
+def run_requests(worker, options, latencies):
+    """
+    Выполняет операции до истечения времени теста
+    :param latencies: список, в который добавляются пары (длительность операции, успех)
+    :return: время выполнения операций без подготовки воркера
+    """
+    rnd = random.Random(options['seed'] + worker)
+    card_ids = list(Card.objects.values_list('pk', flat=True))
+    category = Category.objects.order_by('pk').first()
+    pages = max(1, len(card_ids) // 30)
+    client = Client(raise_request_exception=False, HTTP_HOST='localhost')
+    client.force_login(get_user_model().objects.get(username=options['username']))
+    connections.close_all()
+
+    loop_started = time.perf_counter()
+    deadline = loop_started + options['seconds']
+    while time.perf_counter() < deadline:
+        roll = rnd.random()
+        started = time.perf_counter()
+        try:
+            if roll < options['write_ratio']:
+                Card.objects.create(question=f'Нагрузочный тест {worker}-{len(latencies)}', answer='Ответ',
+                                    category=category)
+                ok = True
+            elif options['mode'] == 'orm':
+                # те же запросы к БД, что и у страниц, но без шаблонов: в результате виден вклад самой БД
+                if roll < options['write_ratio'] + (1 - options['write_ratio']) / 2:
+                    page = rnd.randint(1, pages)
+                    ok = len(list(Card.objects.for_listing().order_by('-upload_date', '-pk')[
+                                  (page - 1) * 30:page * 30])) >= 0
+                else:
+                    card_id = rnd.choice(card_ids)
+                    ok = Card.objects.filter(pk=card_id).update(views=F('views') + 1) == 1
+                    Card.objects.get(pk=card_id)
+                # конец "запроса": с CONN_MAX_AGE=0 соединение закрывается, как после ответа сервера
+                close_old_connections()
+            elif roll < options['write_ratio'] + (1 - options['write_ratio']) / 2:
+                ok = client.get(f'/cards/catalog/?page={rnd.randint(1, pages)}').status_code == 200
+            else:
+                ok = client.get(f'/cards/{rnd.choice(card_ids)}/detail/').status_code == 200
+        except Exception:
+            ok = False
+        latencies.append((time.perf_counter() - started, ok))
+    return time.perf_counter() - loop_started
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест SQLite: сравнивает пропускную способность смешанной нагрузки (чтение/запись) '
+            'без настроек соединения и с PRAGMA и постоянными соединениями')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Количество процессов')
+        parser.add_argument('--seconds', type=float, default=10, help='Длительность теста для каждой конфигурации')
+        parser.add_argument('--write-ratio', type=float, default=0.1, help='Доля операций добавления карточки')
+        parser.add_argument('--view-flush-interval', type=int, default=0,
+                            help='Интервал записи просмотров (0 - каждый просмотр сразу записывается в БД)')
+        parser.add_argument('--mode', choices=('http', 'orm'), default='http',
+                            help='http - запросы к страницам через тестовый клиент, orm - только запросы к БД')
+        parser.add_argument('--config', action='append', choices=CONFIGS, help='Конфигурация (по умолчанию обе)')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        database = connections['default'].settings_dict
+        if database['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError('Нагрузочный тест предназначен для SQLite')
+        source = str(database['NAME'])
+        options['username'] = 'loadtest'
+        context = multiprocessing.get_context('fork')
+        tuned = {'pragmas': settings.SQLITE_PRAGMAS, 'conn_max_age': database['CONN_MAX_AGE'] or 60,
+                 'timeout': database['OPTIONS'].get('timeout', 5)}
+
+        self.stdout.write(f'{"config":<10} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} {"requests":>9} {"errors":>7}')
+        for name in options['config'] or list(CONFIGS):
+            config = {key: value if value is not None else tuned[key] for key, value in CONFIGS[name].items()}
+            workdir = tempfile.mkdtemp(prefix='loadtest_')
+            path = f'{workdir}/db.sqlite3'
+            try:
+                connections.close_all()
+                copy_database(source, path, config['pragmas'].get('journal_mode', 'DELETE'))
+                # пользователь для сессий воркеров создается в копии базы
+                database['NAME'] = path
+                get_user_model().objects.get_or_create(username=options['username'])
+                connections.close_all()
+
+                results = context.Queue()
+                processes = [context.Process(target=run_worker, args=(path, config, worker, options, results))
+                             for worker in range(options['workers'])]
+                for process in processes:
+                    process.start()
+                rows = [results.get(timeout=options['seconds'] + 120) for _ in processes]
+                for process in processes:
+                    process.join()
+            finally:
+                database['NAME'] = source
+                connections.close_all()
+                shutil.rmtree(workdir, ignore_errors=True)
+
+            latencies = sorted(latency for row in rows for latency in row[0])
+            errors = sum(row[1] for row in rows)
+            # время нагрузки без запуска процессов и подготовки сессий
+            elapsed = max(row[2] for row in rows)
+            if not latencies:
+                raise CommandError(f'Конфигурация {name}: не выполнено ни одного запроса')
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            self.stdout.write(f'{name:<10} {len(latencies) / elapsed:>8.0f} '
+                              f'{statistics.median(latencies) * 1000:>8.1f} {p95 * 1000:>8.1f} '
+                              f'{len(latencies):>9} {errors:>7}')
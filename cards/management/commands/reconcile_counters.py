@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from cards.counters import reconcile
+from cards.models import Tag
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает счетчики карточек и пользователей для меню и количество карточек у тегов '
+            '(можно запускать периодически через cron или с --interval)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Повторять сверку каждые N секунд (0 - выполнить один раз)')
+
+    def handle(self, *args, **options):
+        while True:
+            for key, value in reconcile().items():
+                self.stdout.write(f'{key}: {value}')
+            self.stdout.write(f'tags: {Tag.objects.refresh_counts()}')
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
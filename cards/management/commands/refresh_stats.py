@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from cards.stats import refresh_stats
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает сводные таблицы статистики карточек, категорий, тегов и авторов для рейтингов '
+            '(можно запускать периодически через cron)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Повторять пересчет каждые N секунд (0 - пересчитать один раз)')
+
+    def handle(self, *args, **options):
+        while True:
+            refresh = refresh_stats()
+            self.stdout.write(f'{refresh.refreshed_at:%Y-%m-%d %H:%M:%S}: карточек {refresh.cards}, '
+                              f'{refresh.duration:.2f} с')
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from cards.models import Card
+from cards.page_cache import bump_catalog_version
+
+
+class Command(BaseCommand):
+    help = 'Заранее преобразует ответы карточек из Markdown в HTML (для карточек без HTML или с измененным ответом)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Преобразовать заново все карточки')
+        parser.add_argument('--batch-size', type=int, default=500, help='Количество карточек в одном UPDATE')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        # дата изменения обновляется, чтобы закешированные фрагменты карточек построились заново
+        fields = ['answer_html', 'answer_preview_html', 'answer_hash', 'updated_at']
+        batch = []
+        rendered = 0
+
+        queryset = Card.objects.only('id', 'answer', *fields).order_by('pk')
+        for card in queryset.iterator(chunk_size=batch_size):
+            if card.render_answer(force=options['force']):
+                card.updated_at = timezone.now()
+                batch.append(card)
+            if len(batch) >= batch_size:
+                rendered += Card.objects.bulk_update(batch, fields)
+                batch = []
+        if batch:
+            rendered += Card.objects.bulk_update(batch, fields)
+        if rendered:
+            bump_catalog_version()
+
+        self.stdout.write(self.style.SUCCESS(f'Преобразовано карточек: {rendered}'))
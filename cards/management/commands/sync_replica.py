@@ -0,0 +1,47 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+def copy_sqlite(source, target):
+    """
+    Копирует базу SQLite через backup API: копия согласована, даже если в основную базу идет запись
+    """
+    src = sqlite3.connect(source)
+    dst = sqlite3.connect(target, timeout=30)
+    try:
+        src.backup(dst)
+    finally:
+        src.close()
+        dst.close()
+
+
+class Command(BaseCommand):
+    help = ('Копирует основную базу SQLite в реплики из settings.DATABASE_REPLICAS '
+            '(для локальной проверки чтения с реплик)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Повторять копирование каждые N секунд (0 - скопировать один раз)')
+
+    def handle(self, *args, **options):
+        primary = connections[DEFAULT_DB_ALIAS].settings_dict
+        replicas = list(settings.DATABASE_REPLICAS)
+        if not replicas:
+            raise CommandError('Реплики не настроены: укажите путь к файлу реплики в REPLICA_DATABASE')
+        if any(connections[alias].vendor != 'sqlite' for alias in [DEFAULT_DB_ALIAS, *replicas]):
+            raise CommandError('Команда копирует только базы SQLite')
+
+        while True:
+            for alias in replicas:
+                started = time.perf_counter()
+                # соединения процесса с репликой закрываем, чтобы они не удерживали блокировку чтения
+                connections[alias].close()
+                copy_sqlite(str(primary['NAME']), str(connections[alias].settings_dict['NAME']))
+                self.stdout.write(f'{alias}: скопировано за {time.perf_counter() - started:.2f} с')
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,28 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0002_initial'),
+    ]
+
+    operations = [
+        # Полнотекстовый индекс FTS5 по вопросу, ответу и тегам карточки (rowid = CardID)
+        migrations.RunSQL(
+            sql="""CREATE VIRTUAL TABLE "CardsSearch" USING fts5(
+                question, answer, tags, tokenize = 'unicode61 remove_diacritics 2'
+            )""",
+            reverse_sql='DROP TABLE "CardsSearch"',
+        ),
+        # Первичное заполнение индекса уже существующими карточками
+        migrations.RunSQL(
+            sql="""INSERT INTO "CardsSearch" (rowid, question, answer, tags)
+                SELECT c."CardID", c."Question", c."Answer",
+                       COALESCE((SELECT group_concat(t."Name", ' ')
+                                 FROM "CardTags" ct JOIN "Tags" t ON t."TagID" = ct."TagID"
+                                 WHERE ct."CardID" = c."CardID"), '')
+                FROM "Cards" c""",
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.9 on 2026-10-18 00:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0003_cards_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='card',
+            name='answer_hash',
+            field=models.CharField(blank=True, db_column='AnswerHash', default='', editable=False, max_length=40, verbose_name='Хеш ответа'),
+        ),
+        migrations.AddField(
+            model_name='card',
+            name='answer_html',
+            field=models.TextField(blank=True, db_column='AnswerHTML', default='', editable=False, verbose_name='Ответ в HTML'),
+        ),
+        migrations.AddField(
+            model_name='card',
+            name='answer_preview_html',
+            field=models.TextField(blank=True, db_column='AnswerPreviewHTML', default='', editable=False, verbose_name='Краткий ответ в HTML'),
+        ),
+    ]
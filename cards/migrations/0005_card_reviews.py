@@ -0,0 +1,37 @@
+# Generated by Django 4.2.9 on 2026-10-18 00:33
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('cards', '0004_card_answer_html'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CardReview',
+            fields=[
+                ('id', models.AutoField(db_column='ReviewID', primary_key=True, serialize=False)),
+                ('ease', models.FloatField(db_column='Ease', default=2.5, verbose_name='Коэффициент легкости')),
+                ('interval', models.IntegerField(db_column='Interval', default=0, verbose_name='Интервал (дней)')),
+                ('repetitions', models.IntegerField(db_column='Repetitions', default=0, verbose_name='Успешных повторений подряд')),
+                ('lapses', models.IntegerField(db_column='Lapses', default=0, verbose_name='Забываний')),
+                ('due', models.DateTimeField(db_column='Due', verbose_name='Дата следующего повторения')),
+                ('last_reviewed', models.DateTimeField(blank=True, db_column='LastReviewed', null=True, verbose_name='Дата последнего повторения')),
+                ('card', models.ForeignKey(db_column='CardID', on_delete=django.db.models.deletion.CASCADE, related_name='reviews', to='cards.card', verbose_name='Карточка')),
+                ('user', models.ForeignKey(db_column='UserID', on_delete=django.db.models.deletion.CASCADE, related_name='card_reviews', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Повторение карточки',
+                'verbose_name_plural': 'Повторения карточек',
+                'db_table': 'CardReviews',
+                'indexes': [models.Index(fields=['user', 'due'], name='card_reviews_user_due_idx')],
+                'unique_together': {('user', 'card')},
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.9 on 2026-10-18 00:38
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_tags(apps, schema_editor):
+    """
+    Перед добавлением уникального индекса объединяет теги с одинаковыми именами:
+    связи карточек переносятся на тег с наименьшим id, дубликаты удаляются
+    """
+    Tag = apps.get_model('cards', 'Tag')
+    CardTag = apps.get_model('cards', 'CardTag')
+    duplicates = Tag.objects.values('name').annotate(count=Count('id'), keep_id=Min('id')).filter(count__gt=1)
+    for duplicate in duplicates:
+        duplicate_ids = list(Tag.objects.filter(name=duplicate['name']).exclude(id=duplicate['keep_id'])
+                             .values_list('id', flat=True))
+        tagged_cards = CardTag.objects.filter(tag_id=duplicate['keep_id']).values('card_id')
+        # связи, которые после переноса повторили бы существующие, удаляем
+        CardTag.objects.filter(tag_id__in=duplicate_ids, card_id__in=tagged_cards).delete()
+        for duplicate_id in duplicate_ids:
+            CardTag.objects.filter(tag_id=duplicate_id).exclude(card_id__in=tagged_cards).update(
+                tag_id=duplicate['keep_id'])
+        CardTag.objects.filter(tag_id__in=duplicate_ids).delete()
+        Tag.objects.filter(id__in=duplicate_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0005_card_reviews'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_tags, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='tag',
+            name='name',
+            field=models.CharField(db_column='Name', max_length=100, unique=True),
+        ),
+    ]
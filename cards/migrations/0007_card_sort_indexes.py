@@ -0,0 +1,25 @@
+# Generated by Django 4.2.9 on 2026-10-18 00:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0006_tag_name_unique'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='card',
+            index=models.Index(fields=['upload_date', 'id'], name='cards_upload_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='card',
+            index=models.Index(fields=['views', 'id'], name='cards_views_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='card',
+            index=models.Index(fields=['adds', 'id'], name='cards_adds_id_idx'),
+        ),
+    ]
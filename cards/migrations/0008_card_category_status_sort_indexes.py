@@ -0,0 +1,29 @@
+# Generated by Django 4.2.9 on 2026-10-18 00:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0007_card_sort_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='card',
+            index=models.Index(fields=['category', 'upload_date', 'id'], name='cards_cat_upload_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='card',
+            index=models.Index(fields=['category', 'views', 'id'], name='cards_cat_views_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='card',
+            index=models.Index(fields=['category', 'adds', 'id'], name='cards_cat_adds_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='card',
+            index=models.Index(fields=['status', 'upload_date', 'id'], name='cards_status_upload_date_idx'),
+        ),
+    ]
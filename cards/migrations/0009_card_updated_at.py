@@ -0,0 +1,18 @@
+# Generated by Django 4.2.9 on 2026-10-18 00:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0008_card_category_status_sort_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='card',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_column='UpdatedAt', verbose_name='Дата изменения'),
+        ),
+    ]
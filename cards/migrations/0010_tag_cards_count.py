@@ -0,0 +1,40 @@
+# Generated by Django 4.2.9 on 2026-10-18 01:05
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_tag_cards_count(apps, schema_editor):
+    """
+    Заполняет количество карточек у существующих тегов одним запросом UPDATE
+    """
+    Tag = apps.get_model('cards', 'Tag')
+    CardTag = apps.get_model('cards', 'CardTag')
+    cards_count = (CardTag.objects.filter(tag=OuterRef('pk')).order_by()
+                   .values('tag').annotate(count=Count('pk')).values('count'))
+    Tag.objects.update(cards_count=Coalesce(Subquery(cards_count), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0009_card_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='cards_count',
+            field=models.IntegerField(db_column='CardsCount', default=0, editable=False, verbose_name='Количество карточек'),
+        ),
+        migrations.AddIndex(
+            model_name='cardtag',
+            index=models.Index(fields=['tag', 'card'], name='card_tags_tag_card_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['cards_count', 'id'], name='tags_cards_count_idx'),
+        ),
+        migrations.RunPython(fill_tag_cards_count, migrations.RunPython.noop),
+    ]
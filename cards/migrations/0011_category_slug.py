@@ -0,0 +1,47 @@
+# Generated by Django 4.2.9 on 2026-10-18 01:15
+
+from django.db import migrations, models
+from django.utils.text import slugify
+
+
+def fill_category_slugs(apps, schema_editor):
+    """
+    Заполняет slug существующих категорий по имени. Категории, имена которых дают одинаковый slug
+    (например, general и General), получают номер: general, general-2
+    """
+    Category = apps.get_model('cards', 'Category')
+    taken = set()
+    categories = list(Category.objects.order_by('id'))
+    for category in categories:
+        base = slugify(category.name, allow_unicode=True)[:90] or 'category'
+        slug, number = base, 1
+        while slug in taken:
+            number += 1
+            slug = f'{base}-{number}'
+        taken.add(slug)
+        category.slug = slug
+    Category.objects.bulk_update(categories, ['slug'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0010_tag_cards_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='slug',
+            field=models.SlugField(allow_unicode=True, db_column='Slug', default='', max_length=100,
+                                   verbose_name='Slug'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_category_slugs, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='category',
+            name='slug',
+            field=models.SlugField(allow_unicode=True, db_column='Slug', max_length=100, unique=True,
+                                   verbose_name='Slug'),
+        ),
+    ]
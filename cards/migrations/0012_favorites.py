@@ -0,0 +1,32 @@
+# Generated by Django 4.2.9 on 2026-10-18 01:17
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('cards', '0011_category_slug'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Favorite',
+            fields=[
+                ('id', models.AutoField(db_column='FavoriteID', primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_column='CreatedAt', verbose_name='Дата добавления')),
+                ('card', models.ForeignKey(db_column='CardID', on_delete=django.db.models.deletion.CASCADE, related_name='favorited_by', to='cards.card', verbose_name='Карточка')),
+                ('user', models.ForeignKey(db_column='UserID', on_delete=django.db.models.deletion.CASCADE, related_name='favorites', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Избранная карточка',
+                'verbose_name_plural': 'Избранные карточки',
+                'db_table': 'Favorites',
+                'indexes': [models.Index(fields=['user', 'created_at', 'id'], name='favorites_user_created_idx')],
+                'unique_together': {('user', 'card')},
+            },
+        ),
+    ]
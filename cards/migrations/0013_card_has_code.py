@@ -0,0 +1,31 @@
+# Generated by Django 4.2.9 on 2026-10-18 01:19
+
+from django.db import migrations, models
+
+
+def fill_has_code(apps, schema_editor):
+    """
+    Отмечает карточки с блоком кода в ответе одним запросом UPDATE
+    """
+    Card = apps.get_model('cards', 'Card')
+    Card.objects.filter(answer__contains='```').update(has_code=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0012_favorites'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='card',
+            name='has_code',
+            field=models.BooleanField(db_column='HasCode', default=False, editable=False, verbose_name='Есть код'),
+        ),
+        migrations.RunPython(fill_has_code, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='card',
+            index=models.Index(fields=['has_code', 'upload_date', 'id'], name='cards_code_upload_date_idx'),
+        ),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 4.2.9 on 2026-10-18 01:22
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+        ('cards', '0013_card_has_code'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryStats',
+            fields=[
+                ('cards_count', models.IntegerField(db_column='CardsCount', default=0, verbose_name='Карточек')),
+                ('views', models.IntegerField(db_column='Views', default=0, verbose_name='Просмотры')),
+                ('adds', models.IntegerField(db_column='Favorites', default=0, verbose_name='В избранном')),
+                ('views_rate', models.FloatField(db_column='ViewsRate', default=0, verbose_name='Просмотров в день')),
+                ('category', models.OneToOneField(db_column='CategoryID', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='cards.category', verbose_name='Категория')),
+            ],
+            options={
+                'verbose_name': 'Статистика категории',
+                'verbose_name_plural': 'Статистика категорий',
+                'db_table': 'CategoryStats',
+            },
+        ),
+        migrations.CreateModel(
+            name='StatsRefresh',
+            fields=[
+                ('id', models.AutoField(db_column='RefreshID', primary_key=True, serialize=False)),
+                ('refreshed_at', models.DateTimeField(db_column='RefreshedAt', verbose_name='Дата пересчета')),
+                ('cards', models.IntegerField(db_column='Cards', default=0, verbose_name='Карточек')),
+                ('duration', models.FloatField(db_column='Duration', default=0, verbose_name='Длительность (с)')),
+            ],
+            options={
+                'verbose_name': 'Пересчет статистики',
+                'verbose_name_plural': 'Пересчеты статистики',
+                'db_table': 'StatsRefreshes',
+            },
+        ),
+        migrations.CreateModel(
+            name='TagStats',
+            fields=[
+                ('cards_count', models.IntegerField(db_column='CardsCount', default=0, verbose_name='Карточек')),
+                ('views', models.IntegerField(db_column='Views', default=0, verbose_name='Просмотры')),
+                ('adds', models.IntegerField(db_column='Favorites', default=0, verbose_name='В избранном')),
+                ('views_rate', models.FloatField(db_column='ViewsRate', default=0, verbose_name='Просмотров в день')),
+                ('tag', models.OneToOneField(db_column='TagID', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='cards.tag', verbose_name='Тег')),
+            ],
+            options={
+                'verbose_name': 'Статистика тега',
+                'verbose_name_plural': 'Статистика тегов',
+                'db_table': 'TagStats',
+                'indexes': [models.Index(fields=['views', 'tag'], name='tag_stats_views_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='CardStats',
+            fields=[
+                ('card', models.OneToOneField(db_column='CardID', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='cards.card', verbose_name='Карточка')),
+                ('views', models.IntegerField(db_column='Views', default=0, verbose_name='Просмотры')),
+                ('adds', models.IntegerField(db_column='Favorites', default=0, verbose_name='В избранном')),
+                ('views_rate', models.FloatField(db_column='ViewsRate', default=0, verbose_name='Просмотров в день')),
+            ],
+            options={
+                'verbose_name': 'Статистика карточки',
+                'verbose_name_plural': 'Статистика карточек',
+                'db_table': 'CardStats',
+                'indexes': [models.Index(fields=['views', 'card'], name='card_stats_views_idx'), models.Index(fields=['adds', 'card'], name='card_stats_adds_idx'), models.Index(fields=['views_rate', 'card'], name='card_stats_rate_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='AuthorStats',
+            fields=[
+                ('cards_count', models.IntegerField(db_column='CardsCount', default=0, verbose_name='Карточек')),
+                ('views', models.IntegerField(db_column='Views', default=0, verbose_name='Просмотры')),
+                ('adds', models.IntegerField(db_column='Favorites', default=0, verbose_name='В избранном')),
+                ('views_rate', models.FloatField(db_column='ViewsRate', default=0, verbose_name='Просмотров в день')),
+                ('author', models.OneToOneField(db_column='UserID', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='card_stats', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+            ],
+            options={
+                'verbose_name': 'Статистика автора',
+                'verbose_name_plural': 'Статистика авторов',
+                'db_table': 'AuthorStats',
+                'indexes': [models.Index(fields=['views', 'author'], name='author_stats_views_idx')],
+            },
+        ),
+    ]
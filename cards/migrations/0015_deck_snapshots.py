@@ -0,0 +1,32 @@
+# Generated by Django 4.2.9 on 2026-10-18 01:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cards', '0014_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeckSnapshot',
+            fields=[
+                ('id', models.AutoField(db_column='SnapshotID', primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('category', 'Категория'), ('tag', 'Тег')], db_column='Kind', max_length=10, verbose_name='Тип колоды')),
+                ('object_id', models.IntegerField(db_column='ObjectID', verbose_name='ID категории или тега')),
+                ('built_at', models.DateTimeField(db_column='BuiltAt', verbose_name='Дата сборки')),
+                ('file_name', models.CharField(blank=True, db_column='FileName', max_length=100, verbose_name='Файл')),
+                ('cards', models.IntegerField(db_column='Cards', default=0, verbose_name='Карточек')),
+                ('size', models.IntegerField(db_column='Size', default=0, verbose_name='Размер (байт)')),
+                ('sha1', models.CharField(blank=True, db_column='SHA1', max_length=40, verbose_name='Контрольная сумма')),
+            ],
+            options={
+                'verbose_name': 'Снимок колоды',
+                'verbose_name_plural': 'Снимки колод',
+                'db_table': 'DeckSnapshots',
+                'indexes': [models.Index(fields=['kind', 'object_id', 'id'], name='deck_snapshots_deck_idx')],
+            },
+        ),
+    ]
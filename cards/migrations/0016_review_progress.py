@@ -0,0 +1,41 @@
+# Generated by Django 4.2.9 on 2026-10-18 01:55
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max
+import django.db.models.deletion
+
+
+def fill_review_progress(apps, schema_editor):
+    """
+    Позиция в очереди новых карточек у пользователей с историей повторений - наибольший id изученной карточки
+    """
+    CardReview = apps.get_model('cards', 'CardReview')
+    ReviewProgress = apps.get_model('cards', 'ReviewProgress')
+    progress = CardReview.objects.order_by().values('user_id').annotate(cursor=Max('card_id'))
+    ReviewProgress.objects.bulk_create([ReviewProgress(user_id=row['user_id'], new_cards_cursor=row['cursor'])
+                                        for row in progress], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+        ('cards', '0015_deck_snapshots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReviewProgress',
+            fields=[
+                ('user', models.OneToOneField(db_column='UserID', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='review_progress', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('new_cards_cursor', models.IntegerField(db_column='NewCardsCursor', default=0, verbose_name='Последняя изученная новая карточка')),
+            ],
+            options={
+                'verbose_name': 'Очередь новых карточек',
+                'verbose_name_plural': 'Очереди новых карточек',
+                'db_table': 'ReviewProgress',
+            },
+        ),
+        migrations.RunPython(fill_review_progress, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,49 @@
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.db.models.functions import Coalesce
+from django.urls import reverse
+from django.utils.safestring import mark_safe
+from django.utils.text import slugify
+
+from .rendering import contains_code, content_hash, render_markdown, truncate_answer
+
+
+def tags_prefetch():
+    """
+    Загрузка тегов карточек для списков (только id и имя тега)
+    """
+    return models.Prefetch('tags', queryset=Tag.objects.only('id', 'name'))
+
+
+class CardQuerySet(models.QuerySet):
+    # поля, необходимые для краткого представления карточки (card_preview.html),
+    # полный текст ответа и его HTML не загружаются
+    LISTING_FIELDS = ('id', 'question', 'upload_date', 'updated_at', 'views', 'adds', 'status',
+                      'answer_preview_html', 'answer_hash', 'category__id', 'category__name', 'category__slug',
+                      'author__id', 'author__username')
+
+    def for_listing(self):
+        """
+        Метод возвращает карточки для списков (каталог, карточки по тегу, карточки пользователя)
+        с категорией, автором и тегами, загруженными фиксированным числом запросов
+        """
+        return (self.select_related('category', 'author').prefetch_related(tags_prefetch()).only(*self.LISTING_FIELDS)
+                # текст ответа загружается только для карточек без готового HTML (например, из фикстуры
+                # до render_answers): краткий ответ для них строится без отдельного запроса на карточку
+                .annotate(unrendered_answer=models.Case(models.When(answer_hash='', then='answer'),
+                                                        default=models.Value(''), output_field=models.TextField())))
+
+    def with_favorites(self, user):
+        """
+        Метод добавляет к карточкам признак is_favorite - в избранном ли карточка у пользователя.
+        Признак вычисляется в том же запросе (EXISTS по уникальному индексу Favorites(UserID, CardID)),
+        поэтому отметка избранного в списке карточек не требует запроса на каждую карточку
+        :param user: пользователь (для анонимного посетителя признак всегда False)
+        """
+        if not user.is_authenticated:
+            return self.annotate(is_favorite=models.Value(False))
+        return self.annotate(is_favorite=models.Exists(
+            Favorite.objects.filter(user=user, card=models.OuterRef('pk'))))
 
 
 class Card(models.Model):
@@ -12,6 +56,8 @@ class Card(models.Model):
     answer = models.TextField(max_length=5000, db_column='Answer', verbose_name='Ответ')
     category = models.ForeignKey('Category', on_delete=models.CASCADE, db_column='CategoryID', verbose_name='Категория')
     upload_date = models.DateTimeField(auto_now_add=True, db_column='UploadDate', verbose_name='Дата публикации')
+    # время последнего изменения карточки или ее тегов - версия для кеша фрагментов шаблона (cards/page_cache.py)
+    updated_at = models.DateTimeField(auto_now=True, db_column='UpdatedAt', verbose_name='Дата изменения')
     views = models.IntegerField(default=0, db_column='Views', verbose_name='Просмотры')
     adds = models.IntegerField(default=0, db_column='Favorites', verbose_name='В избранном')
     tags = models.ManyToManyField('Tag', through='CardTag', related_name='cards', verbose_name='Теги')
@@ -21,27 +67,124 @@ class Card(models.Model):
     # в таблице Cards добавляется поле author_id
     author = models.ForeignKey(get_user_model(), on_delete=models.SET_NULL, related_name='cards', null=True,
                                default=None, verbose_name='Автор')
+    # HTML ответа, заранее преобразованный из Markdown (обновляется в save() только при изменении ответа)
+    answer_html = models.TextField(blank=True, default='', editable=False, db_column='AnswerHTML',
+                                   verbose_name='Ответ в HTML')
+    answer_preview_html = models.TextField(blank=True, default='', editable=False, db_column='AnswerPreviewHTML',
+                                           verbose_name='Краткий ответ в HTML')
+    # хеш исходного текста ответа, по которому был построен HTML
+    answer_hash = models.CharField(max_length=40, blank=True, default='', editable=False, db_column='AnswerHash',
+                                   verbose_name='Хеш ответа')
+    # есть ли в ответе блок кода (обновляется в save() вместе с HTML ответа) - для фильтра и колонки админ-панели
+    has_code = models.BooleanField(default=False, editable=False, db_column='HasCode', verbose_name='Есть код')
+
+    objects = CardQuerySet.as_manager()
 
     class Meta:
         db_table = 'Cards'  # имя таблицы в базе данных
         verbose_name = 'Карточка'  # имя в единственном числе для администратора
         verbose_name_plural = 'Карточки'  # имя во множественном числе для администратора
+        # составные индексы (поле сортировки, id) для сортировок из реестра cards/sorting.py
+        # и курсорной навигации, а также те же сортировки внутри категории и по статусу проверки
+        indexes = [
+            models.Index(fields=['upload_date', 'id'], name='cards_upload_date_id_idx'),
+            models.Index(fields=['views', 'id'], name='cards_views_id_idx'),
+            models.Index(fields=['adds', 'id'], name='cards_adds_id_idx'),
+            models.Index(fields=['category', 'upload_date', 'id'], name='cards_cat_upload_date_idx'),
+            models.Index(fields=['category', 'views', 'id'], name='cards_cat_views_idx'),
+            models.Index(fields=['category', 'adds', 'id'], name='cards_cat_adds_idx'),
+            models.Index(fields=['status', 'upload_date', 'id'], name='cards_status_upload_date_idx'),
+            models.Index(fields=['has_code', 'upload_date', 'id'], name='cards_code_upload_date_idx'),
+        ]
 
     def __str__(self):
-        return f'Карточка {self.question} - {self.answer[:50]}'
+        # только вопрос: в списках админ-панели ответ не загружается, и str(card) не должен выполнять запрос
+        return f'Карточка {self.question}'
 
     def get_absolute_url(self):
         return f'/cards/{self.id}/detail/'
 
+    def render_answer(self, force=False):
+        """
+        Метод обновляет HTML ответа, если текст ответа изменился с момента последнего преобразования
+        :param force: преобразовать ответ заново даже без изменений
+        :return: True, если HTML был обновлен
+        """
+        answer_hash = content_hash(self.answer)
+        if not force and answer_hash == self.answer_hash:
+            return False
+        self.answer_html = render_markdown(self.answer)
+        self.answer_preview_html = render_markdown(truncate_answer(self.answer))
+        self.answer_hash = answer_hash
+        return True
+
+    def save(self, *args, **kwargs):
+        """
+        Метод сохранения карточки с обновлением HTML ответа и признака кода при изменении ответа
+        """
+        update_fields = kwargs.get('update_fields')
+        # отложенный ответ (например, в списке админ-панели) не загружался, значит, и не изменился
+        answer_loaded = 'answer' not in self.get_deferred_fields()
+        if answer_loaded if update_fields is None else 'answer' in update_fields:
+            self.has_code = contains_code(self.answer)
+            rendered = self.render_answer()
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'has_code'}
+                if rendered:
+                    kwargs['update_fields'] |= {'answer_html', 'answer_preview_html', 'answer_hash'}
+        super().save(*args, **kwargs)
+
+    def get_answer_html(self):
+        """
+        HTML полного ответа. Для карточек, которые еще не были преобразованы
+        (например, загружены фикстурой), HTML строится на лету через кеш
+        """
+        if self.answer_hash:
+            return mark_safe(self.answer_html)
+        return mark_safe(render_markdown(self.answer))
+
+    def get_answer_preview_html(self):
+        """
+        HTML обрезанного ответа для краткого представления карточки
+        """
+        if self.answer_hash:
+            return mark_safe(self.answer_preview_html)
+        # в списках (CardQuerySet.for_listing) ответ загружен аннотацией, поле answer отложено
+        answer = self.unrendered_answer if hasattr(self, 'unrendered_answer') else self.answer
+        return mark_safe(render_markdown(truncate_answer(answer)))
+
+
+class TagQuerySet(models.QuerySet):
+    def refresh_counts(self):
+        """
+        Метод пересчитывает количество карточек у тегов QuerySet одним запросом UPDATE
+        (подзапрос по индексу CardTags(TagID, CardID))
+        :return: количество обновленных тегов
+        """
+        cards_count = (CardTag.objects.filter(tag=models.OuterRef('pk')).order_by()
+                       .values('tag').annotate(count=models.Count('pk')).values('count'))
+        return self.update(cards_count=Coalesce(models.Subquery(cards_count), 0))
+
 
 class Tag(models.Model):
     id = models.AutoField(primary_key=True, db_column='TagID')
-    name = models.CharField(max_length=100, db_column='Name')
+    # уникальный индекс по имени используется при поиске и массовом создании тегов
+    name = models.CharField(max_length=100, unique=True, db_column='Name')
+    # количество карточек с тегом (денормализовано для облака тегов и навигации по тегам,
+    # обновляется при изменении связей CardTag - cards/signals.py, CardForm, импорт колоды)
+    cards_count = models.IntegerField(default=0, editable=False, db_column='CardsCount',
+                                      verbose_name='Количество карточек')
+
+    objects = TagQuerySet.as_manager()
 
     class Meta:
         db_table = 'Tags'  # имя таблицы в базе данных
         verbose_name = 'Тег'
         verbose_name_plural = 'Теги'
+        # индекс для облака тегов (самые популярные теги)
+        indexes = [
+            models.Index(fields=['cards_count', 'id'], name='tags_cards_count_idx'),
+        ]
 
     def __str__(self):
         return f'Тег {self.name}'
@@ -59,14 +202,42 @@ class CardTag(models.Model):
 
         # уникальность пары тега и карточки
         unique_together = ('card', 'tag')
+        # уникальный индекс (CardID, TagID) не помогает при выборке карточек по тегу,
+        # для навигации по тегам и пересечения тегов нужен обратный индекс (TagID, CardID)
+        indexes = [
+            models.Index(fields=['tag', 'card'], name='card_tags_tag_card_idx'),
+        ]
 
     def __str__(self):
-        return f'Тег {self.tag.name} и карточка {self.card.question}'
+        # по идентификаторам, как у повторений и избранного: страница подтверждения удаления карточек
+        # показывает все связи и не должна загружать тег и карточку для каждой
+        return f'Тег {self.tag_id} и карточка {self.card_id}'
+
+
+def unique_slug(name, taken):
+    """
+    Функция строит slug категории по имени, уникальный среди уже занятых
+    (например, для категорий general и General - general и general-2)
+    :param name: имя категории
+    :param taken: множество занятых slug, новый slug в него добавляется
+    :return: slug
+    """
+    base = slugify(name, allow_unicode=True)[:90] or 'category'
+    slug, number = base, 1
+    while slug in taken:
+        number += 1
+        slug = f'{base}-{number}'
+    taken.add(slug)
+    return slug
 
 
 class Category(models.Model):
     id = models.AutoField(primary_key=True, db_column='CategoryID')
     name = models.CharField(max_length=100, db_column='Name')
+    # адрес категории в каталоге (cards/categories/<slug>/), заполняется по имени при первом сохранении
+    # (сигнал pre_save в cards/signals.py - срабатывает и при загрузке фикстур)
+    slug = models.SlugField(max_length=100, unique=True, allow_unicode=True, db_column='Slug',
+                            verbose_name='Slug')
 
     class Meta:
         db_table = 'Categories'  # имя таблицы в базе данных
@@ -75,3 +246,214 @@ class Category(models.Model):
 
     def __str__(self):
         return f'{self.name}'
+
+    def get_absolute_url(self):
+        return reverse('category', kwargs={'slug': self.slug})
+
+
+class CardReview(models.Model):
+    """
+    Состояние интервального повторения карточки для конкретного пользователя
+    """
+    id = models.AutoField(primary_key=True, db_column='ReviewID')
+    user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE, related_name='card_reviews',
+                             db_column='UserID', verbose_name='Пользователь')
+    card = models.ForeignKey(Card, on_delete=models.CASCADE, related_name='reviews', db_column='CardID',
+                             verbose_name='Карточка')
+    ease = models.FloatField(default=2.5, db_column='Ease', verbose_name='Коэффициент легкости')
+    interval = models.IntegerField(default=0, db_column='Interval', verbose_name='Интервал (дней)')
+    repetitions = models.IntegerField(default=0, db_column='Repetitions', verbose_name='Успешных повторений подряд')
+    lapses = models.IntegerField(default=0, db_column='Lapses', verbose_name='Забываний')
+    due = models.DateTimeField(db_column='Due', verbose_name='Дата следующего повторения')
+    last_reviewed = models.DateTimeField(null=True, blank=True, db_column='LastReviewed',
+                                         verbose_name='Дата последнего повторения')
+
+    class Meta:
+        db_table = 'CardReviews'
+        verbose_name = 'Повторение карточки'
+        verbose_name_plural = 'Повторения карточек'
+
+        unique_together = ('user', 'card')
+        # индекс для выборки ближайших к повторению карточек пользователя без просмотра всей истории
+        indexes = [
+            models.Index(fields=['user', 'due'], name='card_reviews_user_due_idx'),
+        ]
+
+    def __str__(self):
+        return f'Повторение карточки {self.card_id} пользователем {self.user_id}'
+
+
+class ReviewProgress(models.Model):
+    """
+    Позиция пользователя в очереди новых карточек: новые карточки выдаются по возрастанию id, и id последней
+    изученной из них хранится здесь, чтобы следующие новые карточки выбирались условием CardID > позиции
+    по первичному ключу, а не проверкой всех уже изученных карточек
+    """
+    user = models.OneToOneField(get_user_model(), on_delete=models.CASCADE, primary_key=True,
+                                related_name='review_progress', db_column='UserID', verbose_name='Пользователь')
+    new_cards_cursor = models.IntegerField(default=0, db_column='NewCardsCursor',
+                                           verbose_name='Последняя изученная новая карточка')
+
+    class Meta:
+        db_table = 'ReviewProgress'
+        verbose_name = 'Очередь новых карточек'
+        verbose_name_plural = 'Очереди новых карточек'
+
+    def __str__(self):
+        return f'Новые карточки пользователя {self.user_id} после {self.new_cards_cursor}'
+
+
+class Favorite(models.Model):
+    """
+    Карточка в избранном у пользователя. Количество добавлений в избранное денормализовано в Card.adds
+    и изменяется в той же транзакции, что и эта таблица (cards/views.py: add_favorite, remove_favorite)
+    """
+    id = models.AutoField(primary_key=True, db_column='FavoriteID')
+    user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE, related_name='favorites',
+                             db_column='UserID', verbose_name='Пользователь')
+    card = models.ForeignKey(Card, on_delete=models.CASCADE, related_name='favorited_by', db_column='CardID',
+                             verbose_name='Карточка')
+    created_at = models.DateTimeField(auto_now_add=True, db_column='CreatedAt', verbose_name='Дата добавления')
+
+    class Meta:
+        db_table = 'Favorites'
+        verbose_name = 'Избранная карточка'
+        verbose_name_plural = 'Избранные карточки'
+
+        # уникальный индекс (UserID, CardID) - и защита от повторного добавления, и проверка "в избранном ли"
+        unique_together = ('user', 'card')
+        # индекс для списка избранного пользователя (последние добавленные - первыми)
+        indexes = [
+            models.Index(fields=['user', 'created_at', 'id'], name='favorites_user_created_idx'),
+        ]
+
+    def __str__(self):
+        return f'Карточка {self.card_id} в избранном у пользователя {self.user_id}'
+
+
+# Сводные таблицы статистики (cards/stats.py). Заполняются командой refresh_stats, страницы рейтингов
+# читают только их и не выполняют группировок по таблице карточек
+
+class StatsRefresh(models.Model):
+    """
+    Запись о пересчете статистики. Идентификатор последней записи - версия закешированных рейтингов
+    """
+    id = models.AutoField(primary_key=True, db_column='RefreshID')
+    refreshed_at = models.DateTimeField(db_column='RefreshedAt', verbose_name='Дата пересчета')
+    cards = models.IntegerField(default=0, db_column='Cards', verbose_name='Карточек')
+    duration = models.FloatField(default=0, db_column='Duration', verbose_name='Длительность (с)')
+
+    class Meta:
+        db_table = 'StatsRefreshes'
+        verbose_name = 'Пересчет статистики'
+        verbose_name_plural = 'Пересчеты статистики'
+
+    def __str__(self):
+        return f'Пересчет статистики {self.refreshed_at:%Y-%m-%d %H:%M}'
+
+
+class CardStats(models.Model):
+    """
+    Статистика карточки на момент последнего пересчета
+    """
+    card = models.OneToOneField(Card, on_delete=models.CASCADE, primary_key=True, related_name='stats',
+                                db_column='CardID', verbose_name='Карточка')
+    views = models.IntegerField(default=0, db_column='Views', verbose_name='Просмотры')
+    adds = models.IntegerField(default=0, db_column='Favorites', verbose_name='В избранном')
+    # скользящая средняя просмотров в день с затуханием (период полураспада - STATS_HALF_LIFE в cards/stats.py)
+    views_rate = models.FloatField(default=0, db_column='ViewsRate', verbose_name='Просмотров в день')
+
+    class Meta:
+        db_table = 'CardStats'
+        verbose_name = 'Статистика карточки'
+        verbose_name_plural = 'Статистика карточек'
+        # индексы для рейтингов карточек
+        indexes = [
+            models.Index(fields=['views', 'card'], name='card_stats_views_idx'),
+            models.Index(fields=['adds', 'card'], name='card_stats_adds_idx'),
+            models.Index(fields=['views_rate', 'card'], name='card_stats_rate_idx'),
+        ]
+
+    def __str__(self):
+        return f'Статистика карточки {self.card_id}'
+
+
+class SummaryStats(models.Model):
+    """
+    Общие поля сводной статистики по группе карточек (категория, тег, автор)
+    """
+    cards_count = models.IntegerField(default=0, db_column='CardsCount', verbose_name='Карточек')
+    views = models.IntegerField(default=0, db_column='Views', verbose_name='Просмотры')
+    adds = models.IntegerField(default=0, db_column='Favorites', verbose_name='В избранном')
+    views_rate = models.FloatField(default=0, db_column='ViewsRate', verbose_name='Просмотров в день')
+
+    class Meta:
+        abstract = True
+
+
+class CategoryStats(SummaryStats):
+    category = models.OneToOneField(Category, on_delete=models.CASCADE, primary_key=True, related_name='stats',
+                                    db_column='CategoryID', verbose_name='Категория')
+
+    class Meta:
+        db_table = 'CategoryStats'
+        verbose_name = 'Статистика категории'
+        verbose_name_plural = 'Статистика категорий'
+
+
+class TagStats(SummaryStats):
+    tag = models.OneToOneField(Tag, on_delete=models.CASCADE, primary_key=True, related_name='stats',
+                               db_column='TagID', verbose_name='Тег')
+
+    class Meta:
+        db_table = 'TagStats'
+        verbose_name = 'Статистика тега'
+        verbose_name_plural = 'Статистика тегов'
+        indexes = [
+            models.Index(fields=['views', 'tag'], name='tag_stats_views_idx'),
+        ]
+
+
+class AuthorStats(SummaryStats):
+    author = models.OneToOneField(get_user_model(), on_delete=models.CASCADE, primary_key=True,
+                                  related_name='card_stats', db_column='UserID', verbose_name='Автор')
+
+    class Meta:
+        db_table = 'AuthorStats'
+        verbose_name = 'Статистика автора'
+        verbose_name_plural = 'Статистика авторов'
+        indexes = [
+            models.Index(fields=['views', 'author'], name='author_stats_views_idx'),
+        ]
+
+
+class DeckSnapshot(models.Model):
+    """
+    Снимок колоды (карточек категории или тега) для офлайн-повторения - сжатый JSON-файл в SNAPSHOTS_ROOT
+    (cards/snapshots.py). Идентификатор снимка - версия колоды, от которой клиент запрашивает изменения
+    """
+    class Kind(models.TextChoices):
+        CATEGORY = 'category', 'Категория'
+        TAG = 'tag', 'Тег'
+
+    id = models.AutoField(primary_key=True, db_column='SnapshotID')
+    kind = models.CharField(max_length=10, choices=Kind.choices, db_column='Kind', verbose_name='Тип колоды')
+    # id категории или тега без внешнего ключа: файлы снимков удаленной колоды удаляет команда build_snapshots
+    object_id = models.IntegerField(db_column='ObjectID', verbose_name='ID категории или тега')
+    built_at = models.DateTimeField(db_column='BuiltAt', verbose_name='Дата сборки')
+    file_name = models.CharField(max_length=100, blank=True, db_column='FileName', verbose_name='Файл')
+    cards = models.IntegerField(default=0, db_column='Cards', verbose_name='Карточек')
+    size = models.IntegerField(default=0, db_column='Size', verbose_name='Размер (байт)')
+    sha1 = models.CharField(max_length=40, blank=True, db_column='SHA1', verbose_name='Контрольная сумма')
+
+    class Meta:
+        db_table = 'DeckSnapshots'
+        verbose_name = 'Снимок колоды'
+        verbose_name_plural = 'Снимки колод'
+        indexes = [
+            # последний снимок колоды
+            models.Index(fields=['kind', 'object_id', 'id'], name='deck_snapshots_deck_idx'),
+        ]
+
+    def __str__(self):
+        return f'Снимок {self.kind} {self.object_id} v{self.pk}'
@@ -0,0 +1,123 @@
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.core.cache import cache
+from django.db import transaction
+
+from .rendering import content_hash
+
+# Кеширование страниц каталога для анонимных пользователей.
+# Ключ страницы составляется из значимых параметров запроса (сортировка, направление, поисковый запрос,
+# страница), поэтому лишние GET-параметры не создают новых записей в кеше, и из версии каталога.
+# Версия увеличивается сигналами при любом изменении карточек, тегов и их связей (cards/signals.py),
+# после чего все закешированные страницы перестают использоваться и со временем вытесняются.
+# Версия хранится в том же кеше, что и страницы, поэтому при нескольких процессах кеш должен быть общим
+# (CACHE_BACKEND=sqlite, redis или memcached; проверка cards.W001): в кеше памяти процесса изменение
+# в одном воркере не сбрасывает страницы других. Начальная версия - текущее время в наносекундах,
+# а не 1: если ключ версии вытеснен или кеш очищен, новая версия больше всех прежних
+# (каждое изменение прибавляет 1), и страницы, сохраненные по старым версиям, не используются снова.
+# Для авторизованных пользователей страница собирается заново, но краткие представления карточек
+# берутся из кеша фрагментов шаблона по версии карточки (Card.updated_at, см. card_preview.html).
+
+CATALOG_VERSION_KEY = 'catalog_version'
+PAGE_CACHE_TIMEOUT = 60 * 15
+
+
+def initial_catalog_version() -> int:
+    return time.time_ns()
+
+
+def get_catalog_version() -> int:
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, initial_catalog_version(), timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY) or initial_catalog_version()
+    return version
+
+
+def bump_catalog_version(using=None):
+    """
+    Увеличивает версию каталога после фиксации текущей транзакции
+    """
+    transaction.on_commit(_bump_catalog_version, using=using)
+
+
+def _bump_catalog_version():
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        # версии нет в кеше (вытеснена): новая начальная версия больше всех прежних
+        cache.add(CATALOG_VERSION_KEY, initial_catalog_version(), timeout=None)
+
+
+def page_cache_key(name, params) -> str:
+    return f'page:{name}:{get_catalog_version()}:{content_hash(repr(params))}'
+
+
+def is_cacheable(response) -> bool:
+    # ответы с cookie (сессия, CSRF) относятся к конкретному посетителю и не кешируются
+    return response.status_code == 200 and not response.cookies
+
+
+def cache_for_anonymous(name, key_params, timeout=PAGE_CACHE_TIMEOUT, on_hit=None):
+    """
+    Декоратор представления: кеширует ответы 200 на GET-запросы анонимных пользователей.
+    Подходит и для асинхронных представлений (cards/async_views.py)
+    :param name: имя страницы в ключе кеша
+    :param key_params: функция (request, *args, **kwargs), возвращающая значимые параметры запроса
+    :param timeout: время хранения страницы в кеше
+    :param on_hit: функция (request, *args, **kwargs), вызываемая при ответе из кеша
+        (например, для учета просмотра карточки)
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            return _cache_async_view(view, name, key_params, timeout, on_hit)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'GET' or request.user.is_authenticated:
+                return view(request, *args, **kwargs)
+
+            key = page_cache_key(name, key_params(request, *args, **kwargs))
+            response = cache.get(key)
+            if response is not None:
+                if on_hit is not None:
+                    on_hit(request, *args, **kwargs)
+                return response
+
+            def store(rendered):
+                if is_cacheable(rendered):
+                    cache.set(key, rendered, timeout)
+
+            response = view(request, *args, **kwargs)
+            if response.streaming:
+                return response
+            if hasattr(response, 'render') and callable(response.render):
+                response.add_post_render_callback(store)
+            else:
+                store(response)
+            return response
+        return wrapper
+    return decorator
+
+
+def _cache_async_view(view, name, key_params, timeout, on_hit):
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        # пользователь загружается из сессии запросом к БД, поэтому проверяем его в потоке
+        if request.method != 'GET' or await sync_to_async(lambda: request.user.is_authenticated)():
+            return await view(request, *args, **kwargs)
+
+        key = await sync_to_async(page_cache_key)(name, key_params(request, *args, **kwargs))
+        response = await cache.aget(key)
+        if response is not None:
+            if on_hit is not None:
+                await sync_to_async(on_hit)(request, *args, **kwargs)
+            return response
+
+        response = await view(request, *args, **kwargs)
+        if not response.streaming and is_cacheable(response):
+            await cache.aset(key, response, timeout)
+        return response
+    return wrapper
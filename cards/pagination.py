@@ -0,0 +1,149 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from django.core.paginator import Paginator
+from django.db import models
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+# Пагинация каталога.
+# CachedCountPaginator - обычная постраничная навигация, но общее количество берется из кеша/счетчика,
+# а не считается COUNT(*) по запросу на каждой странице.
+# paginate_keyset - курсорная (keyset) навигация по паре (поле сортировки, id): следующая страница
+# выбирается условием WHERE по индексу, поэтому страница N стоит столько же, сколько первая.
+
+# допустимые значения целых чисел в курсоре (INTEGER SQLite)
+MIN_INTEGER = -2 ** 63
+MAX_INTEGER = 2 ** 63 - 1
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Paginator, получающий общее количество объектов из переданной функции (например, из счетчика в кеше)
+    """
+
+    def __init__(self, object_list, per_page, count_func=None, **kwargs):
+        """
+        :param count_func: функция без аргументов, возвращающая количество объектов
+        """
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_func = count_func
+
+    @cached_property
+    def count(self):
+        if self.count_func is not None:
+            return self.count_func()
+        return super().count
+
+
+def encode_cursor(value, pk, direction='next') -> str:
+    """
+    Кодирует позицию в списке в строку для GET-параметра cursor
+    :param value: значение поля сортировки последней (или первой) карточки на странице
+    :param pk: id этой карточки
+    :param direction: 'next' - карточки после позиции, 'prev' - карточки перед позицией
+    """
+    if isinstance(value, datetime):
+        value = {'dt': value.isoformat()}
+    payload = json.dumps([value, pk, direction], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def is_integer(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool) and MIN_INTEGER <= value <= MAX_INTEGER
+
+
+def cursor_value_type(queryset, field):
+    """
+    Функция возвращает тип значения поля сортировки в курсоре: datetime для даты, int для целого поля
+    """
+    model_field = queryset.model._meta.get_field(field)
+    if isinstance(model_field, models.DateTimeField):
+        return datetime
+    if isinstance(model_field, models.IntegerField):
+        return int
+    return str
+
+
+def decode_cursor(cursor: str, value_type=None):
+    """
+    Декодирует курсор. Для некорректного курсора возвращает None (показывается первая страница)
+    :param value_type: ожидаемый тип значения поля сортировки (None - не проверять). Курсор другой сортировки
+    или подделанный курсор со значением другого типа считается некорректным
+    :return: (значение поля, id, направление) или None
+    """
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        value, pk, direction = json.loads(payload)
+        if isinstance(value, dict):
+            value = datetime.fromisoformat(value['dt'])
+        if value_type is int:
+            valid_value = is_integer(value)
+        else:
+            valid_value = value_type is None or isinstance(value, value_type)
+        if not valid_value or not is_integer(pk) or direction not in ('next', 'prev'):
+            return None
+        return value, pk, direction
+    except (ValueError, TypeError, KeyError, binascii.Error):
+        return None
+
+
+class KeysetPage:
+    """
+    Страница курсорной навигации
+    """
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def paginate_keyset(queryset, field, descending, cursor, per_page) -> KeysetPage:
+    """
+    Возвращает страницу карточек после (или перед) позицией курсора.
+    Для быстрой работы нужен составной индекс (field, id)
+    :param queryset: QuerySet без сортировки
+    :param field: поле сортировки
+    :param descending: сортировка по убыванию
+    :param cursor: строка курсора из GET-запроса (или пустая для первой страницы)
+    :param per_page: количество карточек на странице
+    """
+    position = decode_cursor(cursor, cursor_value_type(queryset, field)) if cursor else None
+    backwards = position is not None and position[2] == 'prev'
+    # при движении назад выбираем в обратном порядке и затем разворачиваем страницу
+    reverse = descending != backwards
+
+    if position is not None:
+        value, pk = position[0], position[1]
+        lookup = 'lt' if reverse else 'gt'
+        queryset = queryset.filter(Q(**{f'{field}__{lookup}': value}) | Q(**{field: value, f'pk__{lookup}': pk}))
+
+    ordering = [f'-{field}', '-pk'] if reverse else [field, 'pk']
+    rows = list(queryset.order_by(*ordering)[:per_page + 1])
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    if not rows:
+        return KeysetPage(rows)
+    first, last = rows[0], rows[-1]
+    next_cursor = encode_cursor(getattr(last, field), last.pk) if (has_more or backwards) else None
+    previous_cursor = (encode_cursor(getattr(first, field), first.pk, 'prev')
+                       if (position is not None and (not backwards or has_more)) else None)
+    return KeysetPage(rows, next_cursor, previous_cursor)
@@ -0,0 +1,80 @@
+import hashlib
+import threading
+
+import markdown
+from django.core.cache import cache
+from django.utils.text import Truncator
+
+# Модуль преобразования Markdown в HTML.
+# Экземпляр Markdown с расширениями создается один раз на поток и переиспользуется (после каждого
+# преобразования вызывается reset()), а готовый HTML кешируется по хешу исходного текста.
+
+MARKDOWN_EXTENSIONS = ['extra', 'fenced_code', 'tables']
+# длина ответа в кратком представлении карточки (card_preview.html)
+PREVIEW_LENGTH = 100
+# начало и конец блока кода в Markdown
+CODE_FENCE = '```'
+# время хранения HTML в кеше, при переполнении кеша старые записи вытесняются бэкендом кеша
+CACHE_TIMEOUT = 60 * 60 * 24
+
+_local = threading.local()
+
+
+def content_hash(text: str) -> str:
+    """
+    Хеш исходного текста, по которому определяется, изменился ли ответ карточки
+    :param text: исходный текст в формате Markdown
+    :return: hex-строка sha1
+    """
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def contains_code(markdown_text: str) -> bool:
+    """
+    Есть ли в тексте блок кода Markdown (```)
+    :param markdown_text: текст в формате Markdown
+    """
+    return CODE_FENCE in markdown_text
+
+
+def _get_markdown() -> markdown.Markdown:
+    md = getattr(_local, 'markdown', None)
+    if md is None:
+        md = _local.markdown = markdown.Markdown(extensions=MARKDOWN_EXTENSIONS)
+    return md
+
+
+def convert(markdown_text: str) -> str:
+    """
+    Преобразует Markdown в HTML без кеширования, используя экземпляр Markdown текущего потока
+    :param markdown_text: текст в формате Markdown
+    :return: текст в формате HTML
+    """
+    md = _get_markdown()
+    try:
+        return md.convert(markdown_text)
+    finally:
+        md.reset()
+
+
+def render_markdown(markdown_text: str) -> str:
+    """
+    Преобразует Markdown в HTML с кешированием результата по хешу исходного текста
+    :param markdown_text: текст в формате Markdown
+    :return: текст в формате HTML
+    """
+    key = f'markdown:{content_hash(markdown_text)}'
+    html_content = cache.get(key)
+    if html_content is None:
+        html_content = convert(markdown_text)
+        cache.set(key, html_content, timeout=CACHE_TIMEOUT)
+    return html_content
+
+
+def truncate_answer(answer: str) -> str:
+    """
+    Обрезает ответ для краткого представления карточки так же, как фильтр truncatechars
+    :param answer: полный текст ответа
+    :return: обрезанный текст
+    """
+    return Truncator(answer).chars(PREVIEW_LENGTH)
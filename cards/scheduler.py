@@ -0,0 +1,60 @@
+from datetime import timedelta
+
+from django.db import models
+from django.utils import timezone
+
+# Планировщик интервального повторения по алгоритму SM-2.
+# Пользователь оценивает ответ одной из четырех кнопок, оценка переводится в качество ответа SM-2 (0-5).
+
+MIN_EASE = 1.3
+# через сколько минут показать карточку повторно, если ответ забыт
+RELEARN_DELAY = timedelta(minutes=10)
+
+
+class Grade(models.IntegerChoices):
+    AGAIN = 0, 'Снова'
+    HARD = 1, 'Трудно'
+    GOOD = 2, 'Хорошо'
+    EASY = 3, 'Легко'
+
+
+# качество ответа SM-2 для каждой оценки
+GRADE_QUALITY = {
+    Grade.AGAIN: 1,
+    Grade.HARD: 3,
+    Grade.GOOD: 4,
+    Grade.EASY: 5,
+}
+
+
+def schedule(review, grade, now=None):
+    """
+    Пересчитывает состояние повторения карточки после ответа пользователя (объект не сохраняется)
+    :param review: объект CardReview
+    :param grade: оценка ответа (Grade)
+    :param now: текущее время, по умолчанию timezone.now()
+    :return: обновленный объект CardReview
+    """
+    now = now or timezone.now()
+    quality = GRADE_QUALITY[Grade(grade)]
+
+    if quality < 3:
+        # ответ забыт: серия повторений начинается заново, карточка показывается снова через несколько минут
+        if review.repetitions:
+            review.lapses += 1
+        review.repetitions = 0
+        review.interval = 0
+        review.due = now + RELEARN_DELAY
+    else:
+        review.repetitions += 1
+        if review.repetitions == 1:
+            review.interval = 1
+        elif review.repetitions == 2:
+            review.interval = 6
+        else:
+            review.interval = max(review.interval + 1, round(review.interval * review.ease))
+        review.due = now + timedelta(days=review.interval)
+
+    review.ease = max(MIN_EASE, review.ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    review.last_reviewed = now
+    return review
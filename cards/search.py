@@ -0,0 +1,184 @@
+import re
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models.expressions import RawSQL
+
+# Модуль полнотекстового поиска по карточкам.
+# Индекс хранится в виртуальной таблице SQLite FTS5 (создается миграцией 0003_cards_search),
+# rowid строки индекса совпадает с CardID карточки.
+# Индексируются вопрос, ответ и названия тегов карточки.
+
+SEARCH_TABLE = 'CardsSearch'
+
+# веса колонок для ранжирования bm25: вопрос, ответ, теги
+RANK_WEIGHTS = (10.0, 1.0, 5.0)
+
+# выражение для выборки индексируемых данных карточки (теги склеиваются через пробел)
+_INDEX_SELECT = f"""
+    SELECT c."CardID", c."Question", c."Answer",
+           COALESCE((SELECT group_concat(t."Name", ' ')
+                     FROM "CardTags" ct JOIN "Tags" t ON t."TagID" = ct."TagID"
+                     WHERE ct."CardID" = c."CardID"), '')
+    FROM "Cards" c
+"""
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def build_match_query(search_query: str) -> str:
+    """
+    Преобразует пользовательский поисковый запрос в выражение MATCH для FTS5.
+    Каждое слово ищется по префиксу, все слова должны присутствовать в карточке
+    :param search_query: строка поиска, введенная пользователем
+    :return: выражение MATCH или пустая строка, если в запросе нет слов
+    """
+    tokens = _TOKEN_RE.findall(search_query.lower())
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def _chunks(ids, size=500):
+    ids = list(ids)
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def index_cards(card_ids, using: str = DEFAULT_DB_ALIAS) -> None:
+    """
+    Обновляет строки индекса для переданных карточек.
+    Удаленные карточки просто исчезают из индекса
+    :param card_ids: идентификаторы карточек
+    :param using: псевдоним базы данных
+    """
+    with connections[using].cursor() as cursor:
+        for chunk in _chunks(card_ids):
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(f'DELETE FROM "{SEARCH_TABLE}" WHERE rowid IN ({placeholders})', chunk)
+            cursor.execute(
+                f'INSERT INTO "{SEARCH_TABLE}" (rowid, question, answer, tags) '
+                f'{_INDEX_SELECT} WHERE c."CardID" IN ({placeholders})',
+                chunk,
+            )
+
+
+def remove_cards(card_ids, using: str = DEFAULT_DB_ALIAS) -> None:
+    """
+    Удаляет карточки из индекса
+    :param card_ids: идентификаторы карточек
+    :param using: псевдоним базы данных
+    """
+    with connections[using].cursor() as cursor:
+        for chunk in _chunks(card_ids):
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(f'DELETE FROM "{SEARCH_TABLE}" WHERE rowid IN ({placeholders})', chunk)
+
+
+def rebuild_index(using: str = DEFAULT_DB_ALIAS) -> int:
+    """
+    Полностью перестраивает индекс по всем карточкам
+    :param using: псевдоним базы данных
+    :return: количество проиндексированных карточек
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM "{SEARCH_TABLE}"')
+        cursor.execute(f'INSERT INTO "{SEARCH_TABLE}" (rowid, question, answer, tags) {_INDEX_SELECT}')
+        cursor.execute(f'INSERT INTO "{SEARCH_TABLE}" ("{SEARCH_TABLE}") VALUES (%s)', ['optimize'])
+        cursor.execute(f'SELECT count(*) FROM "{SEARCH_TABLE}"')
+        return cursor.fetchone()[0]
+
+
+def matching_ids_sql(search_query: str) -> tuple[str, list]:
+    """
+    Подзапрос с идентификаторами найденных карточек для фильтрации QuerySet
+    (например, Card.objects.filter(pk__in=RawSQL(*matching_ids_sql(query))))
+    :param search_query: строка поиска
+    :return: SQL подзапроса и его параметры
+    """
+    return f'SELECT rowid FROM "{SEARCH_TABLE}" WHERE "{SEARCH_TABLE}" MATCH %s', [build_match_query(search_query)]
+
+
+def filter_matching(queryset, search_query: str):
+    """
+    Ограничивает QuerySet карточками, найденными по индексу.
+    Запрос без слов (например, из одних знаков препинания) ничего не находит: пустое выражение MATCH
+    в FTS5 - синтаксическая ошибка
+    :param queryset: QuerySet карточек
+    :param search_query: строка поиска
+    """
+    if not build_match_query(search_query):
+        return queryset.none()
+    return queryset.filter(pk__in=RawSQL(*matching_ids_sql(search_query)))
+
+
+def rank_sql(search_query: str) -> tuple[str, list]:
+    """
+    Коррелированный подзапрос с релевантностью карточки (bm25, меньше - релевантнее) для аннотации QuerySet,
+    который уже ограничен найденными карточками (например, карточки категории)
+    :param search_query: строка поиска
+    :return: SQL подзапроса и его параметры
+    """
+    weights = ', '.join(str(weight) for weight in RANK_WEIGHTS)
+    return (f'SELECT bm25("{SEARCH_TABLE}", {weights}) FROM "{SEARCH_TABLE}" '
+            f'WHERE "{SEARCH_TABLE}" MATCH %s AND rowid = "Cards"."CardID"', [build_match_query(search_query)])
+
+
+class CardSearchResults:
+    """
+    Ленивая последовательность карточек, найденных по индексу и упорядоченных по релевантности.
+    Совместима с django.core.paginator.Paginator: количество и срез страницы
+    вычисляются отдельными запросами к индексу, карточки загружаются только для текущей страницы
+    """
+
+    def __init__(self, search_query: str, queryset):
+        """
+        :param search_query: строка поиска
+        :param queryset: базовый QuerySet карточек (select_related, prefetch_related и т.п.)
+        """
+        self.match = build_match_query(search_query)
+        self.queryset = queryset
+        self._count = None
+
+    def count(self) -> int:
+        if self._count is None:
+            if not self.match:
+                self._count = 0
+            else:
+                with connections[self.queryset.db].cursor() as cursor:
+                    cursor.execute(f'SELECT count(*) FROM "{SEARCH_TABLE}" WHERE "{SEARCH_TABLE}" MATCH %s',
+                                   [self.match])
+                    self._count = cursor.fetchone()[0]
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def ranked_ids(self, offset: int, limit: int) -> list[int]:
+        """
+        Идентификаторы карточек в порядке убывания релевантности
+        :param offset: смещение
+        :param limit: количество
+        """
+        if not self.match or limit <= 0:
+            return []
+        weights = ', '.join(str(weight) for weight in RANK_WEIGHTS)
+        with connections[self.queryset.db].cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM "{SEARCH_TABLE}" WHERE "{SEARCH_TABLE}" MATCH %s '
+                f'ORDER BY bm25("{SEARCH_TABLE}", {weights}) LIMIT %s OFFSET %s',
+                [self.match, limit, offset],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start = key.start or 0
+            stop = key.stop if key.stop is not None else self.count()
+            ids = self.ranked_ids(start, stop - start)
+            cards = self.queryset.in_bulk(ids)
+            return [cards[pk] for pk in ids if pk in cards]
+        ids = self.ranked_ids(key, 1)
+        if not ids:
+            raise IndexError(key)
+        return self.queryset.get(pk=ids[0])
+
+    def __iter__(self):
+        return iter(self[:])
@@ -0,0 +1,176 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import counters
+from .models import Card, CardTag, Category, Tag, unique_slug
+from .page_cache import bump_catalog_version
+from .rendering import contains_code
+from .search import index_cards, remove_cards
+
+
+# Синхронизация поискового индекса с карточками, тегами и их связями.
+# При загрузке фикстур (raw=True) индекс не обновляется, его нужно перестроить командой rebuild_search_index.
+# Вместе с индексом обновляется версия каталога для кеша страниц, а у карточек с измененными тегами -
+# дата изменения, по которой кешируются фрагменты card_preview.html (cards/page_cache.py).
+# У тегов, связи которых изменились, пересчитывается количество карточек (Tag.cards_count)
+
+def cards_changed(card_ids, using=None):
+    """
+    Обновляет поисковый индекс и дату изменения карточек, у которых изменились теги
+    :param card_ids: id карточек
+    :param using: псевдоним базы данных
+    """
+    card_ids = list(card_ids)
+    if card_ids:
+        index_cards(card_ids, using=using)
+        Card.objects.using(using).filter(pk__in=card_ids).update(updated_at=timezone.now())
+    bump_catalog_version(using=using)
+
+
+def tags_changed(tag_ids, using=None):
+    """
+    Пересчитывает количество карточек у тегов, связи которых изменились
+    :param tag_ids: id тегов
+    :param using: псевдоним базы данных
+    """
+    tag_ids = list(tag_ids)
+    if tag_ids:
+        Tag.objects.using(using).filter(pk__in=tag_ids).refresh_counts()
+
+
+@receiver(pre_save, sender=Card)
+def fill_fixture_fields(sender, instance, raw=False, **kwargs):
+    # при загрузке фикстур Card.save() и auto_now не вызываются, а в фикстурах, выгруженных до появления полей,
+    # нет даты изменения и признака кода
+    if not raw:
+        return
+    if instance.updated_at is None:
+        instance.updated_at = instance.upload_date or timezone.now()
+    instance.has_code = contains_code(instance.answer)
+
+
+@receiver(post_save, sender=Card)
+def index_saved_card(sender, instance, raw=False, using=None, **kwargs):
+    bump_catalog_version(using=using)
+    if not raw:
+        index_cards([instance.pk], using=using)
+
+
+@receiver(pre_delete, sender=Card)
+def remember_deleted_card_tags(sender, instance, **kwargs):
+    # связи CardTag удаляются каскадно без сигналов, запоминаем теги карточки до удаления
+    instance._deleted_tag_ids = list(instance.tags.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Card)
+def unindex_deleted_card(sender, instance, using=None, **kwargs):
+    remove_cards([instance.pk], using=using)
+    tags_changed(getattr(instance, '_deleted_tag_ids', []), using=using)
+    bump_catalog_version(using=using)
+
+
+@receiver(post_save, sender=CardTag)
+def index_card_tags(sender, instance, raw=False, using=None, **kwargs):
+    # количество карточек у тега пересчитывается и при загрузке фикстур
+    tags_changed([instance.tag_id], using=using)
+    if raw:
+        bump_catalog_version(using=using)
+    else:
+        cards_changed([instance.card_id], using=using)
+
+
+# Удаление связей CardTag отдельно не отслеживается, чтобы удаление по QuerySet оставалось одним DELETE.
+# Связи удаляются через card.tags.remove/clear (m2m_changed), CardForm.save (обновляет индекс и счетчики тегов сам)
+# или каскадно вместе с карточкой либо тегом
+
+@receiver(pre_delete, sender=Tag)
+def remember_deleted_tag_cards(sender, instance, **kwargs):
+    instance._deleted_card_ids = list(instance.cards.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+def index_deleted_tag_cards(sender, instance, using=None, **kwargs):
+    cards_changed(getattr(instance, '_deleted_card_ids', []), using=using)
+
+
+@receiver(m2m_changed, sender=Card.tags.through)
+def index_changed_card_tags(sender, instance, action, reverse, pk_set, using=None, **kwargs):
+    """
+    Обновляет индекс при изменении тегов через card.tags.add/remove/clear и tag.cards.add/remove/clear
+    """
+    if action == 'pre_clear' and reverse:
+        # после очистки связей уже не узнать, какие карточки были у тега
+        instance._cleared_card_ids = list(instance.cards.values_list('pk', flat=True))
+    elif action == 'pre_clear':
+        # и какие теги были у карточки
+        instance._cleared_tag_ids = list(instance.tags.values_list('pk', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        cards_changed([instance.pk], using=using)
+        tags_changed(getattr(instance, '_cleared_tag_ids', []) if action == 'post_clear' else pk_set or [],
+                     using=using)
+    elif action == 'post_clear':
+        cards_changed(getattr(instance, '_cleared_card_ids', []), using=using)
+        tags_changed([instance.pk], using=using)
+    else:
+        cards_changed(pk_set or [], using=using)
+        tags_changed([instance.pk], using=using)
+
+
+@receiver(post_save, sender=Tag)
+def index_renamed_tag(sender, instance, created, raw=False, using=None, **kwargs):
+    if not created and not raw:
+        cards_changed(instance.cards.values_list('pk', flat=True), using=using)
+
+
+@receiver(pre_save, sender=Category)
+def fill_category_slug(sender, instance, using=None, **kwargs):
+    # slug заполняется по имени и при загрузке фикстур без slug (raw=True)
+    if not instance.slug:
+        taken = set(Category.objects.using(using).exclude(pk=instance.pk).values_list('slug', flat=True))
+        instance.slug = unique_slug(instance.name, taken)
+
+
+@receiver(post_save, sender=Category)
+def touch_renamed_category_cards(sender, instance, created, raw=False, using=None, **kwargs):
+    # название категории входит в закешированные фрагменты карточек
+    if not created and not raw:
+        Card.objects.using(using).filter(category=instance).update(updated_at=timezone.now())
+        bump_catalog_version(using=using)
+
+
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def forget_deleted_user_favorites(sender, instance, using=None, **kwargs):
+    # избранное пользователя удаляется каскадно без сигналов, поэтому счетчики избранного (Card.adds)
+    # уменьшаются заранее одним UPDATE - в той же транзакции, что и удаление
+    Card.objects.using(using).filter(favorited_by__user=instance).update(adds=F('adds') - 1)
+
+
+# Счетчики карточек и пользователей для меню изменяются после фиксации транзакции,
+# чтобы откат не оставил в кеше лишние единицы
+
+def _adjust_counter(key, delta, using):
+    transaction.on_commit(lambda: counters.adjust(key, delta), using=using)
+
+
+@receiver(post_save, sender=Card, dispatch_uid='cards_count_on_save')
+@receiver(post_save, sender=settings.AUTH_USER_MODEL, dispatch_uid='users_count_on_save')
+def count_created(sender, instance, created, raw=False, using=None, **kwargs):
+    key = counters.CARDS_COUNT_KEY if sender is Card else counters.USERS_COUNT_KEY
+    if raw:
+        # при загрузке фикстур объект может как добавляться, так и перезаписываться - пересчитаем позже
+        counters.invalidate(key)
+    elif created:
+        _adjust_counter(key, 1, using)
+
+
+@receiver(post_delete, sender=Card, dispatch_uid='cards_count_on_delete')
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL, dispatch_uid='users_count_on_delete')
+def count_deleted(sender, instance, using=None, **kwargs):
+    key = counters.CARDS_COUNT_KEY if sender is Card else counters.USERS_COUNT_KEY
+    _adjust_counter(key, -1, using)
@@ -0,0 +1,209 @@
+import gzip
+import hashlib
+import json
+import os
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils import timezone
+
+from .models import Card, CardTag, Category, DeckSnapshot, Tag, tags_prefetch
+
+# Снимки колод для офлайн-повторения.
+# Колода - карточки категории или тега. Команда build_snapshots (периодически, например через cron) собирает
+# для каждой колоды сжатый gzip JSON-файл с вопросами, ответами и их готовым HTML в SNAPSHOTS_ROOT и запись
+# DeckSnapshot; идентификатор записи - версия колоды. Клиент один раз скачивает последний снимок, а затем
+# запрашивает только изменения от своей версии: измененные и добавленные карточки и id удаленных из колоды.
+# Изменения вычисляются сравнением двух файлов снимков, поэтому удаление карточки, перенос в другую категорию
+# и удаление тега не требуют отдельного журнала удалений.
+# Новый снимок собирается по предыдущему: заново загружаются только карточки, измененные после его сборки
+# (Card.updated_at) или добавленные в колоду; колода без изменений не пересобирается.
+
+# количество хранимых версий каждой колоды: от более старых версий клиент скачивает снимок целиком
+SNAPSHOT_KEEP = 10
+# запас при поиске измененных карточек: транзакция, начатая до сборки прошлого снимка, могла быть
+# зафиксирована после нее с более ранней датой изменения
+CHANGES_OVERLAP = timedelta(minutes=5)
+# время хранения изменений между двумя версиями в кеше (файлы версий не меняются)
+DELTA_TIMEOUT = 60 * 60 * 24
+BATCH_SIZE = 500
+
+
+def snapshots_root() -> Path:
+    return Path(settings.SNAPSHOTS_ROOT)
+
+
+def deck_kind(deck) -> str:
+    return DeckSnapshot.Kind.CATEGORY if isinstance(deck, Category) else DeckSnapshot.Kind.TAG
+
+
+def deck_cards(deck, using=DEFAULT_DB_ALIAS):
+    """
+    Карточки колоды: категории (индекс по CategoryID) или тега (через связи CardTag)
+    """
+    if isinstance(deck, Category):
+        return Card.objects.using(using).filter(category_id=deck.pk)
+    return Card.objects.using(using).filter(pk__in=CardTag.objects.using(using).filter(tag_id=deck.pk)
+                                            .values('card_id'))
+
+
+def latest_snapshot(deck, using=None):
+    return DeckSnapshot.objects.using(using).filter(kind=deck_kind(deck), object_id=deck.pk).order_by('-pk').first()
+
+
+def snapshot_card(card):
+    """
+    Карточка в снимке: вопрос, ответ в Markdown и готовый HTML ответа (клиенту не нужно преобразование Markdown)
+    """
+    return {
+        'id': card.pk,
+        'question': card.question,
+        'answer': card.answer,
+        'answer_html': card.get_answer_html(),
+        'category': card.category.name,
+        'tags': sorted(tag.name for tag in card.tags.all()),
+        'updated_at': card.updated_at.isoformat(),
+    }
+
+
+def load_cards(card_ids, using=DEFAULT_DB_ALIAS):
+    """
+    Генератор карточек снимка. Карточки загружаются порциями с категорией и тегами
+    """
+    card_ids = sorted(card_ids)
+    for start in range(0, len(card_ids), BATCH_SIZE):
+        cards = (Card.objects.using(using).filter(pk__in=card_ids[start:start + BATCH_SIZE])
+                 .select_related('category').prefetch_related(tags_prefetch()).defer('answer_preview_html'))
+        yield from map(snapshot_card, cards)
+
+
+def read_snapshot(snapshot) -> dict:
+    with gzip.open(snapshots_root() / snapshot.file_name, 'rt', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def write_snapshot(data, file_name):
+    """
+    Функция записывает снимок в файл (через временный файл, чтобы не отдать клиенту недописанный)
+    :return: размер файла и контрольная сумма SHA-1
+    """
+    # mtime=0: одинаковое содержимое дает одинаковый файл
+    content = gzip.compress(json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode(), mtime=0)
+    root = snapshots_root()
+    root.mkdir(parents=True, exist_ok=True)
+    temporary = root / f'{file_name}.tmp'
+    temporary.write_bytes(content)
+    os.replace(temporary, root / file_name)
+    return len(content), hashlib.sha1(content).hexdigest()
+
+
+def build_snapshot(deck, using=DEFAULT_DB_ALIAS, full=False):
+    """
+    Функция собирает новую версию снимка колоды по предыдущей версии
+    :param deck: категория или тег
+    :param using: псевдоним базы данных
+    :param full: собрать снимок заново, не используя предыдущую версию
+    :return: новый снимок (DeckSnapshot) или None, если колода не изменилась
+    """
+    now = timezone.now()
+    previous = latest_snapshot(deck, using=using)
+    base = None
+    if previous is not None and not full:
+        try:
+            base = {card['id']: card for card in read_snapshot(previous)['cards']}
+        except FileNotFoundError:
+            pass
+
+    with transaction.atomic(using=using):
+        card_ids = set(deck_cards(deck, using).values_list('pk', flat=True))
+        if base is None:
+            cards = {card['id']: card for card in load_cards(card_ids, using)}
+        else:
+            changed = set(deck_cards(deck, using).filter(updated_at__gt=previous.built_at - CHANGES_OVERLAP)
+                          .values_list('pk', flat=True)) | (card_ids - base.keys())
+            fresh = {card['id']: card for card in load_cards(changed, using)}
+            if card_ids == base.keys() and all(base[card_id] == card for card_id, card in fresh.items()):
+                return None
+            cards = {card_id: fresh[card_id] if card_id in fresh else base[card_id]
+                     for card_id in card_ids if card_id in fresh or card_id in base}
+
+        snapshot = DeckSnapshot.objects.using(using).create(kind=deck_kind(deck), object_id=deck.pk, built_at=now)
+        snapshot.file_name = f'{snapshot.kind}-{deck.pk}-{snapshot.pk}.json.gz'
+        data = {
+            'deck': {'kind': snapshot.kind, 'id': deck.pk, 'name': deck.name},
+            'version': snapshot.pk,
+            'built_at': now.isoformat(),
+            'cards': [cards[card_id] for card_id in sorted(cards)],
+        }
+        try:
+            snapshot.size, snapshot.sha1 = write_snapshot(data, snapshot.file_name)
+            snapshot.cards = len(cards)
+            snapshot.save(using=using, update_fields=['file_name', 'size', 'sha1', 'cards'])
+        except BaseException:
+            (snapshots_root() / snapshot.file_name).unlink(missing_ok=True)
+            raise
+        transaction.on_commit(lambda: prune_snapshots(snapshot.kind, deck.pk, using=using), using=using)
+    return snapshot
+
+
+def delete_snapshots(snapshots):
+    for snapshot in snapshots:
+        if snapshot.file_name:
+            (snapshots_root() / snapshot.file_name).unlink(missing_ok=True)
+        snapshot.delete()
+
+
+def prune_snapshots(kind, object_id, using=DEFAULT_DB_ALIAS, keep=SNAPSHOT_KEEP):
+    """
+    Функция удаляет версии колоды старше keep последних вместе с файлами
+    """
+    delete_snapshots(DeckSnapshot.objects.using(using).filter(kind=kind, object_id=object_id).order_by('-pk')[keep:])
+
+
+def build_snapshots(decks=None, using=DEFAULT_DB_ALIAS, full=False):
+    """
+    Функция собирает снимки изменившихся колод. По умолчанию - всех категорий и тегов с карточками
+    (и тегов, у которых уже есть снимки: клиенты должны узнать об удалении последних карточек);
+    снимки удаленных категорий и тегов удаляются
+    :param decks: категории и теги (None - все колоды)
+    :return: список собранных снимков
+    """
+    if decks is None:
+        snapshot_tags = (DeckSnapshot.objects.using(using).filter(kind=DeckSnapshot.Kind.TAG)
+                         .values_list('object_id', flat=True))
+        decks = [*Category.objects.using(using).order_by('pk'),
+                 *(Tag.objects.using(using).filter(cards_count__gt=0) | Tag.objects.using(using)
+                   .filter(pk__in=snapshot_tags)).order_by('pk')]
+        for kind, model in ((DeckSnapshot.Kind.CATEGORY, Category), (DeckSnapshot.Kind.TAG, Tag)):
+            delete_snapshots(DeckSnapshot.objects.using(using).filter(kind=kind).exclude(
+                object_id__in=model.objects.using(using).values('pk')))
+    return [snapshot for snapshot in (build_snapshot(deck, using=using, full=full) for deck in decks) if snapshot]
+
+
+def snapshot_delta(base, latest):
+    """
+    Функция возвращает изменения колоды между двумя версиями снимка (результат кешируется)
+    :param base: версия клиента (DeckSnapshot)
+    :param latest: последняя версия (DeckSnapshot)
+    :return: словарь, пригодный для JSON: измененные и добавленные карточки и id удаленных из колоды
+    """
+    key = f'snapshot_delta:{base.pk}:{latest.pk}'
+    delta = cache.get(key)
+    if delta is None:
+        data = read_snapshot(latest)
+        previous = read_snapshot(base) if base.pk != latest.pk else data
+        old = {card['id']: card for card in previous['cards']}
+        new_ids = {card['id'] for card in data['cards']}
+        delta = {
+            'deck': data['deck'],
+            'since': base.pk,
+            'version': latest.pk,
+            'built_at': data['built_at'],
+            'changed': [card for card in data['cards'] if old.get(card['id']) != card],
+            'deleted': sorted(old.keys() - new_ids),
+        }
+        cache.set(key, delta, timeout=DELTA_TIMEOUT)
+    return delta
@@ -0,0 +1,64 @@
+from dataclasses import dataclass
+
+# Реестр сортировок каталога.
+# Публичный ключ сортировки из GET-параметра sort сопоставляется с полем модели Card,
+# для каждого поля есть составной индекс (поле, id), а также (категория, поле, id) - см. Card.Meta.indexes.
+# Неизвестные ключи не доходят до order_by: вместо них используется сортировка по умолчанию.
+
+
+@dataclass(frozen=True)
+class SortOption:
+    # поле модели Card
+    field: str
+    # подпись радиокнопки в форме каталога
+    label: str
+
+
+CATALOG_SORTS = {
+    'upload_date': SortOption('upload_date', 'Дате публикации'),
+    'views': SortOption('views', 'Просмотрам'),
+    'favorites': SortOption('adds', 'Избранному'),
+}
+DEFAULT_SORT = 'upload_date'
+# сортировка по релевантности - только при поиске, порядок задает полнотекстовый индекс
+RANK_SORT = 'rank'
+
+ORDERS = ('desc', 'asc')
+DEFAULT_ORDER = 'desc'
+
+
+def resolve_sort(key, searching=False) -> str:
+    """
+    Функция проверяет ключ сортировки по реестру
+    :param key: ключ из GET-запроса (может быть None)
+    :param searching: выполняется ли поиск (тогда допустима и по умолчанию используется сортировка 'rank')
+    :return: допустимый ключ сортировки
+    """
+    if key in CATALOG_SORTS or (searching and key == RANK_SORT):
+        return key
+    return RANK_SORT if searching else DEFAULT_SORT
+
+
+def resolve_order(order) -> str:
+    """
+    Функция проверяет направление сортировки ('asc' или 'desc')
+    """
+    return order if order in ORDERS else DEFAULT_ORDER
+
+
+def sort_field(key) -> str:
+    """
+    Функция возвращает поле модели для ключа сортировки (для 'rank' - дату публикации)
+    """
+    return CATALOG_SORTS.get(key, CATALOG_SORTS[DEFAULT_SORT]).field
+
+
+def order_by(key, order) -> tuple:
+    """
+    Функция возвращает аргументы order_by для ключа и направления сортировки.
+    id добавляется для устойчивого порядка при равных значениях (и совпадает с индексом (поле, id))
+    """
+    field = sort_field(key)
+    if order == 'asc':
+        return field, 'pk'
+    return f'-{field}', '-pk'
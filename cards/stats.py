@@ -0,0 +1,171 @@
+import time
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from .models import AuthorStats, Card, CardStats, CardTag, CategoryStats, StatsRefresh, TagStats
+
+# Материализованная статистика карточек для рейтингов.
+# Команда refresh_stats (периодически, например через cron) пересчитывает в одной транзакции сводные таблицы:
+# статистику карточек (просмотры, избранное, недавняя частота просмотров) и суммы по категориям, тегам
+# и авторам. Страницы рейтингов и JSON читают только сводные таблицы, а результат кешируется по версии
+# статистики - идентификатору последнего пересчета (StatsRefresh).
+# Недавняя частота просмотров - просмотры в день со сглаживанием: прирост просмотров между пересчетами
+# добавляется к прежней частоте с весом, зависящим от прошедшего времени (период полураспада STATS_HALF_LIFE).
+
+STATS_VERSION_KEY = 'stats_version'
+# время, через которое версия статистики перечитывается из БД (пересчет идет в другом процессе)
+STATS_VERSION_TIMEOUT = 60
+# период полураспада недавней частоты просмотров (дней)
+STATS_HALF_LIFE = 1
+# количество позиций в каждом рейтинге
+LEADERBOARD_SIZE = 10
+# время хранения рейтингов в кеше (ключ меняется с каждым пересчетом)
+LEADERBOARD_TIMEOUT = 60 * 60 * 24
+# поля сводных таблиц (SummaryStats)
+SUMMARY_FIELDS = ('cards_count', 'views', 'adds', 'views_rate')
+BATCH_SIZE = 1000
+
+
+def views_rate(previous_rate, views_delta, elapsed_days):
+    """
+    Функция обновляет сглаженную частоту просмотров карточки
+    :param previous_rate: частота на момент прошлого пересчета (просмотров в день)
+    :param views_delta: просмотры, добавившиеся с прошлого пересчета
+    :param elapsed_days: дней с прошлого пересчета
+    :return: новая частота (просмотров в день)
+    """
+    if elapsed_days <= 0:
+        return previous_rate
+    weight = 1 - 0.5 ** (elapsed_days / STATS_HALF_LIFE)
+    return previous_rate + weight * (max(views_delta, 0) / elapsed_days - previous_rate)
+
+
+def build_card_stats(now, previous, old, using):
+    """
+    Генератор строк статистики карточек. Карточки читаются из БД порциями
+    :param now: время пересчета
+    :param previous: прошлый пересчет (StatsRefresh) или None
+    :param old: прежняя статистика {id карточки: (просмотры, частота просмотров)}
+    """
+    elapsed = (now - previous.refreshed_at).total_seconds() / 86400 if previous else 0
+    cards = (Card.objects.using(using).order_by().values_list('pk', 'views', 'adds', 'upload_date')
+             .iterator(chunk_size=BATCH_SIZE))
+    for card_id, views, adds, upload_date in cards:
+        if card_id in old:
+            old_views, old_rate = old[card_id]
+            rate = views_rate(old_rate, views - old_views, elapsed)
+        else:
+            # новая карточка: начальная частота - средняя за все время (не меньше чем за сутки)
+            rate = views / max((now - upload_date).total_seconds() / 86400, 1)
+        yield CardStats(card_id=card_id, views=views, adds=adds, views_rate=rate)
+
+
+def summary_rows(model, key, rows):
+    """
+    Функция превращает результаты группировки в строки сводной таблицы
+    :param model: модель сводной таблицы (CategoryStats, TagStats, AuthorStats)
+    :param key: имя поля группировки в модели (category_id, tag_id, author_id)
+    :param rows: словари {'group', 'cards_count', 'views', 'adds', 'views_rate'}
+    """
+    return [model(**{key: row['group']}, cards_count=row['cards_count'], views=row['views'] or 0,
+                  adds=row['adds'] or 0, views_rate=row['views_rate'] or 0) for row in rows]
+
+
+def refresh_stats(using=DEFAULT_DB_ALIAS):
+    """
+    Функция пересчитывает все сводные таблицы статистики в одной транзакции: страницы рейтингов
+    до фиксации видят прежнюю статистику целиком
+    :param using: псевдоним базы данных
+    :return: запись о пересчете (StatsRefresh)
+    """
+    started = time.perf_counter()
+    now = timezone.now()
+    with transaction.atomic(using=using):
+        previous = StatsRefresh.objects.using(using).order_by('-pk').first()
+        old = {card_id: (views, rate) for card_id, views, rate
+               in CardStats.objects.using(using).values_list('card_id', 'views', 'views_rate').iterator()}
+        CardStats.objects.using(using).all().delete()
+        cards = 0
+        batch = []
+        for row in build_card_stats(now, previous, old, using):
+            batch.append(row)
+            if len(batch) >= BATCH_SIZE:
+                cards += len(CardStats.objects.using(using).bulk_create(batch))
+                batch = []
+        cards += len(CardStats.objects.using(using).bulk_create(batch))
+
+        # суммы по группам считаются по только что заполненной статистике карточек
+        totals = {'cards_count': Count('pk'), 'views': Sum('views'), 'adds': Sum('adds'),
+                  'views_rate': Sum('views_rate')}
+        card_stats = CardStats.objects.using(using).order_by()
+        groups = [
+            (CategoryStats, 'category_id', card_stats.values(group=F('card__category_id')).annotate(**totals)),
+            (AuthorStats, 'author_id', card_stats.filter(card__author__isnull=False)
+             .values(group=F('card__author_id')).annotate(**totals)),
+            # у тега суммы считаются по связям CardTag с присоединенной статистикой карточек
+            (TagStats, 'tag_id', CardTag.objects.using(using).order_by().values(group=F('tag_id')).annotate(
+                cards_count=Count('pk'), views=Sum('card__stats__views'), adds=Sum('card__stats__adds'),
+                views_rate=Sum('card__stats__views_rate'))),
+        ]
+        for model, key, rows in groups:
+            model.objects.using(using).all().delete()
+            model.objects.using(using).bulk_create(summary_rows(model, key, rows), batch_size=BATCH_SIZE)
+
+        refresh = StatsRefresh.objects.using(using).create(refreshed_at=now, cards=cards,
+                                                           duration=time.perf_counter() - started)
+        # новая версия статистики видна страницам рейтингов сразу после фиксации
+        transaction.on_commit(lambda: cache.set(STATS_VERSION_KEY, refresh.pk, timeout=STATS_VERSION_TIMEOUT),
+                              using=using)
+    return refresh
+
+
+def get_stats_version() -> int:
+    """
+    Версия статистики - идентификатор последнего пересчета (0, если статистика еще не считалась)
+    """
+    version = cache.get(STATS_VERSION_KEY)
+    if version is None:
+        version = StatsRefresh.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        cache.set(STATS_VERSION_KEY, version, timeout=STATS_VERSION_TIMEOUT)
+    return version
+
+
+def summary_leaders(model, key, fields):
+    """
+    Лидеры сводной таблицы по просмотрам
+    :param model: модель сводной таблицы
+    :param key: поле связи с объектом группы
+    :param fields: поля объекта группы {имя в ответе: путь к полю}
+    """
+    values = {name: F(path) for name, path in fields.items()}
+    return list(model.objects.order_by('-views', f'-{key}').values(*SUMMARY_FIELDS, **values)[:LEADERBOARD_SIZE])
+
+
+def get_leaderboards():
+    """
+    Функция возвращает рейтинги: карточки по просмотрам, избранному и недавней частоте просмотров,
+    категории, теги и авторы по просмотрам. Результат кешируется до следующего пересчета статистики
+    :return: словарь рейтингов (списки словарей), пригодный для JSON
+    """
+    version = get_stats_version()
+    key = f'leaderboards:{version}'
+    leaderboards = cache.get(key)
+    if leaderboards is None:
+        refresh = StatsRefresh.objects.filter(pk=version).first()
+        card_fields = {'id': F('card_id'), 'question': F('card__question')}
+        cards = CardStats.objects.values('views', 'adds', 'views_rate', **card_fields)
+        leaderboards = {
+            'refreshed_at': refresh.refreshed_at.isoformat() if refresh else None,
+            'most_viewed': list(cards.order_by('-views', '-card_id')[:LEADERBOARD_SIZE]),
+            'most_favorited': list(cards.order_by('-adds', '-card_id')[:LEADERBOARD_SIZE]),
+            'trending': list(cards.order_by('-views_rate', '-card_id')[:LEADERBOARD_SIZE]),
+            'categories': summary_leaders(CategoryStats, 'category_id',
+                                          {'id': 'category_id', 'name': 'category__name', 'slug': 'category__slug'}),
+            'tags': summary_leaders(TagStats, 'tag_id', {'id': 'tag_id', 'name': 'tag__name'}),
+            'authors': summary_leaders(AuthorStats, 'author_id', {'id': 'author_id', 'username': 'author__username'}),
+        }
+        cache.set(key, leaderboards, timeout=LEADERBOARD_TIMEOUT if version else STATS_VERSION_TIMEOUT)
+    return leaderboards
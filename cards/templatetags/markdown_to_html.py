@@ -1,7 +1,8 @@
-import markdown
 from django import template
 from django.utils.safestring import mark_safe
 
+from cards.rendering import render_markdown
+
 register = template.Library()
 
 
@@ -12,9 +13,7 @@ def markdown_to_html(markdown_text: str) -> str:
     :param markdown_text: текст в формате Markdown
     :return: текст в формате HTML
     """
-    # включение расширений для улучшенной работы обработки
-    md_extensions = ['extra', 'fenced_code', 'tables']
-    # преобразование из формата Markdown в HTML с расширениями
-    html_content = markdown.markdown(markdown_text, extensions=md_extensions)
+    # преобразование из формата Markdown в HTML с расширениями (результат кешируется по хешу текста)
+    html_content = render_markdown(markdown_text)
 
     return mark_safe(html_content)
\ No newline at end of file
@@ -1,3 +1,1231 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from datetime import timedelta
+from functools import partial
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.admin.models import LogEntry
+from django.contrib.auth import get_user, get_user_model
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.db.models import F
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+
+from anki.cache_backends import SQLiteCache
+from anki.db import apply_sqlite_pragmas
+from anki.routers import STICKY_COOKIE, PrimaryStickinessMiddleware, ReplicaRouter, replica_reads
+
+from . import async_views, counters
+from .checks import check_shared_cache
+from .exporters import EXPORT_FORMATS, export_deck
+from .forms import CardForm
+from .importers import CardImporter, parse_deck
+from .models import Card, CardReview, Category, DeckSnapshot, Favorite, StatsRefresh, Tag
+from .page_cache import CATALOG_VERSION_KEY, bump_catalog_version, get_catalog_version
+from .pagination import decode_cursor, encode_cursor
+from .scheduler import Grade, schedule
+from .rendering import PREVIEW_LENGTH, content_hash
+from .search import CardSearchResults, build_match_query, filter_matching
+from .snapshots import SNAPSHOT_KEEP, build_snapshot, build_snapshots
+from .stats import get_leaderboards, refresh_stats, views_rate
+from .view_counter import ViewCounter, view_counter
+from .views import get_category_counts, get_tag_cloud
+
+
+class QueryBudgetMixin:
+    """
+    Класс-миксин для тестов, проверяющих фиксированное количество запросов к БД на страницу.
+    Количество запросов не должно зависеть от числа карточек на странице
+    """
+
+    def assertQueryBudget(self, url, budget, **kwargs):
+        """
+        Метод запрашивает страницу и проверяет, что она отдана не более чем за budget запросов
+        :param url: адрес страницы
+        :param budget: допустимое количество запросов
+        :return: ответ сервера
+        """
+        # счетчики меню кешируются, сбрасываем кеш, чтобы количество запросов было воспроизводимым
+        cache.clear()
+        with self.assertNumQueries(budget):
+            response = self.client.get(url, **kwargs)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+
+def create_cards(count, author=None, tags_per_card=3):
+    """
+    Функция создает карточки с тегами для тестов
+    :param count: количество карточек
+    :param author: автор карточек
+    :param tags_per_card: количество тегов у каждой карточки
+    :return: список карточек
+    """
+    category = Category.objects.create(name='Python')
+    tags = [Tag.objects.create(name=f'tag{number}') for number in range(tags_per_card)]
+    cards = []
+    for number in range(count):
+        card = Card.objects.create(question=f'Вопрос {number}', answer=f'Ответ **{number}**',
+                                   category=category, author=author)
+        card.tags.set(tags)
+        cards.append(card)
+    return cards
+
+
+class CatalogQueryBudgetTest(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = get_user_model().objects.create_user(username='author', password='password')
+        cls.cards = create_cards(35, author=cls.author)
+
+    def test_catalog_page(self):
+        # счетчики меню (карточки, пользователи) + страница карточек + теги;
+        # общее количество для пагинации берется из того же счетчика карточек
+        response = self.assertQueryBudget('/cards/catalog/', 4)
+        self.assertEqual(len(response.context['cards']), 30)
+
+    def test_catalog_last_page(self):
+        self.assertQueryBudget('/cards/catalog/?page=2', 4)
+
+    def test_catalog_with_unrendered_answers(self):
+        # карточки из фикстуры до render_answers: HTML ответа нет, но запросов не больше
+        Card.objects.update(answer_html='', answer_preview_html='', answer_hash='')
+        response = self.assertQueryBudget('/cards/catalog/?sort=views', 4)
+        self.assertContains(response, 'Ответ <strong>')
+        # в API еще запрос ETag
+        self.assertQueryBudget('/cards/api/cards/', 4)
+
+    def test_catalog_search(self):
+        # количество и идентификаторы из поискового индекса + карточки + теги + счетчики меню
+        response = self.assertQueryBudget('/cards/catalog/?search_query=вопрос', 6)
+        self.assertEqual(len(response.context['cards']), 30)
+
+    def test_catalog_cursor_pagination(self):
+        # страница по курсору: карточки + теги + счетчики меню, без COUNT(*) и OFFSET
+        response = self.assertQueryBudget('/cards/catalog/?pagination=cursor&sort=views&order=asc', 4)
+        page = response.context['page_obj']
+        ids = [card.pk for card in response.context['cards']]
+        response = self.assertQueryBudget(f'/cards/catalog/?pagination=cursor&sort=views&order=asc'
+                                          f'&cursor={page.next_cursor}', 4)
+        ids += [card.pk for card in response.context['cards']]
+        self.assertEqual(ids, list(Card.objects.order_by('views', 'pk').values_list('pk', flat=True)))
+        self.assertFalse(response.context['page_obj'].has_next())
+
+        response = self.client.get(f'/cards/catalog/?pagination=cursor&sort=views&order=asc'
+                                   f'&cursor={response.context["page_obj"].previous_cursor}')
+        self.assertEqual([card.pk for card in response.context['cards']], ids[:30])
+
+    def test_cursor_of_wrong_type_shows_first_page(self):
+        first_page = self.client.get('/cards/catalog/?pagination=cursor&sort=views')
+        date_cursor = first_page.context['page_obj'].next_cursor
+        first_ids = [card.pk for card in first_page.context['cards']]
+        cursors = [
+            encode_cursor('abc', 1),
+            encode_cursor(2 ** 70, 1),
+            encode_cursor(True, 1),
+            encode_cursor(5, 'abc'),
+        ]
+        for cursor in cursors:
+            with self.subTest(cursor=decode_cursor(cursor)):
+                response = self.client.get(f'/cards/catalog/?pagination=cursor&sort=views&cursor={cursor}')
+                self.assertEqual([card.pk for card in response.context['cards']], first_ids)
+        # курсор сортировки по просмотрам после смены сортировки на дату публикации, число и список вместо даты
+        for cursor in (date_cursor, encode_cursor(5, 1), encode_cursor([1], 1)):
+            response = self.client.get(f'/cards/catalog/?pagination=cursor&sort=upload_date&cursor={cursor}')
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(response.context['page_obj'].has_previous())
+            response = self.client.get('/cards/api/cards/', {'pagination': 'cursor', 'sort': 'upload_date',
+                                                              'cursor': cursor})
+            self.assertEqual(response.status_code, 200)
+
+    def test_catalog_sort_registry(self):
+        # 'favorites' - публичный ключ поля adds
+        Card.objects.filter(pk=self.cards[1].pk).update(adds=10)
+        response = self.client.get('/cards/catalog/?sort=favorites')
+        self.assertEqual(response.context['cards'][0].pk, self.cards[1].pk)
+        # неизвестные ключи и направления заменяются значениями по умолчанию вместо FieldError
+        response = self.client.get('/cards/catalog/?sort=answer&order=sideways')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.context['sort'], response.context['order']), ('upload_date', 'desc'))
+
+    def test_cards_by_tag(self):
+        tag = Tag.objects.get(name='tag0')
+        # тег, счетчики меню, карточки страницы и их теги; количество карточек берется из Tag.cards_count
+        response = self.assertQueryBudget(f'/cards/tags/{tag.pk}/', 5)
+        self.assertEqual(len(response.context['cards']), 30)
+        self.assertEqual(response.context['total_count'], 35)
+
+    def test_listing_defers_answer(self):
+        card = Card.objects.for_listing().get(pk=self.cards[0].pk)
+        self.assertIn('answer', card.get_deferred_fields())
+        self.assertIn('answer_html', card.get_deferred_fields())
+
+
+class SearchIndexTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Python')
+
+    def search(self, query):
+        return [card.pk for card in CardSearchResults(query, Card.objects.all())]
+
+    def test_index_follows_card_and_tag_changes(self):
+        card = Card.objects.create(question='Генераторы списков', answer='Ответ', category=self.category)
+        self.assertEqual(self.search('генератор'), [card.pk])
+        card.answer = 'Выражение yield'
+        card.save()
+        self.assertEqual(self.search('yield'), [card.pk])
+
+        tag = Tag.objects.create(name='itertools')
+        card.tags.add(tag)
+        self.assertEqual(self.search('itertools'), [card.pk])
+        tag.name = 'functools'
+        tag.save()
+        self.assertEqual((self.search('itertools'), self.search('functools')), ([], [card.pk]))
+        card.tags.clear()
+        self.assertEqual(self.search('functools'), [])
+
+        card.delete()
+        self.assertEqual(self.search('генератор'), [])
+
+    def test_ranking_prefers_question_matches(self):
+        in_answer = Card.objects.create(question='Циклы', answer='Пример со словарем', category=self.category)
+        in_question = Card.objects.create(question='Методы словаря', answer='Ответ', category=self.category)
+        self.assertEqual(self.search('словар'), [in_question.pk, in_answer.pk])
+        self.assertEqual(CardSearchResults('словар', Card.objects.all()).count(), 2)
+
+    def test_query_without_words(self):
+        Card.objects.create(question='Вопрос', answer='Ответ', category=self.category)
+        for query in ('-', '"', "'", ')', '- "'):
+            self.assertEqual(build_match_query(query), '')
+            self.assertEqual(self.search(query), [])
+            self.assertEqual(list(filter_matching(Card.objects.all(), query)), [])
+        for url in ('/cards/catalog/', '/cards/async/catalog/', '/cards/api/cards/'):
+            for params in ({'sort': 'views'}, {'pagination': 'cursor'}, {}):
+                response = self.client.get(url, {'search_query': '-', **params})
+                self.assertEqual(response.status_code, 200, (url, params))
+
+
+class AnswerRenderingTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Python')
+
+    def test_html_stored_and_updated_with_answer(self):
+        card = Card.objects.create(question='Вопрос', answer='Ответ **1**', category=self.category)
+        card.refresh_from_db()
+        self.assertEqual((card.answer_html, card.answer_hash), ('<p>Ответ <strong>1</strong></p>',
+                                                                content_hash('Ответ **1**')))
+        self.assertFalse(card.render_answer())
+        self.assertTrue(card.render_answer(force=True))
+
+        card.answer = 'Ответ *2*'
+        card.save(update_fields=['answer'])
+        card.refresh_from_db()
+        self.assertEqual(card.answer_html, '<p>Ответ <em>2</em></p>')
+        self.assertEqual(card.get_answer_html(), '<p>Ответ <em>2</em></p>')
+
+    def test_preview_is_cut(self):
+        card = Card.objects.create(question='Вопрос', answer='слово ' * 50, category=self.category)
+        self.assertTrue(card.answer_preview_html.startswith('<p>слово'))
+        self.assertTrue(card.answer_preview_html.endswith('…</p>'))
+        self.assertLessEqual(len(card.answer_preview_html), PREVIEW_LENGTH + len('<p></p>'))
+        self.assertEqual(card.answer_preview_html, card.get_answer_preview_html())
+
+    def test_render_answers_command(self):
+        cards = [Card.objects.create(question=f'Вопрос {number}', answer=f'Ответ **{number}**',
+                                     category=self.category) for number in range(3)]
+        # карточки, загруженные фикстурой или измененные в обход save(): HTML нет или он устарел
+        Card.objects.filter(pk=cards[0].pk).update(answer_html='', answer_preview_html='', answer_hash='')
+        Card.objects.filter(pk=cards[1].pk).update(answer='Новый *ответ*')
+        output = io.StringIO()
+        call_command('render_answers', '--batch-size', '1', stdout=output)
+        self.assertIn('Преобразовано карточек: 2', output.getvalue())
+        self.assertEqual(Card.objects.get(pk=cards[0].pk).answer_html, '<p>Ответ <strong>0</strong></p>')
+        self.assertEqual(Card.objects.get(pk=cards[1].pk).answer_html, '<p>Новый <em>ответ</em></p>')
+
+        call_command('render_answers', stdout=output)
+        self.assertIn('Преобразовано карточек: 0', output.getvalue())
+
+
+class CardImporterTest(TestCase):
+    def test_tsv_directives_only_at_file_start(self):
+        deck = '#separator:tab\n#html:true\nВопрос\t"Ответ\n# не директива"\tpython sql\n'
+        rows = list(parse_deck(io.StringIO(deck), 'tsv'))
+        self.assertEqual(rows, [{'question': 'Вопрос', 'answer': 'Ответ\n# не директива', 'category': '',
+                                 'tags': ['python', 'sql']}])
+
+    def test_import(self):
+        deck = ('{"question": "Вопрос 1", "answer": "", "category": "Python", "tags": "a, b"}\n'
+                '{"question": "", "answer": "Ответ"}\n'
+                '{"question": "Вопрос 2", "answer": "Ответ", "tags": ["B", "c"]}\n')
+        result = CardImporter(batch_size=2, default_category='Общее').run(parse_deck(io.StringIO(deck), 'jsonl'))
+        # карточка с пустым ответом импортируется, строка без вопроса пропускается
+        self.assertEqual((result.cards, result.skipped, result.categories, result.tags), (2, 1, 2, 3))
+        card = Card.objects.get(question='Вопрос 2')
+        self.assertEqual(card.category.name, 'Общее')
+        self.assertEqual(sorted(card.tags.values_list('name', flat=True)), ['b', 'c'])
+
+    def test_invalid_rows_are_reported(self):
+        long_question = 'в' * 256
+        deck = json.dumps([
+            'не объект',
+            {'question': ['список'], 'answer': 'Ответ', 'category': 'Python'},
+            {'question': long_question, 'answer': 'Ответ', 'category': 'Python'},
+            {'question': 'Вопрос', 'answer': 'Ответ', 'category': 'Python', 'tags': [1]},
+            {'question': 'Вопрос', 'answer': 'Ответ', 'category': 'Python'},
+        ])
+        result = CardImporter().run(parse_deck(io.StringIO(deck), 'json'))
+        self.assertEqual((result.cards, result.skipped), (1, 4))
+        self.assertEqual([row_number for row_number, reason in result.errors], [1, 2, 3, 4])
+        # слишком длинный вопрос не обрезается
+        self.assertFalse(Card.objects.filter(question__startswith='вв').exists())
+
+    def test_malformed_jsonl_line_is_skipped(self):
+        deck = ('{"question": "Вопрос 1", "answer": "Ответ", "category": "Python"}\n'
+                '\n'
+                '{"question": "Вопрос 2", "answer": \n'
+                '["не объект"]\n'
+                '{"question": "Вопрос 3", "answer": "Ответ", "category": "Python"}\n')
+        result = CardImporter().run(parse_deck(io.StringIO(deck), 'jsonl'))
+        self.assertEqual((result.cards, result.skipped), (2, 2))
+        self.assertEqual(result.errors[0][0], 2)
+        self.assertIn('строке файла 3', result.errors[0][1])
+        self.assertEqual(sorted(Card.objects.values_list('question', flat=True)), ['Вопрос 1', 'Вопрос 3'])
+
+    def test_admin_upload_reports_invalid_rows(self):
+        admin = get_user_model().objects.create_superuser(username='admin', password='password')
+        self.client.force_login(admin)
+        upload = SimpleUploadedFile('deck.json', b'[1, {"question": "\u0412", "answer": "", "category": "Python"}]')
+        response = self.client.post('/admin/cards/card/import/', {'file': upload, 'batch_size': 100}, follow=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Card.objects.count(), 1)
+        self.assertIn('Пропущенные строки: 1', ' '.join(str(message) for message in response.context['messages']))
+
+
+
+class CardExporterTest(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = get_user_model().objects.create_user(username='author', password='password')
+        cls.cards = create_cards(5, author=cls.author, tags_per_card=2)
+        cls.other = Card.objects.create(question='Чужой, "вопрос"', answer='Строка 1\nСтрока 2',
+                                        category=cls.cards[0].category)
+
+    def test_formats_can_be_imported_back(self):
+        for file_format in EXPORT_FORMATS:
+            with self.subTest(file_format=file_format):
+                deck = ''.join(export_deck(Card.objects.all(), file_format))
+                rows = list(parse_deck(io.StringIO(deck), file_format))
+                self.assertEqual(len(rows), 6)
+                self.assertEqual(rows[0]['tags'], ['tag0', 'tag1'])
+                self.assertEqual((rows[-1]['question'], rows[-1]['answer']), (self.other.question, self.other.answer))
+
+    def test_tags_are_loaded_per_chunk(self):
+        # карточки читаются одним запросом через курсор, теги - одним запросом на каждые chunk_size карточек
+        with self.assertNumQueries(4):
+            list(export_deck(Card.objects.all(), 'jsonl', chunk_size=2))
+
+    def test_export_view(self):
+        response = self.client.get('/cards/export/?format=csv&mine=1')
+        self.assertRedirects(response, '/users/login/?next=/cards/export/%3Fformat%3Dcsv%26mine%3D1',
+                             fetch_redirect_response=False)
+
+        self.client.force_login(self.author)
+        response = self.client.get('/cards/export/?format=jsonl&mine=1')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="cards_author.jsonl"')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(self.client.get('/cards/export/?format=xml').status_code, 404)
+
+
+class ReviewQueueTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='student', password='password')
+        cls.cards = create_cards(5)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_schedule_intervals(self):
+        review = CardReview(user=self.user, card=self.cards[0], due=timezone.now())
+        intervals = [schedule(review, Grade.GOOD).interval for _ in range(3)]
+        self.assertEqual(intervals, [1, 6, 15])
+        schedule(review, Grade.AGAIN)
+        self.assertEqual((review.interval, review.repetitions, review.lapses), (0, 0, 1))
+        self.assertGreaterEqual(review.ease, 1.3)
+
+    def test_due_queue(self):
+        response = self.client.post(f'/cards/{self.cards[0].pk}/review/', {'grade': Grade.GOOD})
+        self.assertEqual(response.json()['interval'], 1)
+        CardReview.objects.create(user=self.user, card=self.cards[1], due=timezone.now() - timedelta(days=1))
+
+        cards = self.client.get('/cards/review/due/?limit=3').json()['cards']
+        # сначала карточка, которую пора повторить, затем новые; уже изученная на сегодня не попадает
+        self.assertEqual([card['id'] for card in cards], [self.cards[1].pk, self.cards[2].pk, self.cards[3].pk])
+        self.assertEqual([card['is_new'] for card in cards], [False, True, True])
+
+    def test_new_cards_after_many_reviews(self):
+        category = self.cards[0].category
+        cards = self.cards + [Card.objects.create(question=f'Новый вопрос {number}', answer='Ответ', category=category)
+                              for number in range(30)]
+        for card in cards[:30]:
+            self.client.post(f'/cards/{card.pk}/review/', {'grade': Grade.GOOD})
+
+        # сессия, пользователь, карточки к повторению, позиция в очереди новых карточек, новые карточки
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as queries:
+            response = self.client.get('/cards/review/due/?limit=3')
+        self.assertEqual(len(queries), 5)
+        self.assertEqual([card['id'] for card in response.json()['cards']], [card.pk for card in cards[30:33]])
+        # новые карточки выбираются по первичному ключу после позиции, изученные карточки не просматриваются
+        with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {queries[-1]["sql"]}')
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('INTEGER PRIMARY KEY (rowid>?)', plan)
+        self.assertIn(f'> {cards[29].pk}', queries[-1]['sql'])
+
+    def test_invalid_grade(self):
+        response = self.client.post(f'/cards/{self.cards[0].pk}/review/', {'grade': 7})
+        self.assertEqual(response.status_code, 400)
+
+
+class FavoritesTest(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='reader', password='password')
+        cls.cards = create_cards(35)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_add_and_remove_are_idempotent(self):
+        card = self.cards[0]
+        for _ in range(2):
+            response = self.client.post(f'/cards/{card.pk}/favorite/')
+            self.assertEqual(response.json(), {'id': card.pk, 'is_favorite': True, 'adds': 1})
+        self.assertEqual(Favorite.objects.filter(user=self.user).count(), 1)
+        for _ in range(2):
+            response = self.client.post(f'/cards/{card.pk}/favorite/remove/')
+            self.assertEqual(response.json(), {'id': card.pk, 'is_favorite': False, 'adds': 0})
+        self.assertFalse(Favorite.objects.exists())
+
+        response = self.client.post(f'/cards/{card.pk}/favorite/', {'next': '/cards/catalog/'})
+        self.assertRedirects(response, '/cards/catalog/', fetch_redirect_response=False)
+        # адрес другого сайта в next не используется
+        response = self.client.post(f'/cards/{card.pk}/favorite/remove/', {'next': 'https://example.com/'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.post('/cards/0/favorite/').status_code, 404)
+
+    def test_catalog_flag_without_extra_queries(self):
+        for card in self.cards[-3:]:
+            self.client.post(f'/cards/{card.pk}/favorite/')
+        # сессия + пользователь + права пользователя и его групп + счетчики меню + карточки с признаком + теги
+        response = self.assertQueryBudget('/cards/catalog/', 8)
+        flagged = {card.pk for card in response.context['cards'] if card.is_favorite}
+        self.assertEqual(flagged, {card.pk for card in self.cards[-3:]})
+        self.assertContains(response, f'/cards/{self.cards[-1].pk}/favorite/remove/')
+
+    def test_favorites_list(self):
+        for card in self.cards[:31]:
+            self.client.post(f'/cards/{card.pk}/favorite/')
+        response = self.client.get('/users/profile_favorites/')
+        # последние добавленные - первыми, по 30 карточек на странице
+        self.assertEqual([card.pk for card in response.context['cards']],
+                         [card.pk for card in reversed(self.cards[1:31])])
+        self.assertTrue(all(card.is_favorite for card in response.context['cards']))
+        response = self.client.get('/users/profile_favorites/?page=2')
+        self.assertEqual([card.pk for card in response.context['cards']], [self.cards[0].pk])
+
+    def test_user_deletion_updates_counters(self):
+        other = get_user_model().objects.create_user(username='other', password='password')
+        Favorite.objects.create(user=other, card=self.cards[0])
+        Card.objects.filter(pk=self.cards[0].pk).update(adds=1)
+        self.client.post(f'/cards/{self.cards[0].pk}/favorite/')
+        other.delete()
+        self.assertEqual(Card.objects.get(pk=self.cards[0].pk).adds, 1)
+
+
+class CardAdminTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = get_user_model().objects.create_superuser(username='admin', password='password')
+        cls.cards = create_cards(12)
+        cls.code_card = Card.objects.create(question='Код', answer='```python\nprint(1)\n```',
+                                            category=cls.cards[0].category)
+        cls.target = Category.objects.create(name='SQL')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+
+    def post_action(self, action, cards, **data):
+        return self.client.post('/admin/cards/card/', {'action': action,
+                                                       '_selected_action': [card.pk for card in cards], **data})
+
+    def test_has_code_follows_answer(self):
+        self.assertTrue(self.code_card.has_code)
+        self.code_card.answer = 'Без кода'
+        self.code_card.save(update_fields=['answer'])
+        self.assertFalse(Card.objects.get(pk=self.code_card.pk).has_code)
+
+    def test_changelist_without_full_count(self):
+        response = self.client.get('/admin/cards/card/?has_code=yes')
+        self.assertEqual(list(response.context['cl'].result_list), [self.code_card])
+        # общее количество карточек - из счетчика меню, второй COUNT(*) по таблице не выполняется
+        self.assertIsNone(response.context['cl'].full_result_count)
+        response = self.client.get('/admin/cards/card/?q=вопрос')
+        self.assertEqual(response.context['cl'].result_count, 12)
+
+    def test_changelist_filters(self):
+        Card.objects.filter(pk=self.cards[0].pk).update(category=self.target, upload_date=timezone.now())
+        Card.objects.filter(pk=self.cards[1].pk).update(upload_date=timezone.now() - timedelta(days=10))
+        get_category_counts()
+        # сессия, пользователь, карточки страницы и количество отфильтрованных; фильтры запросов не выполняют
+        with self.assertNumQueries(4):
+            response = self.client.get(f'/admin/cards/card/?category={self.target.pk}')
+        self.assertEqual(list(response.context['cl'].result_list), [self.cards[0]])
+        response = self.client.get('/admin/cards/card/?uploaded=week')
+        self.assertNotIn(self.cards[1], response.context['cl'].result_list)
+        self.assertEqual(response.context['cl'].result_count, 12)
+        # поисковый запрос без слов ничего не находит вместо ошибки FTS5
+        response = self.client.get('/admin/cards/card/', {'q': '"'})
+        self.assertEqual(response.context['cl'].result_count, 0)
+
+    def test_changelist_save_and_delete_confirmation_budget(self):
+        page = list(self.client.get('/admin/cards/card/').context['cl'].result_list)
+        data = {'form-TOTAL_FORMS': len(page), 'form-INITIAL_FORMS': len(page), '_save': 'Сохранить'}
+        for number, card in enumerate(page):
+            data[f'form-{number}-id'] = card.pk
+            data[f'form-{number}-status'] = number < 4
+        # ответ в списке не загружается: сохранение статуса и запись в журнал (str(card)) не читают его
+        # по одному запросу на карточку
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as queries:
+            response = self.client.post('/admin/cards/card/', data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Card.objects.filter(status=True).count(), 4)
+        self.assertFalse([query['sql'] for query in queries if '"Cards"."Answer" FROM' in query['sql']])
+        self.assertEqual(LogEntry.objects.filter(object_repr__startswith='Карточка').count(), 4)
+
+        # страница подтверждения удаления: карточки и их связи, без запроса на каждую карточку
+        with self.assertNumQueries(8):
+            response = self.post_action('delete_selected', page)
+        self.assertContains(response, f'Карточка {page[-1].question}')
+
+    def test_recategorize(self):
+        response = self.post_action('recategorize', self.cards[:2])
+        # сначала страница выбора категории с выбранными карточками
+        self.assertContains(response, f'value="{self.cards[1].pk}"')
+        self.post_action('recategorize', self.cards[:2], apply='1', category=self.target.pk)
+        self.assertEqual(Card.objects.filter(category=self.target).count(), 2)
+
+    def test_retag_and_export(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post_action('retag', self.cards[:3], apply='1', mode='add', tags='SQL,tag0')
+        self.assertEqual(Tag.objects.get(name='sql').cards_count, 3)
+        self.assertEqual(Tag.objects.get(name='tag0').cards_count, 12)
+        response = self.post_action('export', self.cards[:1], apply='1', file_format='jsonl')
+        row = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(row['tags'], ['sql', 'tag0', 'tag1', 'tag2'])
+
+        self.post_action('retag', self.cards[:3], apply='1', mode='remove', tags='sql')
+        self.assertEqual(Tag.objects.get(name='sql').cards_count, 0)
+        self.assertEqual(self.client.get('/cards/catalog/?search_query=sql').context['total_count'], 0)
+
+
+class CardFormTagsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Python')
+        cls.card = Card.objects.create(question='Вопрос', answer='Ответ', category=cls.category)
+
+    def make_form(self, tags):
+        form = CardForm({'question': 'Вопрос', 'answer': 'Ответ', 'category': self.category.pk, 'tags': tags},
+                        instance=self.card)
+        self.assertTrue(form.is_valid(), form.errors)
+        return form
+
+    def test_tags_saved_with_fixed_number_of_queries(self):
+        Tag.objects.create(name='tag0')
+        form = self.make_form(','.join(f'tag{number}' for number in range(15)))
+        # савепоинты, карточка и ее индекс, теги карточки, новые теги, их id, связи, поисковый индекс,
+        # количество карточек у тегов
+        with self.assertNumQueries(12):
+            form.save()
+        self.assertEqual(set(self.card.tags.values_list('name', flat=True)), {f'tag{n}' for n in range(15)})
+
+        form = self.make_form('tag0,tag1,new')
+        # то же самое плюс одно удаление связей
+        with self.assertNumQueries(13):
+            form.save()
+        self.assertEqual(set(self.card.tags.values_list('name', flat=True)), {'tag0', 'tag1', 'new'})
+        self.assertEqual(Tag.objects.filter(name='tag0').count(), 1)
+
+
+class CategoryCatalogTest(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.python = Category.objects.create(name='Python')
+        cls.sql = Category.objects.create(name='SQL')
+        for number in range(3):
+            Card.objects.create(question=f'Вопрос про списки {number}', answer='Ответ', category=cls.python)
+        Card.objects.create(question='Вопрос про списки в SQL', answer='Ответ', category=cls.sql)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_slug_collision(self):
+        first, second = Category.objects.create(name='general'), Category.objects.create(name='General')
+        self.assertEqual((first.slug, second.slug), ('general', 'general-2'))
+        self.assertEqual(Category.objects.create(name='Базы данных').slug, 'базы-данных')
+
+    def test_category_counts_in_one_query(self):
+        with self.assertNumQueries(1):
+            counts = {category['slug']: category['cards_count'] for category in get_category_counts()}
+        self.assertEqual(counts, {'python': 3, 'sql': 1})
+        with self.assertNumQueries(0):
+            get_category_counts()
+
+    def test_category_catalog(self):
+        # категория, счетчики меню и количество карточек в категориях, карточки страницы и их теги
+        response = self.assertQueryBudget(self.python.get_absolute_url() + '?sort=views', 6)
+        self.assertEqual(response.context['total_count'], 3)
+        self.assertEqual({card.category_id for card in response.context['cards']}, {self.python.pk})
+
+        # поиск по релевантности ограничен категорией
+        response = self.client.get(self.python.get_absolute_url() + '?search_query=списки')
+        self.assertEqual(response.context['sort'], 'rank')
+        self.assertEqual(len(response.context['cards']), 3)
+        self.assertEqual(response.context['total_count'], 3)
+        self.assertEqual(self.client.get('/cards/categories/missing/').status_code, 404)
+
+    def test_category_search_without_words(self):
+        # запрос из одних знаков препинания ничего не находит (пустое выражение MATCH - ошибка FTS5)
+        for params in ('?search_query="', '?search_query=%2B%2B&sort=rank', '?search_query=-&sort=views'):
+            with self.subTest(params=params):
+                response = self.client.get(self.python.get_absolute_url() + params)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.context['cards']), 0)
+
+
+class TagBrowsingTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Python')
+        cls.python, cls.sql, cls.web = (Tag.objects.create(name=name) for name in ('python', 'sql', 'web'))
+        cls.cards = [Card.objects.create(question=f'Вопрос {number}', answer='Ответ', category=cls.category)
+                     for number in range(4)]
+        for card in cls.cards:
+            card.tags.add(cls.python)
+        cls.cards[0].tags.add(cls.sql, cls.web)
+        cls.cards[1].tags.add(cls.sql)
+
+    def setUp(self):
+        cache.clear()
+
+    def assertCounts(self, **expected):
+        self.assertEqual(dict(Tag.objects.filter(name__in=expected).values_list('name', 'cards_count')), expected)
+
+    def test_counts_follow_card_tags(self):
+        self.assertCounts(python=4, sql=2, web=1)
+        self.cards[2].tags.add(self.sql)
+        self.sql.cards.remove(self.cards[0])
+        self.cards[1].tags.clear()
+        self.assertCounts(python=3, sql=1, web=1)
+        self.cards[0].delete()
+        self.assertCounts(python=2, sql=1, web=0)
+
+        form = CardForm({'question': 'Вопрос', 'answer': 'Ответ', 'category': self.category.pk, 'tags': 'web,new'},
+                        instance=self.cards[3])
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+        self.assertCounts(python=1, web=1, new=1)
+
+    def test_tag_intersection(self):
+        response = self.client.get('/cards/tags/match/?tags=SQL, python')
+        self.assertEqual([card.pk for card in response.context['cards']], [self.cards[1].pk, self.cards[0].pk])
+        self.assertEqual(response.context['total_count'], 2)
+        self.assertEqual(self.client.get('/cards/tags/match/?tags=python,sql,web').context['total_count'], 1)
+        # неизвестный тег - пустой результат
+        self.assertEqual(self.client.get('/cards/tags/match/?tags=python,missing').context['total_count'], 0)
+        self.assertEqual(self.client.get('/cards/tags/0/').status_code, 404)
+
+    def test_tag_cloud_cached_until_tags_change(self):
+        self.assertContains(self.client.get('/cards/tags/'), 'tag-level-5')
+        with self.assertNumQueries(0):
+            cloud = get_tag_cloud()
+        levels = {tag['name']: tag['level'] for tag in cloud}
+        self.assertEqual((levels['python'], levels['web']), (5, 1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cards[3].tags.add(self.web)
+        self.assertEqual({tag['name']: tag['cards_count'] for tag in get_tag_cloud()}['web'], 2)
+
+
+class StatsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = get_user_model().objects.create_user(username='author', password='password')
+        cls.cards = create_cards(5, author=cls.author)
+        for number, card in enumerate(cls.cards):
+            Card.objects.filter(pk=card.pk).update(views=number * 10, adds=5 - number,
+                                                   upload_date=timezone.now() - timedelta(days=10))
+
+    def setUp(self):
+        cache.clear()
+
+    def test_views_rate(self):
+        # за один период полураспада частота проходит половину пути к новому значению
+        self.assertAlmostEqual(views_rate(2, 10, 1), 6)
+        self.assertAlmostEqual(views_rate(2, 0, 1), 1)
+        self.assertEqual(views_rate(2, 10, 0), 2)
+
+    def test_refresh_and_leaderboards(self):
+        refresh_stats()
+        leaderboards = get_leaderboards()
+        self.assertEqual([card['id'] for card in leaderboards['most_viewed'][:2]],
+                         [self.cards[4].pk, self.cards[3].pk])
+        self.assertEqual(leaderboards['most_favorited'][0]['id'], self.cards[0].pk)
+        # новая карточка: средняя частота за все время
+        self.assertAlmostEqual(leaderboards['trending'][0]['views_rate'], 4, places=3)
+        self.assertEqual(leaderboards['categories'][0]['cards_count'], 5)
+        self.assertEqual(leaderboards['categories'][0]['views'], 100)
+        self.assertEqual(leaderboards['tags'][0]['views'], 100)
+        self.assertEqual(leaderboards['authors'][0]['username'], 'author')
+        # до следующего пересчета рейтинги берутся из кеша
+        with self.assertNumQueries(0):
+            get_leaderboards()
+
+        # через сутки у первой карточки 40 новых просмотров: она становится самой популярной сейчас
+        StatsRefresh.objects.update(refreshed_at=F('refreshed_at') - timedelta(days=1))
+        Card.objects.filter(pk=self.cards[0].pk).update(views=40)
+        with self.captureOnCommitCallbacks(execute=True):
+            refresh_stats()
+        response = self.client.get('/cards/stats/json/')
+        self.assertEqual(response.json()['trending'][0]['id'], self.cards[0].pk)
+        self.assertEqual(self.client.get('/cards/stats/').status_code, 200)
+
+
+class MenuCountersTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_counters_follow_signals_without_queries(self):
+        self.assertEqual(counters.get_count(counters.CARDS_COUNT_KEY), 0)
+        self.assertEqual(counters.get_count(counters.USERS_COUNT_KEY), 0)
+        # пустая таблица тоже кешируется: повторное чтение не выполняет COUNT(*)
+        with self.assertNumQueries(0):
+            self.assertEqual(counters.get_count(counters.CARDS_COUNT_KEY), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            cards = create_cards(3)
+        with self.captureOnCommitCallbacks(execute=True):
+            cards[0].delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            get_user_model().objects.create_user(username='reader', password='password')
+
+        with self.assertNumQueries(0):
+            self.assertEqual(counters.get_count(counters.CARDS_COUNT_KEY), 2)
+            self.assertEqual(counters.get_count(counters.USERS_COUNT_KEY), 1)
+
+    def test_reconcile(self):
+        counters.get_count(counters.CARDS_COUNT_KEY)
+        # массовая вставка без сигналов расходится со счетчиком до сверки
+        Card.objects.bulk_create([Card(question='Вопрос', answer='Ответ', category=Category.objects.create(name='SQL'))])
+        self.assertEqual(counters.get_count(counters.CARDS_COUNT_KEY), 0)
+        self.assertEqual(counters.reconcile()[counters.CARDS_COUNT_KEY], 1)
+        self.assertEqual(counters.get_count(counters.CARDS_COUNT_KEY), 1)
+
+
+@override_settings(CARD_VIEWS_FLUSH_INTERVAL=60)
+class ViewCounterTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.cards = create_cards(2, tags_per_card=0)
+
+    def setUp(self):
+        self.counter = ViewCounter()
+        self.addCleanup(self.counter._stopped.set)
+
+    def test_hits_flushed_in_one_update(self):
+        for card in (self.cards[0], self.cards[0], self.cards[1]):
+            self.counter.hit(card.pk)
+        self.assertEqual(self.counter.pending(self.cards[0].pk), 2)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.counter.flush(), 2)
+        self.assertEqual(list(Card.objects.order_by('pk').values_list('views', flat=True)), [2, 1])
+        self.assertEqual(self.counter.pending(self.cards[0].pk), 0)
+
+    def test_hits_dropped_when_database_changed(self):
+        self.counter.hit(self.cards[0].pk)
+        # тестовая база удалена, соединение снова указывает на рабочую базу
+        with mock.patch.object(ViewCounter, '_current_database', return_value='db.sqlite3'), \
+                self.assertNumQueries(0):
+            self.assertEqual(self.counter.flush(), 0)
+        self.assertEqual(Card.objects.get(pk=self.cards[0].pk).views, 0)
+
+    def failing_update(self, database):
+        """
+        Подменяет запись просмотров ошибкой; во время записи приходит просмотр из базы database
+        """
+        def update(**kwargs):
+            with mock.patch.object(ViewCounter, '_current_database', return_value=database):
+                self.counter.hit(self.cards[1].pk)
+            raise DatabaseError('database is locked')
+        return mock.patch.object(Card.objects, 'filter', return_value=mock.Mock(update=update))
+
+    def test_failed_flush_is_retried_in_same_database(self):
+        self.counter.hit(self.cards[0].pk)
+        with self.failing_update(ViewCounter._current_database()):
+            self.assertEqual(self.counter.flush(), 0)
+        self.assertEqual(self.counter.flush(), 2)
+        self.assertEqual(list(Card.objects.order_by('pk').values_list('views', flat=True)), [1, 1])
+
+    def test_failed_flush_not_moved_to_other_database(self):
+        self.counter.hit(self.cards[0].pk)
+        # во время неудачной записи буфер начал накапливать просмотры другой базы
+        with self.failing_update('other.sqlite3'):
+            self.counter.flush()
+        self.assertEqual(self.counter.pending(self.cards[0].pk), 0)
+        self.assertEqual(self.counter._database, 'other.sqlite3')
+
+    @override_settings(CARD_VIEWS_FLUSH_INTERVAL=0)
+    def test_unbuffered_hit(self):
+        self.counter.hit(self.cards[0].pk)
+        self.assertEqual(Card.objects.get(pk=self.cards[0].pk).views, 1)
+
+
+class PageCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='reader', password='password')
+        cls.cards = create_cards(3)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_catalog_version_not_reused_after_eviction(self):
+        version = get_catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_catalog_version()
+        self.assertEqual(get_catalog_version(), version + 1)
+        # ключ версии вытеснен: новая версия больше прежних, и страницы старых версий не используются
+        cache.delete(CATALOG_VERSION_KEY)
+        self.assertGreater(get_catalog_version(), version + 1)
+
+    def test_process_local_cache_warning(self):
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        with override_settings(DEBUG=False, TESTING=False, CACHES=locmem):
+            self.assertEqual([warning.id for warning in check_shared_cache(None)], ['cards.W001'])
+        with override_settings(DEBUG=False, TESTING=False,
+                               CACHES={'default': {'BACKEND': 'anki.cache_backends.SQLiteCache'}}):
+            self.assertEqual(check_shared_cache(None), [])
+
+    def test_anonymous_catalog_cached_until_cards_change(self):
+        self.client.get('/cards/catalog/?sort=views&utm_source=mail')
+        # та же страница с другими незначимыми параметрами берется из кеша без запросов
+        with self.assertNumQueries(0):
+            response = self.client.get('/cards/catalog/?sort=views')
+        self.assertContains(response, 'Вопрос 2')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Card.objects.create(question='Новый вопрос', answer='Ответ', category=self.cards[0].category)
+        self.assertContains(self.client.get('/cards/catalog/?sort=views'), 'Новый вопрос')
+
+    @override_settings(CARD_VIEWS_FLUSH_INTERVAL=60)
+    def test_cached_card_detail_counts_views(self):
+        # накопленные просмотры записываются в тестовую базу до ее удаления
+        self.addCleanup(view_counter.flush)
+        url = f'/cards/{self.cards[0].pk}/detail/'
+        self.client.get(url)
+        pending = view_counter.pending(self.cards[0].pk)
+        with self.assertNumQueries(0):
+            self.client.get(url)
+        self.assertEqual(view_counter.pending(self.cards[0].pk), pending + 1)
+
+    def test_card_fragment_follows_tag_rename(self):
+        self.client.force_login(self.user)
+        self.assertContains(self.client.get('/cards/catalog/'), 'tag0')
+        tag = Tag.objects.get(name='tag0')
+        tag.name = 'renamed'
+        with self.captureOnCommitCallbacks(execute=True):
+            tag.save()
+        response = self.client.get('/cards/catalog/')
+        self.assertContains(response, 'renamed')
+        self.assertNotContains(response, '>tag0<')
+
+
+class CardApiTest(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.cards = create_cards(35)
+
+    def test_card_list(self):
+        # категория, автор и теги загружаются фиксированным числом запросов: ETag, количество, карточки, теги
+        data = self.assertQueryBudget('/cards/api/cards/?sort=views&order=asc&page=2', 4).json()
+        self.assertEqual((data['count'], data['page'], data['num_pages'], data['sort']), (35, 2, 2, 'views'))
+        self.assertEqual(len(data['results']), 5)
+        self.assertEqual(data['results'][0]['tags'], ['tag0', 'tag1', 'tag2'])
+        self.assertEqual(data['results'][0]['category']['name'], 'Python')
+
+        data = self.client.get('/cards/api/cards/?pagination=cursor').json()
+        self.assertEqual(len(data['results']), 30)
+        data = self.client.get('/cards/api/cards/', {'pagination': 'cursor', 'cursor': data['next_cursor']}).json()
+        self.assertEqual([card['id'] for card in data['results']], [card.pk for card in self.cards[4::-1]])
+
+        data = self.client.get('/cards/api/cards/', {'search_query': 'Вопрос 7'}).json()
+        self.assertEqual(data['results'][0]['id'], self.cards[7].pk)
+
+    def test_not_modified_until_cards_change(self):
+        url = '/cards/api/cards/?sort=views'
+        response = self.client.get(url)
+        etag = response['ETag']
+        # ответ 304 отдается до выполнения представления, после одного агрегирующего запроса
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertNotEqual(self.client.get('/cards/api/cards/?sort=adds')['ETag'], etag)
+        # ETag строится по данным, а не по версии каталога в кеше: он одинаков в любом воркере
+        cache.clear()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # просмотр меняет только счетчик карточки, но список, упорядоченный по просмотрам, изменился
+        Card.objects.filter(pk=self.cards[0].pk).update(views=F('views') + 1)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Card.objects.create(question='Новый вопрос', answer='Ответ', category=self.cards[0].category)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_card_detail(self):
+        card = self.cards[0]
+        url = f'/cards/api/cards/{card.pk}/'
+        response = self.client.get(url)
+        self.assertEqual(response.json()['answer_html'], '<p>Ответ <strong>0</strong></p>')
+        etag = response['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Card.objects.filter(pk=card.pk).update(views=F('views') + 1)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(self.client.get('/cards/api/cards/0/').status_code, 404)
+        self.assertEqual(self.client.post(url).status_code, 405)
+
+    def test_tags_and_categories(self):
+        data = self.client.get('/cards/api/tags/').json()
+        self.assertEqual(data['results'][0]['cards_count'], 35)
+        self.assertFalse(data['has_next'])
+        data = self.client.get('/cards/api/categories/').json()
+        self.assertEqual([(row['name'], row['cards_count']) for row in data['results']], [('Python', 35)])
+        etag = self.client.get('/cards/api/categories/')['ETag']
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get('/cards/api/categories/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Category.objects.create(name='Пустая')
+        self.assertEqual(self.client.get('/cards/api/categories/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        etag = self.client.get('/cards/api/tags/')['ETag']
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/cards/api/tags/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Tag.objects.filter(name='tag0').update(name='renamed')
+        self.assertEqual(self.client.get('/cards/api/tags/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class DeckSnapshotTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.cards = create_cards(5)
+        cls.category = cls.cards[0].category
+        cls.url = f'/cards/api/snapshots/categories/{cls.category.slug}/'
+
+    def setUp(self):
+        cache.clear()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        settings = override_settings(SNAPSHOTS_ROOT=self.root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def build(self, deck):
+        with self.captureOnCommitCallbacks(execute=True):
+            return build_snapshot(deck)
+
+    def test_snapshot_download(self):
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        with self.captureOnCommitCallbacks(execute=True):
+            snapshots = build_snapshots()
+        # категория и три тега
+        self.assertEqual(len(snapshots), 4)
+
+        response = self.client.get(self.url)
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        content = b''.join(response.streaming_content)
+        data = json.loads(gzip.decompress(content))
+        self.assertEqual([card['id'] for card in data['cards']], [card.pk for card in self.cards])
+        self.assertEqual(data['cards'][0]['answer_html'], '<p>Ответ <strong>0</strong></p>')
+        self.assertEqual(data['version'], int(response['X-Snapshot-Version']))
+
+        etag = response['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-{len(content) - 1}/{len(content)}')
+        self.assertEqual(b''.join(response.streaming_content), content[10:])
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag)
+        self.assertEqual(b''.join(response.streaming_content), content[:10])
+        # после изменения снимка If-Range не совпадает - файл отдается целиком
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"old"').status_code, 200)
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE=f'bytes={len(content)}-').status_code, 416)
+
+    def test_incremental_rebuild_and_delta(self):
+        first = self.build(self.category)
+        # колода без изменений не пересобирается
+        self.assertIsNone(self.build(self.category))
+
+        edited, moved, deleted = self.cards[:3]
+        deleted_ids = sorted([moved.pk, deleted.pk])
+        edited.answer = 'Новый **ответ**'
+        edited.save()
+        moved.category = Category.objects.create(name='SQL')
+        moved.save()
+        deleted.delete()
+        added = Card.objects.create(question='Новый вопрос', answer='Ответ', category=self.category)
+        second = self.build(self.category)
+        self.assertEqual(second.cards, 4)
+
+        response = self.client.get(f'{self.url}delta/', {'since': first.pk})
+        delta = response.json()
+        self.assertEqual((delta['since'], delta['version']), (first.pk, second.pk))
+        self.assertEqual([card['id'] for card in delta['changed']], [edited.pk, added.pk])
+        self.assertEqual(delta['changed'][0]['answer_html'], '<p>Новый <strong>ответ</strong></p>')
+        self.assertEqual(delta['deleted'], deleted_ids)
+        delta = self.client.get(f'{self.url}delta/', {'since': second.pk}).json()
+        self.assertEqual((delta['changed'], delta['deleted']), ([], []))
+
+        # старые версии удаляются вместе с файлами, от них клиент скачивает снимок целиком
+        for number in range(SNAPSHOT_KEEP):
+            Card.objects.create(question=f'Еще вопрос {number}', answer='Ответ', category=self.category)
+            self.build(self.category)
+        self.assertFalse(DeckSnapshot.objects.filter(pk=first.pk).exists())
+        self.assertEqual(len(os.listdir(self.root)), SNAPSHOT_KEEP)
+        self.assertEqual(self.client.get(f'{self.url}delta/', {'since': first.pk}).status_code, 410)
+
+
+class AsyncViewsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='reader', password='password')
+        cls.cards = create_cards(35)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+        self.async_client.force_login(self.user)
+
+    async def test_async_catalog_matches_sync(self):
+        for params in ('?page=2', '?sort=views&order=asc', '?pagination=cursor', '?search_query=Вопрос&sort=rank'):
+            sync_response = await sync_to_async(self.client.get)(f'/cards/catalog/{params}')
+            async_response = await self.async_client.get(f'/cards/async/catalog/{params}')
+            self.assertEqual(async_response.status_code, 200)
+            self.assertEqual([card.pk for card in async_response.context['cards']],
+                             [card.pk for card in sync_response.context['cards']])
+            self.assertEqual(async_response.context['total_count'], sync_response.context['total_count'])
+
+    async def test_async_detail_and_tag(self):
+        card = self.cards[0]
+        response = await self.async_client.get(f'/cards/async/{card.pk}/detail/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['card'].pk, card.pk)
+        response = await self.async_client.get('/cards/async/0/detail/')
+        self.assertEqual(response.status_code, 404)
+
+        tag = await Tag.objects.aget(name='tag0')
+        sync_response = await sync_to_async(self.client.get)(f'/cards/tags/{tag.pk}/?page=2')
+        async_response = await self.async_client.get(f'/cards/async/tags/{tag.pk}/?page=2')
+        self.assertEqual(async_response.status_code, 200)
+        self.assertEqual([item.pk for item in async_response.context['cards']],
+                         [item.pk for item in sync_response.context['cards']])
+
+
+    async def test_views_load_user_without_cache_decorator(self):
+        # без cache_for_anonymous пользователь еще не загружен из сессии: представление загружает его само
+        await Favorite.objects.acreate(user=self.user, card=self.cards[0])
+        session_key = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+        tag = await Tag.objects.aget(name='tag0')
+        for view, kwargs in ((async_views.catalog, {}), (async_views.cards_by_tag, {'tag_id': tag.pk}),
+                             (async_views.card_detail, {'pk': self.cards[0].pk})):
+            with self.subTest(view=view.__name__):
+                request = AsyncRequestFactory().get('/')
+                request.session = SessionStore(session_key)
+                request.user = SimpleLazyObject(partial(get_user, request))
+                response = await view(request, **kwargs)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(request.user, self.user)
+        # признак избранного посчитан для загруженного пользователя
+        self.assertContains(response, reverse('remove_favorite', args=[self.cards[0].pk]))
+
+
+class FixtureLoadingTest(TestCase):
+    def test_fixture_without_new_fields(self):
+        # фикстура в формате db_cards.json: без даты изменения карточки, slug категории и количества карточек у тега
+        fixture = [
+            {'model': 'cards.category', 'pk': 1, 'fields': {'name': 'General'}},
+            {'model': 'cards.category', 'pk': 2, 'fields': {'name': 'general'}},
+            {'model': 'cards.tag', 'pk': 1, 'fields': {'name': 'python'}},
+            {'model': 'cards.card', 'pk': 1, 'fields': {'question': 'Вопрос', 'answer': 'Ответ', 'category': 1,
+                                                        'upload_date': '2024-01-01T00:00:00Z', 'views': 0,
+                                                        'adds': 0, 'status': False, 'author': None}},
+            {'model': 'cards.cardtag', 'pk': 1, 'fields': {'card': 1, 'tag': 1}},
+        ]
+        with tempfile.NamedTemporaryFile('w', suffix='.json', encoding='utf-8') as file:
+            json.dump(fixture, file)
+            file.flush()
+            call_command('loaddata', file.name, verbosity=0)
+        card = Card.objects.get(pk=1)
+        self.assertEqual(card.updated_at, card.upload_date)
+        self.assertEqual(sorted(Category.objects.values_list('slug', flat=True)), ['general', 'general-2'])
+        self.assertEqual(Tag.objects.get(pk=1).cards_count, 1)
+
+
+def increment_shared_counter(location, times):
+    cache = SQLiteCache(location, {})
+    for _ in range(times):
+        cache.incr(counters.CARDS_COUNT_KEY)
+
+
+class SQLiteCacheTest(TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workdir)
+        self.location = f'{self.workdir}/cache.sqlite3'
+        self.cache = SQLiteCache(self.location, {})
+
+    def test_values_and_expiry(self):
+        self.cache.set('page', {'html': '<p>'}, timeout=60)
+        self.assertEqual(self.cache.get('page'), {'html': '<p>'})
+        self.assertFalse(self.cache.add('page', 'другое'))
+        self.cache.set('old', 1, timeout=-1)
+        self.assertIsNone(self.cache.get('old'))
+        self.assertTrue(self.cache.add('old', 2))
+        self.assertIs(self.cache.get_many(['flag', 'old']).get('old'), 2)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_incr_is_atomic_across_processes(self):
+        self.cache.set(counters.CARDS_COUNT_KEY, 0, timeout=None)
+        context = multiprocessing.get_context('fork')
+        processes = [context.Process(target=increment_shared_counter, args=(self.location, 200)) for _ in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.assertEqual(self.cache.get(counters.CARDS_COUNT_KEY), 800)
+
+
+class SQLitePragmasTest(TestCase):
+    def open_connection(self):
+        connection = connections.create_connection(DEFAULT_DB_ALIAS)
+        self.addCleanup(connection.close)
+        connection.ensure_connection()
+        return connection
+
+    def pragma(self, connection, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_new_connection_gets_pragmas(self):
+        connection = self.open_connection()
+        self.assertEqual(self.pragma(connection, 'busy_timeout'), settings.SQLITE_PRAGMAS['busy_timeout'])
+        self.assertEqual(self.pragma(connection, 'cache_size'), settings.SQLITE_PRAGMAS['cache_size'])
+        # synchronous=NORMAL
+        self.assertEqual(self.pragma(connection, 'synchronous'), 1)
+
+    def test_registered_on_startup(self):
+        # обработчик подключает приложение anki (AnkiConfig.ready), а в этом процессе модуль уже импортирован тестами
+        code = ('import django; django.setup(); from django.db.backends.signals import connection_created; '
+                'print(any(key[0] == "anki_sqlite_pragmas" for key, *_ in connection_created.receivers))')
+        result = subprocess.run([sys.executable, '-c', code], cwd=settings.BASE_DIR, capture_output=True, text=True,
+                                env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'anki.settings'}, check=True)
+        self.assertEqual(result.stdout.strip(), 'True')
+
+    @override_settings(SQLITE_PRAGMAS={'busy_timeout': 1234})
+    def test_pragmas_from_settings(self):
+        self.assertEqual(self.pragma(self.open_connection(), 'busy_timeout'), 1234)
+
+    def test_apply_sqlite_pragmas(self):
+        connection = self.open_connection()
+        apply_sqlite_pragmas(connection, {'cache_size': -1000, 'temp_store': 'MEMORY'})
+        self.assertEqual(self.pragma(connection, 'cache_size'), -1000)
+        # temp_store=MEMORY
+        self.assertEqual(self.pragma(connection, 'temp_store'), 2)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_STICKY_SECONDS=10)
+class ReplicaRouterTest(SimpleTestCase):
+    router = ReplicaRouter()
+
+    def read_in_replica_view(self, request):
+        """
+        Возвращает базы данных, выбранные роутером для карточек и пользователей внутри представления каталога
+        """
+        databases = {}
+
+        @replica_reads
+        def view(request):
+            databases['card'] = self.router.db_for_read(Card)
+            databases['user'] = self.router.db_for_read(get_user_model())
+            return HttpResponse()
+
+        view(request)
+        return databases
+
+    def test_reads_routed_to_replica_only_in_marked_views(self):
+        self.assertEqual(self.router.db_for_read(Card), 'default')
+        self.assertEqual(self.read_in_replica_view(RequestFactory().get('/cards/catalog/')),
+                         {'card': 'replica', 'user': 'default'})
+
+    def test_sticky_window_after_post(self):
+        factory = RequestFactory()
+        middleware = PrimaryStickinessMiddleware(lambda request: HttpResponse())
+        response = middleware(factory.post('/cards/add/'))
+        self.assertIn(STICKY_COOKIE, response.cookies)
+
+        request = factory.get('/cards/catalog/')
+        request.COOKIES[STICKY_COOKIE] = response.cookies[STICKY_COOKIE].value
+        self.assertEqual(self.read_in_replica_view(request)['card'], 'default')
+        # GET-запрос окно не продлевает
+        self.assertNotIn(STICKY_COOKIE, middleware(factory.get('/cards/catalog/')).cookies)
+
+    def test_write_pins_request_to_primary(self):
+        databases = {}
+
+        @replica_reads
+        def view(request):
+            self.router.db_for_write(Card)
+            databases['card'] = self.router.db_for_read(Card)
+            return HttpResponse()
+
+        view(RequestFactory().get('/cards/1/detail/'))
+        self.assertEqual(databases['card'], 'default')
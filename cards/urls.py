@@ -1,16 +1,57 @@
 from django.urls import path
-from . import views
+from . import api, async_views, views
+from .page_cache import cache_for_anonymous
 # cards/urls.py
 # будет иметь префикс в urls/cards/
 
 urlpatterns = [
-    path('catalog/', views.CardCatalogView.as_view(), name='catalog'), # Список всех карточек
-    path('categories/', views.get_categories, name='categories'),  # Список всех категорий
-    path('categories/<slug:slug>/', views.get_cards_by_category, name='category'),  # Карточки по категории
-    path('tags/<int:tag_id>/', views.get_cards_by_tag, name='get_cards_by_tag'),  # Карточки по тегу
-    path('<int:pk>/detail/', views.CardDetailView.as_view(), name='detail_card_by_id'), # Детальная страница карточки по pk
+    # каталог, карточки по тегу и детальная страница кешируются для анонимных пользователей
+    path('catalog/', cache_for_anonymous('catalog', views.catalog_cache_params)(views.CardCatalogView.as_view()),
+         name='catalog'), # Список всех карточек
+    path('categories/', cache_for_anonymous('categories', views.empty_cache_params)(
+        views.CategoryListView.as_view()), name='categories'),  # Список всех категорий
+    # slug категории может содержать буквы кириллицы, поэтому конвертер str, а не slug
+    path('categories/<str:slug>/', cache_for_anonymous('category', views.category_cache_params)(
+        views.CategoryCatalogView.as_view()), name='category'),  # Карточки по категории
+    path('tags/', cache_for_anonymous('tag_cloud', views.empty_cache_params)(views.TagCloudView.as_view()),
+         name='tag_cloud'),  # Облако тегов
+    path('tags/<int:tag_id>/', cache_for_anonymous('tag', views.tag_cache_params)(views.TagCardsView.as_view()),
+         name='get_cards_by_tag'),  # Карточки по тегу
+    path('tags/match/', cache_for_anonymous('tag_match', views.tag_match_cache_params)(views.TagCardsView.as_view()),
+         name='cards_by_tags'),  # Карточки со всеми выбранными тегами (?tags=python,sql)
+    path('stats/', cache_for_anonymous('stats', views.stats_cache_params)(views.LeaderboardView.as_view()),
+         name='stats'),  # Рейтинги по сводной статистике
+    path('stats/json/', cache_for_anonymous('stats_json', views.stats_cache_params)(views.leaderboards_json),
+         name='stats_json'),  # Рейтинги в формате JSON
+    path('<int:pk>/detail/', cache_for_anonymous('card', views.card_cache_params,
+                                                 on_hit=views.count_cached_card_view)(views.CardDetailView.as_view()),
+         name='detail_card_by_id'), # Детальная страница карточки по pk
     path('<int:pk>/edit/', views.EditCardUpdateView.as_view(), name='edit_card'), # Страница с формой редактирования карточки
     path('<int:pk>/delete/', views.CardDeleteView.as_view(), name='delete_card'), # Страница с уведомлением об удалении карточки
-    path('add/', views.AddCardCreateView.as_view(), name='add_card') # Страница с формой добавления карточки
+    path('add/', views.AddCardCreateView.as_view(), name='add_card'), # Страница с формой добавления карточки
+    path('export/', views.export_cards, name='export_cards'),  # Выгрузка колоды (JSON Lines, CSV, TSV)
+    path('review/due/', views.get_due_cards, name='due_cards'),  # Очередь карточек для повторения (JSON)
+    path('<int:pk>/review/', views.review_card, name='review_card'),  # Оценка ответа на карточку (JSON)
+    path('<int:pk>/favorite/', views.add_favorite, name='add_favorite'),  # Добавление в избранное
+    path('<int:pk>/favorite/remove/', views.remove_favorite, name='remove_favorite'),  # Удаление из избранного
+
+    # JSON API только для чтения с ETag и ответом 304 Not Modified (cards/api.py)
+    path('api/cards/', api.card_list, name='api_cards'),  # Список карточек (параметры каталога)
+    path('api/cards/<int:pk>/', api.card_detail, name='api_card'),  # Карточка с полным ответом
+    path('api/tags/', api.tag_list, name='api_tags'),  # Теги по количеству карточек
+    path('api/categories/', api.category_list, name='api_categories'),  # Категории с количеством карточек
+    # снимки колод (kind - categories/<slug> или tags/<id>) для офлайн-повторения (cards/snapshots.py)
+    path('api/snapshots/<str:kind>/<str:key>/', api.deck_snapshot, name='api_snapshot'),  # Последний снимок
+    path('api/snapshots/<str:kind>/<str:key>/delta/', api.deck_snapshot_delta,
+         name='api_snapshot_delta'),  # Изменения от версии клиента (?since=<версия>)
+
+    # асинхронные версии страниц для запуска под ASGI (cards/async_views.py), кеш страниц общий с синхронными
+    path('async/catalog/', cache_for_anonymous('catalog', views.catalog_cache_params)(async_views.catalog),
+         name='async_catalog'),
+    path('async/tags/<int:tag_id>/', cache_for_anonymous('tag', views.tag_cache_params)(async_views.cards_by_tag),
+         name='async_cards_by_tag'),
+    path('async/<int:pk>/detail/', cache_for_anonymous('card', views.card_cache_params,
+                                                       on_hit=views.count_cached_card_view)(async_views.card_detail),
+         name='async_detail_card'),
 
 ]
\ No newline at end of file
@@ -0,0 +1,123 @@
+import atexit
+import logging
+import os
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.models import Case, F, Value, When
+
+from .models import Card
+
+logger = logging.getLogger(__name__)
+
+# Буферизованный счетчик просмотров карточек.
+# Просмотры накапливаются в памяти процесса и периодически записываются в БД одним UPDATE
+# на все карточки, просмотренные за интервал (CARD_VIEWS_FLUSH_INTERVAL секунд в settings).
+# При штатной остановке процесса оставшиеся просмотры записываются обработчиком atexit.
+# Просмотры записываются только в ту базу, для которой были накоплены: если база сменилась (например,
+# тестовая база уже удалена и соединение снова указывает на рабочую), просмотры отбрасываются.
+
+DEFAULT_FLUSH_INTERVAL = 10
+
+
+class ViewCounter:
+    """
+    Класс накапливает просмотры карточек и записывает их в БД пакетами
+    """
+
+    def __init__(self):
+        self._pending = Counter()
+        # имя базы данных, для которой накоплены просмотры в буфере
+        self._database = None
+        self._lock = threading.Lock()
+        self._worker = None
+        self._worker_pid = None
+        self._stopped = threading.Event()
+
+    @property
+    def flush_interval(self):
+        return getattr(settings, 'CARD_VIEWS_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL)
+
+    def hit(self, card_id):
+        """
+        Метод учитывает один просмотр карточки
+        :param card_id: идентификатор карточки
+        """
+        with self._lock:
+            if not self._pending:
+                self._database = self._current_database()
+            self._pending[card_id] += 1
+        if self.flush_interval <= 0:
+            # буферизация отключена - записываем просмотр сразу
+            self.flush()
+        else:
+            self._ensure_worker()
+
+    def pending(self, card_id):
+        """
+        Метод возвращает количество просмотров карточки, еще не записанных в БД
+        :param card_id: идентификатор карточки
+        """
+        with self._lock:
+            return self._pending.get(card_id, 0)
+
+    def flush(self):
+        """
+        Метод записывает накопленные просмотры в БД одним запросом UPDATE
+        :return: количество обновленных карточек
+        """
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            database = self._database
+        if not pending:
+            return 0
+        if database != self._current_database():
+            logger.warning('Просмотры карточек не записаны: база данных %s, для которой они накоплены, '
+                           'больше не используется', database)
+            return 0
+
+        increment = Case(*[When(pk=card_id, then=Value(count)) for card_id, count in pending.items()],
+                         default=Value(0))
+        try:
+            return Card.objects.filter(pk__in=pending.keys()).update(views=F('views') + increment)
+        except Exception:
+            # возвращаем просмотры в буфер вместе с их базой, чтобы записать их при следующей попытке
+            with self._lock:
+                if not self._pending or self._database == database:
+                    self._database = database
+                    self._pending.update(pending)
+                    requeued = True
+                else:
+                    requeued = False
+            logger.exception('Не удалось записать просмотры карточек')
+            if not requeued:
+                logger.warning('Просмотры карточек отброшены: за время записи база данных сменилась')
+            return 0
+
+    @staticmethod
+    def _current_database():
+        return connections[DEFAULT_DB_ALIAS].settings_dict['NAME']
+
+    def _ensure_worker(self):
+        # после fork (например, воркеры gunicorn) поток родительского процесса в дочернем не работает
+        if self._worker is not None and self._worker_pid == os.getpid():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker_pid == os.getpid():
+                return
+            self._worker = threading.Thread(target=self._run, name='card-views-flush', daemon=True)
+            self._worker_pid = os.getpid()
+            self._worker.start()
+
+    def _run(self):
+        # если буферизацию отключили после запуска потока, просмотры записываются сразу, а поток просто ждет
+        while not self._stopped.wait(self.flush_interval or DEFAULT_FLUSH_INTERVAL):
+            self.flush()
+            # соединение потока не держим открытым между записями
+            connection.close()
+
+
+view_counter = ViewCounter()
+atexit.register(view_counter.flush)
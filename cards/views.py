@@ -1,19 +1,41 @@
+import math
 from typing import Any
 
 from django.contrib.auth import get_user_model
+from django.contrib.auth.decorators import login_required
+from django.contrib.auth.views import redirect_to_login
 from django.core.cache import cache
-from django.db.models import F, Q
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import Count, Exists, F, OuterRef, Q
+from django.db.models.expressions import RawSQL
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse, Http404
 from django.shortcuts import render, get_object_or_404
 from django.template.context_processors import request
 from django.shortcuts import render, redirect
 from django.urls import reverse_lazy
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.decorators import method_decorator
+from django.utils.functional import cached_property
+from django.utils.http import url_has_allowed_host_and_scheme
+from django.views.decorators.http import require_POST
 from django.views.generic import TemplateView, DetailView
 from django.views.generic.edit import CreateView, UpdateView, DeleteView
 from django.views.generic.list import ListView
 
+from anki.routers import replica_reads
+
+from . import counters, sorting
+from .exporters import CONTENT_TYPES, EXPORT_FORMATS, export_deck
 from .forms import CardForm
-from .models import Card
+from .models import Card, CardReview, CardTag, Category, Favorite, ReviewProgress, Tag
+from .page_cache import PAGE_CACHE_TIMEOUT, get_catalog_version
+from .pagination import CachedCountPaginator, paginate_keyset
+from .rendering import content_hash
+from .scheduler import Grade, schedule
+from .search import CardSearchResults, build_match_query, filter_matching, rank_sql
+from .stats import get_leaderboards, get_stats_version
+from .view_counter import view_counter
 from django.views.decorators.cache import cache_page
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 
@@ -29,6 +51,15 @@ info = {
         {"title": "Каталог",
          "url": "/cards/catalog/",
          "url_name": "catalog"},
+        {"title": "Категории",
+         "url": "/cards/categories/",
+         "url_name": "categories"},
+        {"title": "Теги",
+         "url": "/cards/tags/",
+         "url_name": "tag_cloud"},
+        {"title": "Рейтинги",
+         "url": "/cards/stats/",
+         "url_name": "stats"},
     ],
 
 }
@@ -37,45 +68,29 @@ info = {
 class MenuMixin:
     """
     Класс-миксин для добавления меню в контекст шаблона страницы.
-    Добывает и кеширует cards_count, users_count, menu
+    Добывает cards_count, users_count (счетчики в кеше обновляются сигналами, см. cards/counters.py), menu
     """
-    timeout = 30
 
     def get_menu(self):
         """
-        Метод добывает меню, кеширует menu
+        Метод добывает меню (статический список, кеширование не требуется)
         :return: menu
         """
-        menu = cache.get('menu')
-        if not menu:
-            menu = info['menu']
-            cache.set('menu', menu, timeout=self.timeout)
-
-        return menu
+        return info['menu']
 
     def get_cards_count(self):
         """
-        Метод добывает количество карточек, кеширует cards_count
+        Метод добывает количество карточек из счетчика в кеше
         :return: количество карточек
         """
-        cards_count = cache.get('cards_count')
-        if not cards_count:
-            cards_count = Card.objects.count()
-            cache.set('cards_count', cards_count, timeout=self.timeout)
-
-        return cards_count
+        return counters.get_count(counters.CARDS_COUNT_KEY)
 
     def get_users_count(self):
         """
-        Метод добывает количество пользователей, кеширует users_count
+        Метод добывает количество пользователей из счетчика в кеше
         :return: количество пользователей
         """
-        users_count = cache.get('users_count')
-        if not users_count:
-            users_count = get_user_model().objects.count()
-            cache.set('users_count', users_count, timeout=self.timeout)
-
-        return users_count
+        return counters.get_count(counters.USERS_COUNT_KEY)
 
     def get_context_data(self, **kwargs):
         """
@@ -108,6 +123,8 @@ class AboutView(MenuMixin, TemplateView):
     template_name = 'about.html'
 
 
+# чтение каталога, карточек по тегу и детальной страницы может идти с реплики БД (anki/routers.py)
+@method_decorator(replica_reads, name='dispatch')
 class CardCatalogView(MenuMixin, ListView):
     """
     Класс отображает карточки для представления в каталоге.
@@ -120,6 +137,40 @@ class CardCatalogView(MenuMixin, ListView):
     context_object_name = 'cards'
     paginate_by = 30
 
+    # время кеширования количества найденных карточек
+    count_timeout = 60
+    # упорядочивать результаты поиска по релевантности прямо в поисковом индексе
+    # (только для всего каталога: индекс не знает о дополнительных условиях выборки)
+    rank_by_search_index = True
+
+    def get_sort(self):
+        """
+        Метод возвращает ключ сортировки из GET-запроса, проверенный по реестру (cards/sorting.py).
+        При поиске по умолчанию карточки упорядочиваются по релевантности ('rank')
+        :return: ключ сортировки
+        """
+        searching = bool(self.request.GET.get('search_query', ''))
+        return sorting.resolve_sort(self.request.GET.get('sort'), searching=searching)
+
+    def get_order(self):
+        """
+        Метод возвращает направление сортировки из GET-запроса ('desc' по умолчанию)
+        """
+        return sorting.resolve_order(self.request.GET.get('order'))
+
+    def use_cursor_pagination(self):
+        """
+        Метод определяет, включена ли курсорная навигация (GET-параметр pagination=cursor).
+        Доступна для сортировок из реестра: для них есть составные индексы (поле, id)
+        """
+        return self.request.GET.get('pagination') == 'cursor' and self.get_sort() in sorting.CATALOG_SORTS
+
+    def get_base_queryset(self):
+        """
+        Метод возвращает карточки каталога до поиска и сортировки (в каталоге категории - карточки категории)
+        """
+        return Card.objects.for_listing().with_favorites(self.request.user)
+
     def get_queryset(self):
         """
         Метод для модификации начального запроса к БД.
@@ -127,27 +178,74 @@ class CardCatalogView(MenuMixin, ListView):
         :return: сет контекста
         """
         # Параметры для сортировки из GET-запроса
-        sort = self.request.GET.get('sort', 'upload_date')  # по дате публикации
-        order = self.request.GET.get('order', 'desc')  # по убывающему порядку
+        sort = self.get_sort()  # по дате публикации (при поиске - по релевантности)
         search_query = self.request.GET.get('search_query', '')  # поисковый запрос
 
-        # условие для определения направления сортировки
-        if order == 'asc':
-            order_by = sort
-        else:
-            order_by = f'-{sort}'
+        queryset = self.get_base_queryset()
 
-        # Фильтрация карточек по поисковому запросу и сортировка с использованием Q объектов
-        # iregex - позволяет сравнивать строки по регулярному выражению в регистронезависимом режиме
+        # Поиск выполняется по полнотекстовому индексу (cards/search.py) вместо regex-сравнения каждой строки
+        if search_query and sort == sorting.RANK_SORT and self.rank_by_search_index:
+            # найденные карточки упорядочены по релевантности, на страницу загружаются только нужные карточки
+            return CardSearchResults(search_query, queryset)
+        if search_query and sort == sorting.RANK_SORT:
+            # выборка ограничена (каталог категории): релевантность считается только для найденных карточек выборки
+            return (filter_matching(queryset, search_query)
+                    .annotate(rank=RawSQL(*rank_sql(search_query))).order_by('rank', '-pk'))
         if search_query:
-            queryset = Card.objects.filter(
-                Q(question__iregex=search_query) |
-                Q(answer__iregex=search_query) |
-                Q(tags__name__iregex=search_query)
-            ).select_related('category').prefetch_related('tags').order_by(order_by).distinct()
-        else:
-            queryset = Card.objects.select_related('category').prefetch_related('tags').order_by(order_by)
-        return queryset
+            queryset = filter_matching(queryset, search_query)
+
+        # ключ сортировки уже проверен по реестру, поэтому в order_by попадают только индексированные поля
+        return queryset.order_by(*sorting.order_by(sort, self.get_order()))
+
+    def get_total_count(self, queryset):
+        """
+        Метод возвращает количество карточек в каталоге без COUNT(*) на каждой странице:
+        весь каталог - из счетчика карточек, результаты поиска - из кеша
+        :param queryset: карточки каталога (QuerySet или CardSearchResults)
+        :return: количество карточек
+        """
+        search_query = self.request.GET.get('search_query', '')
+        if not search_query:
+            return counters.get_count(counters.CARDS_COUNT_KEY)
+        key = self.get_search_count_key(search_query)
+        count = cache.get(key)
+        if count is None:
+            count = queryset.count()
+            cache.set(key, count, timeout=self.count_timeout)
+        return count
+
+    def get_search_count_key(self, search_query):
+        """
+        Метод возвращает ключ кеша количества найденных карточек
+        """
+        return f'catalog_count:{content_hash(build_match_query(search_query))}'
+
+    def get_paginator(self, queryset, per_page, orphans=0, allow_empty_first_page=True, **kwargs):
+        return CachedCountPaginator(queryset, per_page, count_func=lambda: self.get_total_count(queryset),
+                                    orphans=orphans, allow_empty_first_page=allow_empty_first_page, **kwargs)
+
+    def paginate_queryset(self, queryset, page_size):
+        """
+        Метод разбивает карточки на страницы: постранично (page) или по курсору (pagination=cursor)
+        """
+        if not self.use_cursor_pagination():
+            return super().paginate_queryset(queryset, page_size)
+        page = paginate_keyset(queryset, sorting.sort_field(self.get_sort()), self.get_order() != 'asc',
+                               self.request.GET.get('cursor', ''), page_size)
+        return None, page, page.object_list, page.has_next() or page.has_previous()
+
+    def get_listing_context(self):
+        """
+        Метод возвращает параметры сортировки и поиска для шаблона каталога
+        (используется и асинхронным каталогом, cards/async_views.py)
+        """
+        return {
+            'sort': self.get_sort(),
+            'order': self.get_order(),
+            'sort_options': sorting.CATALOG_SORTS,
+            'search_query': self.request.GET.get('search_query', ''),
+            'cursor_pagination': self.use_cursor_pagination(),
+        }
 
     # Метод для добавления дополнительного контекста
     def get_context_data(self, **kwargs) -> dict[str, Any]:
@@ -159,41 +257,422 @@ class CardCatalogView(MenuMixin, ListView):
         # Получение существующего контекста из базового класса
         context = super().get_context_data(**kwargs)
         # Добавление дополнительных данных в контекст (# меню добавим через MenuMixin)
-        context['sort'] = self.request.GET.get('sort', 'upload_date')
-        context['order'] = self.request.GET.get('order', 'desc')
-        context['search_query'] = self.request.GET.get('search_query', '')
+        context.update(self.get_listing_context())
+        context['total_count'] = self.get_total_count(self.object_list)
+        if context['paginator'] is not None:
+            # номера страниц вокруг текущей вместо всего диапазона
+            context['page_range'] = context['paginator'].get_elided_page_range(context['page_obj'].number)
         # меню добавим через MenuMixin
         return context
 
 
-def get_categories(request):
+# Значимые параметры запросов для кеша страниц анонимных пользователей (cards/page_cache.py, cards/urls.py)
+
+def catalog_cache_params(request):
+    search_query = request.GET.get('search_query', '')
+    return (sorting.resolve_sort(request.GET.get('sort'), searching=bool(search_query)),
+            sorting.resolve_order(request.GET.get('order')), search_query, request.GET.get('page', '1'),
+            request.GET.get('pagination', ''), request.GET.get('cursor', ''))
+
+
+def tag_cache_params(request, tag_id):
+    return tag_id, request.GET.get('page', '1')
+
+
+def category_cache_params(request, slug):
+    return (slug, *catalog_cache_params(request))
+
+
+def tag_match_cache_params(request):
+    return request.GET.get('tags', '').lower(), request.GET.get('page', '1')
+
+
+def empty_cache_params(request):
+    # страницы без значимых параметров запроса (облако тегов, список категорий)
+    return ()
+
+
+def stats_cache_params(request):
+    # рейтинги меняются только при пересчете статистики (cards/stats.py)
+    return get_stats_version(),
+
+
+def card_cache_params(request, pk):
+    return pk,
+
+
+def count_cached_card_view(request, pk):
+    # страница карточки отдана из кеша, но просмотр все равно учитывается
+    view_counter.hit(pk)
+
+
+def get_category_counts():
+    """
+    Функция возвращает категории с количеством карточек, посчитанным одним запросом с группировкой.
+    Результат кешируется по версии каталога: она меняется при добавлении, удалении и изменении карточек
+    :return: список словарей {'id', 'name', 'slug', 'cards_count'}, упорядоченный по имени
+    """
+    key = f'category_counts:{get_catalog_version()}'
+    categories = cache.get(key)
+    if categories is None:
+        categories = list(Category.objects.annotate(cards_count=Count('card')).order_by('name', 'id')
+                          .values('id', 'name', 'slug', 'cards_count'))
+        cache.set(key, categories, timeout=PAGE_CACHE_TIMEOUT)
+    return categories
+
+
+@method_decorator(replica_reads, name='dispatch')
+class CategoryListView(MenuMixin, TemplateView):
     """
-    Функция возвращает все категории для представления в каталоге
-    Не используется в данном проекте
+    Класс для представления списка категорий с количеством карточек в каждой
     """
-    return render(request, 'base.html', info)
+    template_name = 'cards/categories.html'
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['categories'] = get_category_counts()
+        return context
 
-def get_cards_by_category(request, slug):
+
+class CategoryCatalogView(CardCatalogView):
     """
-    Функция возвращает карточки по категории для представления в каталоге
-    Не используется в данном проекте
+    Класс отображает карточки категории с теми же сортировками, поиском и навигацией, что и каталог.
+    Выборка идет по составным индексам (CategoryID, поле сортировки, CardID)
     """
-    return HttpResponse(f'Cards by category {slug}')
+    rank_by_search_index = False
+
+    @cached_property
+    def category(self):
+        return get_object_or_404(Category.objects.only('id', 'name', 'slug'), slug=self.kwargs['slug'])
 
+    def get_base_queryset(self):
+        return super().get_base_queryset().filter(category=self.category)
 
-def get_cards_by_tag(request, tag_id):
+    def get_total_count(self, queryset):
+        """
+        Метод возвращает количество карточек категории из закешированного списка категорий
+        (результаты поиска внутри категории считаются как в каталоге)
+        """
+        if self.request.GET.get('search_query', ''):
+            return super().get_total_count(queryset)
+        counts = {category['id']: category['cards_count'] for category in get_category_counts()}
+        return counts.get(self.category.pk, 0)
+
+    def get_search_count_key(self, search_query):
+        return f'{super().get_search_count_key(search_query)}:{self.category.pk}'
+
+    def get_listing_context(self):
+        context = super().get_listing_context()
+        context['category'] = self.category
+        return context
+
+
+# количество тегов в облаке тегов и уровней размера шрифта
+TAG_CLOUD_SIZE = 100
+TAG_CLOUD_LEVELS = 5
+
+
+def get_tag_cloud():
+    """
+    Функция возвращает самые популярные теги для облака тегов с уровнем размера шрифта (1 - TAG_CLOUD_LEVELS).
+    Облако кешируется по версии каталога: она меняется при любом изменении карточек и их тегов
+    :return: список словарей {'id', 'name', 'cards_count', 'level'}, упорядоченный по имени тега
     """
-    Функция возвращает карточки по тегу для представления в каталоге
+    key = f'tag_cloud:{get_catalog_version()}'
+    cloud = cache.get(key)
+    if cloud is None:
+        # выборка по индексу (CardsCount, TagID), количество карточек денормализовано в Tag.cards_count
+        tags = list(Tag.objects.filter(cards_count__gt=0).order_by('-cards_count', '-id')
+                    .values('id', 'name', 'cards_count')[:TAG_CLOUD_SIZE])
+        if tags:
+            # логарифмическая шкала: несколько очень популярных тегов не сжимают остальные до минимального размера
+            low, high = math.log(tags[-1]['cards_count']), math.log(tags[0]['cards_count'])
+            for tag in tags:
+                share = (math.log(tag['cards_count']) - low) / (high - low) if high > low else 1
+                tag['level'] = 1 + round(share * (TAG_CLOUD_LEVELS - 1))
+        cloud = sorted(tags, key=lambda tag: tag['name'])
+        cache.set(key, cloud, timeout=PAGE_CACHE_TIMEOUT)
+    return cloud
+
+
+@method_decorator(replica_reads, name='dispatch')
+class TagCloudView(MenuMixin, TemplateView):
     """
-    cards = Card.objects.filter(tags__id=tag_id)
-    context = {
-        'cards': cards,
-        'menu': info['menu'],
+    Класс для представления облака тегов
+    """
+    template_name = 'cards/tag_cloud.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['tags'] = get_tag_cloud()
+        return context
+
+
+@method_decorator(replica_reads, name='dispatch')
+class TagCardsView(MenuMixin, ListView):
+    """
+    Класс отображает постранично карточки с тегом (tags/<tag_id>/)
+    или со всеми тегами из GET-параметра tags (пересечение тегов: tags/match/?tags=python,sql)
+    """
+    template_name = 'cards/tag_cards.html'
+    context_object_name = 'cards'
+    paginate_by = 30
+
+    # наибольшее количество тегов в пересечении
+    max_tags = 5
+    # время кеширования количества карточек в пересечении тегов
+    count_timeout = 60
+
+    def get_tag_names(self):
+        """
+        Метод возвращает имена тегов из GET-параметра tags (теги хранятся в нижнем регистре, см. CardForm)
+        """
+        names = [name.strip().lower() for name in self.request.GET.get('tags', '').split(',') if name.strip()]
+        return list(dict.fromkeys(names))[:self.max_tags]
+
+    @cached_property
+    def tags(self):
+        """
+        Выбранные теги, упорядоченные от самого редкого. None, если какого-то из тегов нет
+        """
+        queryset = Tag.objects.only('id', 'name', 'cards_count').order_by('cards_count', 'id')
+        if 'tag_id' in self.kwargs:
+            return [get_object_or_404(queryset, pk=self.kwargs['tag_id'])]
+        names = self.get_tag_names()
+        tags = list(queryset.filter(name__in=names))
+        return tags if len(tags) == len(names) else None
+
+    def get_queryset(self):
+        """
+        Метод возвращает карточки, у которых есть все выбранные теги.
+        Пересечение считается по индексу CardTags(TagID, CardID): связи выбранных тегов группируются
+        по карточке, и остаются карточки, у которых нашлись все теги
+        """
+        queryset = Card.objects.for_listing().with_favorites(self.request.user).order_by('-upload_date', '-pk')
+        if not self.tags:
+            return queryset.none()
+        if len(self.tags) == 1:
+            matched = CardTag.objects.filter(tag=self.tags[0]).values('card_id')
+        else:
+            matched = (CardTag.objects.filter(tag__in=self.tags).values('card_id')
+                       .annotate(matched=Count('tag_id')).filter(matched=len(self.tags)).values('card_id'))
+        return queryset.filter(pk__in=matched)
+
+    def get_total_count(self, queryset):
+        """
+        Метод возвращает количество карточек: для одного тега - из Tag.cards_count,
+        для пересечения тегов - из кеша (по версии каталога)
+        """
+        if not self.tags:
+            return 0
+        if len(self.tags) == 1:
+            return self.tags[0].cards_count
+        key = f'tag_match_count:{get_catalog_version()}:{",".join(str(tag.pk) for tag in self.tags)}'
+        count = cache.get(key)
+        if count is None:
+            count = queryset.count()
+            cache.set(key, count, timeout=self.count_timeout)
+        return count
+
+    def get_paginator(self, queryset, per_page, orphans=0, allow_empty_first_page=True, **kwargs):
+        return CachedCountPaginator(queryset, per_page, count_func=lambda: self.get_total_count(queryset),
+                                    orphans=orphans, allow_empty_first_page=allow_empty_first_page, **kwargs)
+
+    def get_tags_context(self):
+        """
+        Метод возвращает выбранные теги для шаблона (используется и асинхронной версией, cards/async_views.py)
+        """
+        tags = self.tags or []
+        return {
+            'tags': tags,
+            'tags_query': ','.join(tag.name for tag in tags) or self.request.GET.get('tags', ''),
+        }
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update(self.get_tags_context())
+        context['total_count'] = context['paginator'].count
+        context['page_range'] = context['paginator'].get_elided_page_range(context['page_obj'].number)
+        return context
+
+
+@method_decorator(replica_reads, name='dispatch')
+class LeaderboardView(MenuMixin, TemplateView):
+    """
+    Класс для представления рейтингов карточек, категорий, тегов и авторов по сводной статистике
+    """
+    template_name = 'cards/stats.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['leaderboards'] = get_leaderboards()
+        # в рейтингах время пересчета хранится строкой ISO 8601 (рейтинги отдаются и в JSON)
+        context['refreshed_at'] = parse_datetime(context['leaderboards']['refreshed_at'] or '')
+        return context
+
+
+@replica_reads
+def leaderboards_json(request):
+    """
+    Функция возвращает рейтинги в формате JSON (для внешних панелей мониторинга)
+    """
+    return JsonResponse(get_leaderboards())
+
+
+# ограничение количества карточек в одном запросе очереди повторения
+MAX_DUE_CARDS = 100
+
+
+def review_to_dict(card, review=None):
+    """
+    Функция преобразует карточку и состояние ее повторения в словарь для JSON-ответа
+    """
+    return {
+        'id': card.pk,
+        'question': card.question,
+        'answer_html': card.get_answer_html(),
+        'category': card.category.name,
+        'is_new': review is None,
+        'due': review.due.isoformat() if review else None,
+        'interval': review.interval if review else 0,
+        'ease': review.ease if review else None,
+        'lapses': review.lapses if review else 0,
     }
-    return render(request, 'cards/catalog.html', context)
 
 
+@login_required
+def get_due_cards(request):
+    """
+    Функция возвращает ближайшие к повторению карточки пользователя в формате JSON.
+    Выборка идет по индексу (user, due) и не просматривает всю историю повторений.
+    Если повторять нечего, очередь дополняется новыми (еще не изученными) карточками, если не передано new=0.
+    Новые карточки выдаются по возрастанию id начиная после позиции пользователя (ReviewProgress), поэтому
+    уже изученные карточки с меньшими id не просматриваются
+    """
+    try:
+        limit = min(max(int(request.GET.get('limit', 20)), 1), MAX_DUE_CARDS)
+    except ValueError:
+        limit = 20
+
+    reviews = (CardReview.objects.filter(user=request.user, due__lte=timezone.now())
+               .select_related('card__category').order_by('due')[:limit])
+    cards = [review_to_dict(review.card, review) for review in reviews]
+
+    if len(cards) < limit and request.GET.get('new', '1') != '0':
+        cursor = (ReviewProgress.objects.filter(user=request.user)
+                  .values_list('new_cards_cursor', flat=True).first() or 0)
+        # после позиции остаются только карточки, изученные вне очереди: NOT EXISTS проверяет каждую
+        # по уникальному индексу (user, card)
+        new_cards = (Card.objects.select_related('category').filter(pk__gt=cursor)
+                     .filter(~Exists(CardReview.objects.filter(user=request.user, card=OuterRef('pk'))))
+                     .order_by('pk')[:limit - len(cards)])
+        cards.extend(review_to_dict(card) for card in new_cards)
+
+    return JsonResponse({'cards': cards})
+
+
+@login_required
+@require_POST
+def review_card(request, pk):
+    """
+    Функция принимает оценку ответа (grade: 0 - снова, 1 - трудно, 2 - хорошо, 3 - легко)
+    и планирует следующее повторение карточки
+    """
+    try:
+        grade = Grade(int(request.POST.get('grade', '')))
+    except ValueError:
+        return JsonResponse({'error': 'Неверная оценка ответа'}, status=400)
+
+    card = get_object_or_404(Card.objects.select_related('category'), pk=pk)
+    with transaction.atomic():
+        review, created = CardReview.objects.select_for_update().get_or_create(
+            user=request.user, card=card, defaults={'due': timezone.now()}
+        )
+        schedule(review, grade)
+        review.save()
+        if created:
+            # новая карточка изучена - позиция в очереди новых карточек сдвигается за нее
+            ReviewProgress.objects.get_or_create(user=request.user)
+            ReviewProgress.objects.filter(user=request.user, new_cards_cursor__lt=card.pk).update(
+                new_cards_cursor=card.pk)
+
+    return JsonResponse(review_to_dict(card, review))
+
+
+def favorite_response(request, card_id, is_favorite):
+    """
+    Функция возвращает ответ на добавление или удаление из избранного: для формы на странице -
+    перенаправление обратно (POST-параметр next), для запросов из скриптов - JSON с новым счетчиком
+    """
+    next_url = request.POST.get('next', '')
+    if next_url and url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()},
+                                                    require_https=request.is_secure()):
+        return redirect(next_url)
+    adds = Card.objects.filter(pk=card_id).values_list('adds', flat=True).first()
+    return JsonResponse({'id': card_id, 'is_favorite': is_favorite, 'adds': adds})
+
+
+@login_required
+@require_POST
+def add_favorite(request, pk):
+    """
+    Функция добавляет карточку в избранное пользователя. Повторное добавление ничего не меняет.
+    Запись в избранном и счетчик Card.adds изменяются в одной транзакции, счетчик увеличивается
+    выражением F('adds') + 1 в самом UPDATE, поэтому одновременные добавления не теряются
+    """
+    card = get_object_or_404(Card.objects.only('pk'), pk=pk)
+    with transaction.atomic():
+        # при одновременном добавлении второй запрос получит IntegrityError внутри get_or_create
+        # и найдет уже созданную запись (created=False)
+        _, created = Favorite.objects.get_or_create(user=request.user, card=card)
+        if created:
+            Card.objects.filter(pk=card.pk).update(adds=F('adds') + 1)
+    return favorite_response(request, card.pk, True)
+
+
+@login_required
+@require_POST
+def remove_favorite(request, pk):
+    """
+    Функция убирает карточку из избранного пользователя. Удаление отсутствующей записи ничего не меняет
+    """
+    card = get_object_or_404(Card.objects.only('pk'), pk=pk)
+    with transaction.atomic():
+        deleted, _ = Favorite.objects.filter(user=request.user, card=card).delete()
+        if deleted:
+            Card.objects.filter(pk=card.pk).update(adds=F('adds') - 1)
+    return favorite_response(request, card.pk, False)
+
+
+def export_cards(request):
+    """
+    Функция выгружает колоду карточек потоком в формате JSON Lines, CSV или TSV (Anki).
+    Параметры GET-запроса: format, category (id категории), tag (id тега), mine=1 (карточки пользователя)
+    """
+    file_format = request.GET.get('format', 'jsonl')
+    if file_format not in EXPORT_FORMATS:
+        raise Http404('Неизвестный формат выгрузки')
+
+    queryset = Card.objects.all()
+    filename = 'cards'
+    if request.GET.get('category', '').isdigit():
+        queryset = queryset.filter(category_id=request.GET['category'])
+        filename += f'_category_{request.GET["category"]}'
+    if request.GET.get('tag', '').isdigit():
+        queryset = queryset.filter(tags__id=request.GET['tag'])
+        filename += f'_tag_{request.GET["tag"]}'
+    if request.GET.get('mine'):
+        if not request.user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        queryset = queryset.filter(author=request.user)
+        filename += f'_{request.user.username}'
+
+    response = StreamingHttpResponse(export_deck(queryset, file_format), content_type=CONTENT_TYPES[file_format])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{file_format}"'
+    return response
+
+
+@method_decorator(replica_reads, name='dispatch')
 class CardDetailView(MenuMixin, DetailView):
     """
     Класс для детального представления карточки.
@@ -206,6 +685,9 @@ class CardDetailView(MenuMixin, DetailView):
     # Переопределяем имя переменной в контексте шаблона на 'card' (до этого было 'cards')
     context_object_name = 'card'
 
+    def get_queryset(self):
+        return super().get_queryset().with_favorites(self.request.user)
+
     def get_object(self, queryset=None):
         """
         Метод для обновления счетчика просмотров при каждом отображении детальной страницы карточки
@@ -214,8 +696,10 @@ class CardDetailView(MenuMixin, DetailView):
         """
         # Получаем объект по переданному в URL параметров pk карточки
         object_view = super().get_object(queryset=queryset)
-        # Увеличиваем счетчик просмотров на 1
-        Card.objects.filter(pk=object_view.pk).update(views=F('views') + 1)
+        # Учитываем просмотр в буфере счетчика, в БД он будет записан пакетом (cards/view_counter.py)
+        view_counter.hit(object_view.pk)
+        # Показываем количество просмотров с учетом еще не записанных в БД
+        object_view.views += view_counter.pending(object_view.pk)
         return object_view
 
 
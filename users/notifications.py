@@ -0,0 +1,215 @@
+import asyncio
+import atexit
+import logging
+import queue
+import threading
+
+from django.conf import settings
+from telegram.error import BadRequest, NetworkError, RetryAfter
+
+from .telegram_bot import create_bot
+
+logger = logging.getLogger(__name__)
+
+# Очередь уведомлений в Telegram.
+# Сообщения складываются в очередь процесса и отправляются фоновым потоком с собственным event loop
+# и одним клиентом Telegram на все время работы. Сообщения, пришедшие почти одновременно, объединяются
+# в одно. При сетевой ошибке и таймауте отправка повторяется с экспоненциальной задержкой, а сообщение,
+# отклоненное Telegram (BadRequest), не повторяется: объединенное сообщение отправляется заново по частям,
+# чтобы одно неверное сообщение не потеряло остальные. Сообщения отправляются без разметки: текст карточек
+# пользователей не нужно экранировать, и обрезка длинного сообщения не разрывает разметку. Поток запроса сеть не ждет.
+# Клиент создается при первой отправке; если это не удалось (неверный токен, нет сети), попытки повторяются
+# с той же задержкой, а сообщения пакета отбрасываются с записью в лог - поток не завершается, и следующие
+# сообщения отправляются. При остановке процесса очередь дописывается не дольше EXIT_TIMEOUT секунд.
+
+# максимальная длина сообщения Telegram
+MAX_MESSAGE_LENGTH = 4096
+MESSAGE_SEPARATOR = '\n\n'
+# ошибки, после которых отправку имеет смысл повторить (BadRequest - подкласс NetworkError, но не повторяется)
+RETRYABLE_ERRORS = (NetworkError, RetryAfter, OSError, asyncio.TimeoutError)
+# сколько секунд при остановке процесса ждать отправки сообщений из очереди
+EXIT_TIMEOUT = 10
+
+
+class TelegramNotifier:
+    """
+    Класс фоновой отправки уведомлений в чат Telegram
+    """
+
+    def __init__(self, token, chat_id, client_factory=create_bot, batch_window=2.0, max_batch=20,
+                 max_retries=5, backoff=1.0, parse_mode=None):
+        """
+        :param token: токен бота
+        :param chat_id: id чата для уведомлений
+        :param client_factory: функция, создающая клиент с асинхронным методом send_message (по токену)
+        :param batch_window: сколько секунд ждать следующие сообщения, чтобы отправить их одним
+        :param max_batch: максимум сообщений, объединяемых в одно
+        :param max_retries: количество попыток отправки
+        :param backoff: задержка перед первой повторной попыткой (далее удваивается)
+        :param parse_mode: режим разметки сообщений (None - простой текст)
+        """
+        self.token = token
+        self.chat_id = chat_id
+        self.client_factory = client_factory
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.parse_mode = parse_mode
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+
+    @property
+    def enabled(self):
+        return bool(self.token and self.chat_id)
+
+    def notify(self, message):
+        """
+        Метод ставит сообщение в очередь на отправку и сразу возвращает управление
+        :param message: текст сообщения
+        """
+        if not self.enabled:
+            logger.debug('Уведомления Telegram не настроены, сообщение пропущено')
+            return
+        self._queue.put(message)
+        self._ensure_worker()
+
+    def join(self, timeout=None):
+        """
+        Метод ждет, пока все сообщения из очереди будут обработаны (для тестов и остановки)
+        :param timeout: наибольшее время ожидания в секундах (None - без ограничения)
+        :return: True, если очередь обработана
+        """
+        with self._queue.all_tasks_done:
+            return self._queue.all_tasks_done.wait_for(lambda: not self._queue.unfinished_tasks, timeout)
+
+    def flush(self, timeout=EXIT_TIMEOUT):
+        """
+        Метод отправляет сообщения, оставшиеся в очереди (обработчик atexit)
+        """
+        if self._queue.unfinished_tasks:
+            self._ensure_worker()
+            if not self.join(timeout):
+                logger.error(f'Не отправлено уведомлений Telegram при остановке: {self._queue.unfinished_tasks}')
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='telegram-notifier', daemon=True)
+                self._worker.start()
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get(timeout=self.batch_window))
+            except queue.Empty:
+                break
+        return batch
+
+    async def _create_client(self):
+        """
+        Создает и инициализирует клиент, повторяя попытки при ошибках с экспоненциальной задержкой
+        :return: клиент или None, если все попытки не удались
+        """
+        for attempt in range(self.max_retries):
+            try:
+                client = self.client_factory(self.token)
+                if hasattr(client, 'initialize'):
+                    await client.initialize()
+                return client
+            except Exception as e:
+                logger.warning(f'Не удалось подключиться к Telegram (попытка {attempt + 1}): {e}')
+                if attempt + 1 < self.max_retries:
+                    await asyncio.sleep(self.backoff * 2 ** attempt)
+        return None
+
+    def _run(self):
+        loop = asyncio.new_event_loop()
+        client = None
+        try:
+            while True:
+                batch = self._next_batch()
+                try:
+                    if client is None:
+                        client = loop.run_until_complete(self._create_client())
+                    if client is None:
+                        logger.error(f'Клиент Telegram не создан, не отправлено сообщений: {len(batch)}')
+                        continue
+                    for messages in self.coalesce(batch):
+                        loop.run_until_complete(self._deliver(client, messages))
+                except Exception:
+                    logger.exception('Ошибка отправки уведомлений Telegram')
+                finally:
+                    for _ in batch:
+                        self._queue.task_done()
+        finally:
+            loop.close()
+
+    @staticmethod
+    def coalesce(messages):
+        """
+        Группирует сообщения так, чтобы каждую группу можно было отправить одним сообщением допустимой длины
+        :param messages: тексты сообщений
+        :return: список групп сообщений
+        """
+        groups = []
+        length = 0
+        for message in messages:
+            message = message.strip()
+            if len(message) > MAX_MESSAGE_LENGTH:
+                message = message[:MAX_MESSAGE_LENGTH - 1] + '…'
+            if groups and length + len(MESSAGE_SEPARATOR) + len(message) <= MAX_MESSAGE_LENGTH:
+                groups[-1].append(message)
+                length += len(MESSAGE_SEPARATOR) + len(message)
+            else:
+                groups.append([message])
+                length = len(message)
+        return groups
+
+    async def _deliver(self, client, messages):
+        """
+        Отправляет группу сообщений одним сообщением, а если Telegram его отклонил - по одному
+        """
+        try:
+            await self._send(client, MESSAGE_SEPARATOR.join(messages))
+            return
+        except BadRequest as e:
+            if len(messages) == 1:
+                logger.error(f'Сообщение отклонено Telegram: {e}')
+                return
+            logger.warning(f'Объединенное сообщение отклонено Telegram ({e}), сообщения отправляются по одному')
+        except Exception as e:
+            logger.error(f'Сообщение в чат {self.chat_id} не отправлено: {e}')
+            return
+        for message in messages:
+            try:
+                await self._send(client, message)
+            except Exception as e:
+                logger.error(f'Сообщение в чат {self.chat_id} не отправлено: {e}')
+
+    async def _send(self, client, text):
+        """
+        Отправляет сообщение, повторяя попытки при сетевых ошибках и таймаутах
+        :raises BadRequest: сообщение отклонено Telegram (повторять бесполезно)
+        """
+        for attempt in range(self.max_retries):
+            try:
+                await client.send_message(chat_id=self.chat_id, text=text, parse_mode=self.parse_mode)
+                logger.info(f'Сообщение отправлено в чат {self.chat_id}')
+                return
+            except BadRequest:
+                raise
+            except RETRYABLE_ERRORS as e:
+                delay = self.backoff * 2 ** attempt
+                if isinstance(e, RetryAfter):
+                    # Telegram сам сообщает, сколько ждать
+                    delay = max(delay, float(e.retry_after))
+                logger.warning(f'Ошибка отправки сообщения в чат {self.chat_id} (попытка {attempt + 1}): {e}')
+                if attempt + 1 < self.max_retries:
+                    await asyncio.sleep(delay)
+        logger.error(f'Сообщение в чат {self.chat_id} не отправлено после {self.max_retries} попыток')
+
+notifier = TelegramNotifier(settings.TELEGRAM_BOT_TOKEN, settings.YOUR_PERSONAL_CHAT_ID)
+atexit.register(notifier.flush)
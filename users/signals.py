@@ -1,21 +1,20 @@
-from anki.settings import TELEGRAM_BOT_TOKEN, YOUR_PERSONAL_CHAT_ID
+from django.db import transaction
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from cards.models import Card
-from .telegram_bot import send_telegram_message
-import asyncio
-import os
+from .notifications import notifier
 
 
 @receiver(post_save, sender=Card)
-def send_telegram_notification(sender, instance, created, **kwargs):
-    if created:
-        message = f"""
-*Создана новая карточка с id:* {instance.pk}
-*Автор:* {instance.author}
-*Категория:* {instance.category}
-*Вопрос:* {instance.question}
-
-        """
-        asyncio.run(send_telegram_message(TELEGRAM_BOT_TOKEN, YOUR_PERSONAL_CHAT_ID, message))
-
+def send_telegram_notification(sender, instance, created, raw=False, using=None, **kwargs):
+    """
+    Ставит уведомление о новой карточке в очередь после фиксации транзакции.
+    Отправка идет в фоновом потоке, создание карточки не ждет ответа Telegram
+    """
+    if created and not raw:
+        # простой текст без разметки (TelegramNotifier): вопрос и имя автора не нужно экранировать
+        message = (f'Создана новая карточка с id: {instance.pk}\n'
+                   f'Автор: {instance.author}\n'
+                   f'Категория: {instance.category}\n'
+                   f'Вопрос: {instance.question}')
+        transaction.on_commit(lambda: notifier.notify(message), using=using)
@@ -1,17 +1,14 @@
-import os
 import logging
 import telegram
-from dotenv import load_dotenv
-import asyncio
 
 logging.basicConfig(level=logging.DEBUG)
 
 
-async def send_telegram_message(token, chat_id, message, parse_mode="Markdown"):
-    try:
-        bot = telegram.Bot(token=token)
-        await bot.send_message(chat_id=chat_id, text=message, parse_mode=parse_mode)
-        logging.info(f'Сообщение "{message}" отправлено в чат {chat_id}')
-    except Exception as e:
-        logging.error(f'Ошибка отправки сообщения в чат {chat_id}: {e}')
-
+def create_bot(token):
+    """
+    Создает клиент Telegram-бота. Клиент создается один раз и переиспользуется очередью уведомлений
+    (users/notifications.py)
+    :param token: токен бота
+    :return: экземпляр telegram.Bot
+    """
+    return telegram.Bot(token=token)
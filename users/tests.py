@@ -1,3 +1,158 @@
+import asyncio
+from unittest import mock
+
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from telegram.error import BadRequest
+
+from cards.models import Card, Category
+from cards.tests import QueryBudgetMixin, create_cards
+from .notifications import MAX_MESSAGE_LENGTH, TelegramNotifier
+
+
+class FakeTelegramClient:
+    """
+    Локальная замена telegram.Bot: запоминает отправленные сообщения, первые failures попыток завершаются
+    сетевой ошибкой, сообщения с текстом rejected отклоняются (BadRequest)
+    """
+
+    def __init__(self, token, failures=0, rejected=None):
+        self.token = token
+        self.failures = failures
+        self.rejected = rejected
+        self.attempts = 0
+        self.messages = []
+
+    async def send_message(self, chat_id, text, parse_mode=None):
+        self.attempts += 1
+        await asyncio.sleep(0)
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError('Telegram недоступен')
+        if self.rejected and self.rejected in text:
+            raise BadRequest("Can't parse entities")
+        self.messages.append((chat_id, text))
+
+
+class UserCardsQueryBudgetTest(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='author', password='password')
+        create_cards(20, author=cls.user)
+
+    def test_profile_cards(self):
+        self.client.force_login(self.user)
+        # сессия + пользователь + карточки + теги + права пользователя и его групп (perms в шаблоне)
+        response = self.assertQueryBudget('/users/profile_cards/', 6)
+        self.assertEqual(len(response.context['cards']), 20)
+
+
+class TelegramNotifierTest(TestCase):
+    def make_notifier(self, failures=0, rejected=None, **kwargs):
+        self.client_instance = None
+
+        def client_factory(token):
+            self.client_instance = FakeTelegramClient(token, failures=failures, rejected=rejected)
+            return self.client_instance
+
+        options = {'batch_window': 0.05, 'backoff': 0.01, **kwargs}
+        return TelegramNotifier('token', 'chat', client_factory=client_factory, **options)
+
+    def test_card_creation_enqueues_after_commit(self):
+        notifier = self.make_notifier()
+        category = Category.objects.create(name='Python')
+        with mock.patch('users.signals.notifier', notifier), \
+                mock.patch.object(notifier, 'notify', wraps=notifier.notify) as notify:
+            with self.captureOnCommitCallbacks(execute=True):
+                Card.objects.create(question='Что такое GIL?', answer='Блокировка', category=category)
+                Card.objects.create(question='Что такое MRO?', answer='Порядок', category=category)
+                # до фиксации транзакции ничего не ставится в очередь и не отправляется
+                notify.assert_not_called()
+                self.assertIsNone(self.client_instance)
+        # ровно одно уведомление на каждую созданную карточку
+        self.assertEqual(notify.call_count, 2)
+        self.assertIn('Что такое GIL?', notify.call_args_list[0].args[0])
+        self.assertIn('Что такое MRO?', notify.call_args_list[1].args[0])
+        notifier.join()
+        sent = '\n'.join(text for chat_id, text in self.client_instance.messages)
+        self.assertEqual((sent.count('Что такое GIL?'), sent.count('Что такое MRO?')), (1, 1))
+
+    def test_burst_is_coalesced(self):
+        notifier = self.make_notifier(batch_window=0.5)
+        for number in range(5):
+            notifier.notify(f'Карточка {number}')
+        notifier.join()
+        self.assertEqual(len(self.client_instance.messages), 1)
+        self.assertIn('Карточка 4', self.client_instance.messages[0][1])
+
+    def test_retry_with_backoff(self):
+        notifier = self.make_notifier(failures=2)
+        notifier.notify('Карточка')
+        notifier.join()
+        self.assertEqual(self.client_instance.attempts, 3)
+        self.assertEqual(self.client_instance.messages, [('chat', 'Карточка')])
+
+    def test_rejected_message_is_not_retried(self):
+        notifier = self.make_notifier(rejected='_')
+        notifier.notify('Вопрос про snake_case')
+        notifier.join()
+        self.assertEqual(self.client_instance.attempts, 1)
+        self.assertEqual(self.client_instance.messages, [])
+
+    def test_rejected_batch_is_resent_one_by_one(self):
+        notifier = self.make_notifier(rejected='[', batch_window=0.5)
+        for text in ('Карточка 1', 'Карточка [2', 'Карточка 3'):
+            notifier.notify(text)
+        notifier.join()
+        # объединенное сообщение отклонено, остальные сообщения группы доставлены по отдельности
+        self.assertEqual(self.client_instance.messages, [('chat', 'Карточка 1'), ('chat', 'Карточка 3')])
+
+    def test_long_message_is_truncated(self):
+        notifier = self.make_notifier()
+        notifier.notify('а' * (MAX_MESSAGE_LENGTH + 10))
+        notifier.join()
+        self.assertEqual(len(self.client_instance.messages[0][1]), MAX_MESSAGE_LENGTH)
+
+    def test_client_creation_is_retried(self):
+        attempts = []
+
+        def client_factory(token):
+            attempts.append(token)
+            if len(attempts) < 3:
+                raise ConnectionError('Telegram недоступен')
+            self.client_instance = FakeTelegramClient(token)
+            return self.client_instance
+
+        notifier = TelegramNotifier('token', 'chat', client_factory=client_factory, batch_window=0.05, backoff=0.01)
+        notifier.notify('Карточка')
+        self.assertTrue(notifier.join(timeout=5))
+        self.assertEqual(len(attempts), 3)
+        self.assertEqual(self.client_instance.messages, [('chat', 'Карточка')])
+
+    def test_worker_survives_client_failure(self):
+        def client_factory(token):
+            raise ConnectionError('Неверный токен')
+
+        notifier = TelegramNotifier('token', 'chat', client_factory=client_factory, batch_window=0.05,
+                                    backoff=0.01, max_retries=2)
+        notifier.notify('Карточка 1')
+        # сообщения пакета отброшены, очередь не зависает, поток продолжает работать
+        self.assertTrue(notifier.join(timeout=5))
+        self.assertTrue(notifier._worker.is_alive())
+        clients = []
+        notifier.client_factory = lambda token: clients.append(FakeTelegramClient(token)) or clients[-1]
+        notifier.notify('Карточка 2')
+        self.assertTrue(notifier.join(timeout=5))
+        self.assertEqual(clients[0].messages, [('chat', 'Карточка 2')])
+
+    def test_flush_restarts_worker(self):
+        notifier = self.make_notifier()
+        # сообщение в очереди без работающего потока (например, поток остановлен)
+        notifier._queue.put('Карточка')
+        notifier.flush(timeout=5)
+        self.assertEqual(self.client_instance.messages, [('chat', 'Карточка')])
 
-# Create your tests here.
+    def test_disabled_without_token(self):
+        notifier = TelegramNotifier(None, None, client_factory=FakeTelegramClient)
+        notifier.notify('Карточка')
+        self.assertIsNone(notifier._worker)
@@ -19,6 +19,8 @@ urlpatterns = [
     # маршрут с сообщением, что пароль сброшен
     path("profile_cards/", views.UserCardsView.as_view(), name='profile_cards'),
     # маршрут для страницы с карточками пользователя
+    path("profile_favorites/", views.UserFavoritesView.as_view(), name='profile_favorites'),
+    # маршрут для страницы с избранными карточками пользователя
 
 ####### группа маршрутов для Восстановление пароля
     # Маршрут для сброса пароля
@@ -7,12 +7,15 @@ from django.urls import reverse_lazy
 from django.views.generic import TemplateView, CreateView, ListView
 from django.views.generic.edit import UpdateView
 from django.contrib.auth import get_user_model
+from django.db.models import F, Value
+from django.utils.decorators import method_decorator
 
 from cards.views import MenuMixin
 from django.contrib.auth.mixins import LoginRequiredMixin
 from users.forms import LoginUserForm, RegisterUserForm, UserPasswordResetForm, UserPasswordResetConfirmForm
 from .forms import ProfileUserForm, UserPasswordChangeForm
 from cards.models import Card
+from anki.routers import replica_reads
 
 
 class LoginUser(MenuMixin, LoginView):
@@ -118,6 +121,8 @@ class UserPasswordChangeDone(TemplateView):
     extra_context = {'title': 'Пароль изменен успешно'}
 
 
+# карточки пользователя читаются с реплики, свои изменения он видит благодаря окну после записи
+@method_decorator(replica_reads, name='dispatch')
 class UserCardsView(ListView):
     """
     Класс для отображения всех карточек пользователя. Наследуется от ListView.
@@ -133,7 +138,29 @@ class UserCardsView(ListView):
         """
         Метод для получения карточек пользователя с помощью фильтра по автору и сортировки по дате загрузки
         """
-        return Card.objects.filter(author=self.request.user).order_by('-upload_date')
+        return (Card.objects.for_listing().with_favorites(self.request.user).filter(author=self.request.user)
+                .order_by('-upload_date'))
+
+
+@method_decorator(replica_reads, name='dispatch')
+class UserFavoritesView(LoginRequiredMixin, ListView):
+    """
+    Класс для отображения избранных карточек пользователя постранично (последние добавленные - первыми)
+    """
+    template_name = 'users/profile_favorites.html'
+    context_object_name = 'cards'
+    paginate_by = 30
+    extra_context = {'title': 'Избранное',
+                     'active_tab': 'profile_favorites'}
+
+    def get_queryset(self):
+        """
+        Метод для получения избранных карточек: соединение с таблицей избранного по индексу (UserID, CreatedAt)
+        в одном запросе со списком карточек, все карточки списка отмечены как избранные
+        """
+        return (Card.objects.for_listing().filter(favorited_by__user=self.request.user)
+                .annotate(is_favorite=Value(True), favorited_at=F('favorited_by__created_at'))
+                .order_by('-favorited_at', '-pk'))
 
 
 class UserPasswordReset(PasswordResetView):